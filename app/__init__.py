@@ -3,32 +3,79 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_wtf.csrf import CSRFProtect
 from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+from app.utils.passwords import PasswordHasher
+from app.utils.analytics import AvailabilityMatrix
+from app.utils.auditor import AggregateAuditor
+from app.utils.compute import ComputeExecutor
+from app.utils.concurrency import ConcurrencyLimits
+from app.utils.free_now import FreeNowIndex
+from app.utils.metrics import RequestMetrics
+from app.utils.ratelimit import rate_limit_key
+from app.utils.replicas import ReadReplicas, RoutingSession
+from app.utils.retention import RetentionPolicy
+from app.utils.sqlite import configure_sqlite_engine
+from app.utils.write_behind import WriteBehindBuffer
+from app.utils.write_queue import WriteQueue
 from config import config
 import os
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 csrf = CSRFProtect()
 limiter = Limiter(
-    key_func=get_remote_address,
+    key_func=rate_limit_key,
     default_limits=["200 per day", "50 per hour"]
 )
+password_hasher = PasswordHasher()
+request_metrics = RequestMetrics()
+write_queue = WriteQueue()
+write_behind = WriteBehindBuffer()
+read_replicas = ReadReplicas()
+analytics = AvailabilityMatrix()
+free_now = FreeNowIndex()
+compute = ComputeExecutor()
+concurrency = ConcurrencyLimits()
+retention = RetentionPolicy()
+auditor = AggregateAuditor()
 
-def create_app(config_name=None):
-    """Application factory"""
+def create_app(config_name=None, skip_schema_check=False, config_overrides=None):
+    """Application factory
+    
+    skip_schema_check is used by migrate.py, which has to start the app
+    before the schema is up to date. config_overrides is applied on top of
+    the selected configuration (used by tools such as benchmark.py).
+    """
     if config_name is None:
         config_name = os.environ.get('FLASK_ENV', 'development')
     
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    if config_overrides:
+        app.config.update(config_overrides)
     
     # Initialize extensions with app
     db.init_app(app)
+    with app.app_context():
+        configure_sqlite_engine(db.engine, app.config)
+        read_replicas.init_app(app, db.engine)
+    write_queue.init_app(app, db)
+    write_behind.init_app(app, db)
+    retention.init_app(app)
+    auditor.init_app(app)
+    analytics.init_app(app, db)
+    free_now.init_app(app, db)
+    compute.init_app(app, config_name, config_overrides)
     login_manager.init_app(app)
     csrf.init_app(app)
+    # Before the limiter and concurrency classes, so requests they reject are measured too
+    request_metrics.init_app(app)
+    if not app.config.get('RATELIMIT_STORAGE_URI'):
+        # Shared by every worker on this host (see app/utils/ratelimit.py)
+        app.config['RATELIMIT_STORAGE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'ratelimit.db')
     limiter.init_app(app)
+    concurrency.init_app(app)
+    password_hasher.init_app(app)
     
     # Configure login manager
     login_manager.login_view = 'auth.login'
@@ -38,20 +85,23 @@ def create_app(config_name=None):
     from app.models import user, availability, group
     
     # Register blueprints
-    from app.routes import auth, user as user_routes, availability as avail_routes, admin, group
+    from app.routes import auth, user as user_routes, availability as avail_routes, admin, group, jobs
     
     app.register_blueprint(auth.bp)
     app.register_blueprint(user_routes.bp)
     app.register_blueprint(avail_routes.bp)
     app.register_blueprint(admin.bp)
     app.register_blueprint(group.bp)
+    app.register_blueprint(jobs.bp)
     
     # Register main routes
     from app.routes import main
     app.register_blueprint(main.bp)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Compare the schema version (migrate.py applies the actual changes)
+    if not skip_schema_check:
+        from app.utils.migrations import check_schema
+        with app.app_context():
+            check_schema(app)
     
     return app
@@ -1,6 +1,9 @@
+import logging
 from app import db
-from datetime import datetime
-from sqlalchemy import event, Index, select, func
+from datetime import datetime, timedelta
+from sqlalchemy import event, Index, select, func, case, literal, bindparam, and_, or_, true, union_all
+
+logger = logging.getLogger(__name__)
 
 class AvailabilitySlot(db.Model):
     """Availability slot model - 30 minute time slots"""
@@ -55,6 +58,133 @@ class AggregateSlotCount(db.Model):
         return f'<AggregateSlotCount slot={self.slot_index} available={self.available_count} maybe={self.maybe_count}>'
 
 
+class ArchivedWeek(db.Model):
+    """
+    Compressed snapshot of a completed week: every user's packed states and the
+    aggregate counts (format in app/utils/archive.py). Its live rows are deleted.
+    """
+    __tablename__ = 'availability_archive_weeks'
+    
+    week_start = db.Column(db.Integer, primary_key=True)  # Slot index of Monday 00:00 UTC
+    user_count = db.Column(db.Integer, nullable=False, default=0)
+    slot_count = db.Column(db.Integer, nullable=False, default=0)
+    data = db.Column(db.LargeBinary, nullable=False)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<ArchivedWeek {self.week_start} users={self.user_count} slots={self.slot_count}>'
+
+
+class AvailabilityTemplate(db.Model):
+    """
+    A user's recurring week, in effect from start_week until the user's next
+    template row (data NULL ends it). Resolved at read time, see app/utils/recurring.py.
+    """
+    __tablename__ = 'availability_templates'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    start_week = db.Column(db.Integer, primary_key=True)  # Slot index of Monday 00:00 UTC
+    data = db.Column(db.LargeBinary, nullable=True)  # 336 states packed at 2 bits per slot
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AvailabilityTemplate user_id={self.user_id} start_week={self.start_week}>'
+
+
+class AvailabilityWeek(db.Model):
+    """A week whose explicit slots (possibly none) replace the user's template"""
+    __tablename__ = 'availability_weeks'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    week_start = db.Column(db.Integer, primary_key=True)
+    
+    __table_args__ = (
+        Index('idx_availability_weeks_week', 'week_start'),
+    )
+    
+    def __repr__(self):
+        return f'<AvailabilityWeek user_id={self.user_id} week_start={self.week_start}>'
+
+
+class AvailabilityVersion(db.Model):
+    """
+    Version of one user's week, bumped by every save that changes it. The editor
+    saves diffs against the versions it loaded; a missing row is version 0.
+    """
+    __tablename__ = 'availability_versions'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    week_start = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AvailabilityVersion user_id={self.user_id} week_start={self.week_start} version={self.version}>'
+
+
+class PendingSlot(db.Model):
+    """
+    A slot saved through the write-behind buffer but not yet applied to
+    availability_slots (see app/utils/write_behind.py). The latest save wins.
+    """
+    __tablename__ = 'availability_pending'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    slot_index = db.Column(db.Integer, primary_key=True)
+    state = db.Column(db.Integer, nullable=False)
+    saved_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<PendingSlot user_id={self.user_id} slot={self.slot_index} state={self.state}>'
+
+
+class AvailabilityChange(db.Model):
+    """
+    Append-only log of users whose availability changed.
+    Its highest id is the availability version shared by all worker processes;
+    in-memory caches compare it to find which users to reload.
+    """
+    __tablename__ = 'availability_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=True)  # NULL = bulk change, reload everything
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<AvailabilityChange {self.id} user_id={self.user_id}>'
+
+
+# Change log rows older than this are pruned; caches idle for longer reload fully
+CHANGE_LOG_RETENTION = timedelta(days=1)
+CHANGE_LOG_PRUNE_EVERY = 1000
+
+
+def log_availability_change(connection, user_ids=None):
+    """
+    Record that these users' availability changed (None = bulk change).
+    Runs on the caller's connection or session so the entry commits with the change.
+    
+    Returns:
+        int: The new availability version
+    """
+    change_table = AvailabilityChange.__table__
+    now = datetime.utcnow()
+    rows = [{'user_id': user_id, 'changed_at': now} for user_id in (user_ids or [None])]
+    connection.execute(change_table.insert(), rows)
+    version = connection.execute(select(func.max(change_table.c.id))).scalar()
+    
+    if version // CHANGE_LOG_PRUNE_EVERY != (version - len(rows)) // CHANGE_LOG_PRUNE_EVERY:
+        connection.execute(change_table.delete().where(
+            change_table.c.changed_at < now - CHANGE_LOG_RETENTION
+        ))
+    return version
+
+
+def availability_version():
+    """Current availability version (0 when nothing has been logged)"""
+    change_table = AvailabilityChange.__table__
+    return db.session.execute(select(func.max(change_table.c.id))).scalar() or 0
+
+
 def update_aggregate_count(slot_index):
     """Recalculate aggregate counts for a specific slot"""
     available_count = AvailabilitySlot.query.filter_by(slot_index=slot_index, state=2).count()
@@ -74,12 +204,492 @@ def update_aggregate_count(slot_index):
         db.session.add(aggregate)
 
 
+# Largest IN (...) list sent in one statement (SQLite limits bound parameters)
+IN_CHUNK_SIZE = 500
+
+
+def _chunks(items, size=IN_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _recount_aggregates(aggregate_filter, availability_filter):
+    """Replace aggregate rows matching a filter with fresh GROUP BY counts"""
+    availability_table = AvailabilitySlot.__table__
+    aggregate_table = AggregateSlotCount.__table__
+    
+    db.session.execute(aggregate_table.delete().where(aggregate_filter))
+    
+    counts = select(
+        availability_table.c.slot_index,
+        func.sum(case((availability_table.c.state == 2, 1), else_=0)),
+        func.sum(case((availability_table.c.state == 1, 1), else_=0)),
+        literal(datetime.utcnow())
+    ).where(availability_filter).group_by(availability_table.c.slot_index)
+    
+    result = db.session.execute(
+        aggregate_table.insert().from_select(
+            ['slot_index', 'available_count', 'maybe_count', 'updated_at'], counts
+        )
+    )
+    return result.rowcount
+
+
+def _user_groups(user_ids):
+    from app.models.group import GroupMembership
+    membership_table = GroupMembership.__table__
+    return select(membership_table.c.group_id).where(membership_table.c.user_id.in_(list(user_ids)))
+
+
+def recount_group_counts(connection, slot_filter=None, group_ids=None):
+    """
+    Replace group count rows with fresh GROUP BY counts over the members' slots.
+    
+    Args:
+        connection: Session or connection to run on
+        slot_filter: Optional callable mapping a slot_index column to a condition
+        group_ids: Optional groups to recount (a list or a select of ids)
+    
+    Returns:
+        int: Group count rows written
+    """
+    from app.models.group import GroupMembership, GroupSlotCount
+    availability_table = AvailabilitySlot.__table__
+    membership_table = GroupMembership.__table__
+    group_table = GroupSlotCount.__table__
+    
+    group_condition = true() if slot_filter is None else slot_filter(group_table.c.slot_index)
+    count_condition = true() if slot_filter is None else slot_filter(availability_table.c.slot_index)
+    if group_ids is not None:
+        group_condition = group_condition & group_table.c.group_id.in_(group_ids)
+        count_condition = count_condition & membership_table.c.group_id.in_(group_ids)
+    connection.execute(group_table.delete().where(group_condition))
+    
+    counts = select(
+        membership_table.c.group_id,
+        availability_table.c.slot_index,
+        func.sum(case((availability_table.c.state == 2, 1), else_=0)),
+        func.sum(case((availability_table.c.state == 1, 1), else_=0)),
+        literal(datetime.utcnow())
+    ).select_from(
+        availability_table.join(membership_table, membership_table.c.user_id == availability_table.c.user_id)
+    ).where(count_condition).group_by(membership_table.c.group_id, availability_table.c.slot_index)
+    
+    result = connection.execute(
+        group_table.insert().from_select(
+            ['group_id', 'slot_index', 'available_count', 'maybe_count', 'updated_at'], counts
+        )
+    )
+    return result.rowcount
+
+
+def rebuild_aggregate_range(start_slot, end_slot):
+    """
+    Recompute aggregate and group counts for a slot range with set-based statements.
+    Used after bulk loads that bypass the per-row ORM events.
+    
+    Returns:
+        int: Number of slots that have an aggregate row after the rebuild
+    """
+    availability_table = AvailabilitySlot.__table__
+    aggregate_table = AggregateSlotCount.__table__
+    recount_group_counts(db.session, lambda column: (column >= start_slot) & (column <= end_slot))
+    return _recount_aggregates(
+        (aggregate_table.c.slot_index >= start_slot) & (aggregate_table.c.slot_index <= end_slot),
+        (availability_table.c.slot_index >= start_slot) & (availability_table.c.slot_index <= end_slot)
+    )
+
+
+def refresh_aggregate_slots(slot_indices, user_ids=None):
+    """
+    Recompute aggregate and group counts for specific slots with set-based statements.
+    With user_ids only the groups of those users are recounted.
+    """
+    availability_table = AvailabilitySlot.__table__
+    aggregate_table = AggregateSlotCount.__table__
+    group_ids = None if user_ids is None else _user_groups(user_ids)
+    for chunk in _chunks(sorted(set(slot_indices))):
+        _recount_aggregates(
+            aggregate_table.c.slot_index.in_(chunk),
+            availability_table.c.slot_index.in_(chunk)
+        )
+        recount_group_counts(db.session, lambda column: column.in_(chunk), group_ids)
+
+
+def week_versions(user_id, week_starts, for_update=False):
+    """week_start -> version for one user's weeks (0 for weeks never saved)"""
+    version_table = AvailabilityVersion.__table__
+    week_starts = sorted(set(week_starts))
+    versions = dict.fromkeys(week_starts, 0)
+    for chunk in _chunks(week_starts):
+        query = select(version_table.c.week_start, version_table.c.version).where(
+            version_table.c.user_id == user_id,
+            version_table.c.week_start.in_(chunk)
+        )
+        if for_update:
+            query = query.with_for_update()
+        versions.update(db.session.execute(query).all())
+    return versions
+
+
+def _upsert(table):
+    """INSERT ... ON CONFLICT for the session's dialect (SQLite and PostgreSQL share the syntax)"""
+    if db.session.connection().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+def bump_week_versions(user_id, week_starts):
+    """
+    Increment the versions of one user's weeks with a single upsert.
+    Runs inside a write (the caller commits).
+
+    Returns:
+        dict: week_start -> new version
+    """
+    version_table = AvailabilityVersion.__table__
+    week_starts = sorted(set(week_starts))
+    if not week_starts:
+        return {}
+    statement = _upsert(version_table).values(
+        [{'user_id': user_id, 'week_start': week_start, 'version': 1} for week_start in week_starts]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[version_table.c.user_id, version_table.c.week_start],
+        set_={'version': version_table.c.version + 1}
+    ).returning(version_table.c.week_start, version_table.c.version)
+    return dict(db.session.execute(statement).all())
+
+
+def save_user_slots(user_id, slots, bump_versions=True):
+    """
+    Apply one user's slot changes with set-based statements and refresh the
+    affected aggregates once, instead of per-row ORM writes and events.
+    Slots set to 0 (unavailable) are deleted to save space. Slots are compared with
+    the user's template too; weeks that change are materialized first.
+    
+    Args:
+        user_id: Owner of the slots
+        slots: dict of slot_index -> state (0, 1 or 2)
+        bump_versions: Bump the versions of changed weeks (staged saves bumped them already)
+    
+    Returns:
+        dict: slot_index -> (old_state, new_state) for slots that actually changed
+    """
+    from app.utils.slots import week_start_of
+    from app.utils.recurring import template_slots, materialize_weeks
+    availability_table = AvailabilitySlot.__table__
+    slot_indices = sorted(slots)
+    if not slot_indices:
+        return {}
+    
+    existing = {
+        slot_index: state
+        for _, slot_index, state in template_slots(slot_indices[0], slot_indices[-1], {user_id})
+    }
+    for chunk in _chunks(slot_indices):
+        existing.update(db.session.execute(
+            select(availability_table.c.slot_index, availability_table.c.state).where(
+                availability_table.c.user_id == user_id,
+                availability_table.c.slot_index.in_(chunk)
+            )
+        ).all())
+    
+    changes = {}
+    for slot_index in slot_indices:
+        old_state = existing.get(slot_index, 0)
+        if slots[slot_index] != old_state:
+            changes[slot_index] = (old_state, slots[slot_index])
+    if not changes:
+        return changes
+    
+    # Template weeks become rows first, so every non-zero old state has a row
+    materialized = materialize_weeks([user_id], {week_start_of(s) for s in changes})
+    
+    now = datetime.utcnow()
+    deletes = [s for s, (old, new) in changes.items() if new == 0]
+    updates = [{'b_slot': s, 'b_state': new} for s, (old, new) in changes.items() if old != 0 and new != 0]
+    inserts = [{'user_id': user_id, 'slot_index': s, 'state': new, 'updated_at': now}
+               for s, (old, new) in changes.items() if old == 0]
+    
+    for chunk in _chunks(deletes):
+        db.session.execute(availability_table.delete().where(
+            availability_table.c.user_id == user_id,
+            availability_table.c.slot_index.in_(chunk)
+        ))
+    if updates:
+        db.session.execute(
+            availability_table.update().where(
+                availability_table.c.user_id == user_id,
+                availability_table.c.slot_index == bindparam('b_slot')
+            ).values(state=bindparam('b_state'), updated_at=now),
+            updates
+        )
+    if inserts:
+        db.session.execute(availability_table.insert(), inserts)
+    
+    refresh_aggregate_slots(set(changes) | set(materialized), [user_id])
+    if bump_versions:
+        bump_week_versions(user_id, {week_start_of(s) for s in changes})
+    log_availability_change(db.session, [user_id])
+    return changes
+
+
+def save_user_diff(user_id, slots, base_versions):
+    """
+    Apply a diff saved against the week versions the client loaded. Every week it
+    touches must still be at its base version, otherwise nothing is written.
+    
+    Args:
+        user_id: Owner of the slots
+        slots: dict of slot_index -> state
+        base_versions: dict of week_start -> version the client loaded (missing = 0)
+    
+    Returns:
+        tuple: (new versions of the touched weeks, {week_start: current version} of conflicting weeks)
+    """
+    from app.utils.slots import week_start_of
+    weeks = {week_start_of(s) for s in slots}
+    current = week_versions(user_id, weeks, for_update=True)
+    conflicts = {week: version for week, version in current.items() if base_versions.get(week, 0) != version}
+    if conflicts:
+        return {}, conflicts
+    save_user_slots(user_id, slots)
+    return week_versions(user_id, weeks), {}
+
+
+def stage_user_slots(user_id, slots, base_versions=None):
+    """
+    Stage one user's slot changes for the write-behind buffer: one upsert of the
+    staged rows and one of the week versions. Runs inside a write (the caller commits).
+    
+    Args:
+        user_id: Owner of the slots
+        slots: dict of slot_index -> state
+        base_versions: Optional dict of week_start -> version the client loaded (missing = 0),
+                       checked as in save_user_diff()
+    
+    Returns:
+        tuple: (new versions of the touched weeks, {week_start: current version} of conflicting weeks);
+               nothing is staged on a conflict
+    """
+    from app.utils.slots import week_start_of
+    pending_table = PendingSlot.__table__
+    weeks = {week_start_of(s) for s in slots}
+    if base_versions is not None:
+        current = week_versions(user_id, weeks, for_update=True)
+        conflicts = {week: version for week, version in current.items() if base_versions.get(week, 0) != version}
+        if conflicts:
+            return {}, conflicts
+    
+    if slots:
+        now = datetime.utcnow()
+        statement = _upsert(pending_table)
+        db.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[pending_table.c.user_id, pending_table.c.slot_index],
+                set_={'state': statement.excluded.state, 'saved_at': statement.excluded.saved_at}
+            ),
+            [{'user_id': user_id, 'slot_index': s, 'state': state, 'saved_at': now} for s, state in slots.items()]
+        )
+    return bump_week_versions(user_id, weeks), {}
+
+
+def write_pending_slots(user_ids=None):
+    """
+    Apply staged slots (all users, or just user_ids) and remove them from the
+    staging table. Runs inside a write (the caller commits).
+    
+    Returns:
+        dict: user_id -> slot_index -> (old_state, new_state) for slots that actually changed
+    """
+    from app.utils.archive import archived_weeks
+    from app.utils.slots import week_start_of
+    pending_table = PendingSlot.__table__
+    query = select(pending_table.c.user_id, pending_table.c.slot_index, pending_table.c.state)
+    if user_ids is None:
+        rows = db.session.execute(query.with_for_update()).all()
+    else:
+        rows = []
+        for chunk in _chunks(sorted(set(user_ids))):
+            rows.extend(db.session.execute(
+                query.where(pending_table.c.user_id.in_(chunk)).with_for_update()
+            ).all())
+    
+    staged = {}
+    for user_id, slot_index, state in rows:
+        staged.setdefault(user_id, {})[slot_index] = state
+    
+    written = {}
+    for user_id, slots in sorted(staged.items()):
+        frozen = set(archived_weeks(slots))
+        if frozen:
+            # Archived after the save was accepted; archived weeks are read-only
+            logger.warning('Discarding staged slots of user %s in archived weeks %s', user_id, sorted(frozen))
+        written[user_id] = save_user_slots(
+            user_id, {s: state for s, state in slots.items() if week_start_of(s) not in frozen},
+            bump_versions=False
+        )
+        # Only the rows read here: a save staged meanwhile waits for the next write
+        for chunk in _chunks(sorted(slots)):
+            db.session.execute(pending_table.delete().where(
+                pending_table.c.user_id == user_id,
+                pending_table.c.slot_index.in_(chunk)
+            ))
+    return written
+
+
+def _slot_spans(column, spans):
+    return or_(*[and_(column >= start, column <= end) for start, end in spans])
+
+
+def _user_states(user_id, spans):
+    availability_table = AvailabilitySlot.__table__
+    return dict(db.session.execute(
+        select(availability_table.c.slot_index, availability_table.c.state).where(
+            availability_table.c.user_id == user_id,
+            _slot_spans(availability_table.c.slot_index, spans)
+        )
+    ).all())
+
+
+def _shift_counts(table, deltas, **keys):
+    """Add (available, maybe) deltas by slot_index to a counts table's rows matching keys"""
+    key_condition = and_(true(), *[table.c[name] == value for name, value in keys.items()])
+    existing = set()
+    for chunk in _chunks(sorted(deltas)):
+        existing.update(db.session.execute(
+            select(table.c.slot_index).where(key_condition, table.c.slot_index.in_(chunk))
+        ).scalars())
+    
+    now = datetime.utcnow()
+    updates = [{'b_slot': s, 'b_available': a, 'b_maybe': m} for s, (a, m) in deltas.items() if s in existing]
+    inserts = [{**keys, 'slot_index': s, 'available_count': a, 'maybe_count': m, 'updated_at': now}
+               for s, (a, m) in deltas.items() if s not in existing]
+    if updates:
+        db.session.execute(
+            table.update().where(key_condition, table.c.slot_index == bindparam('b_slot')).values(
+                available_count=table.c.available_count + bindparam('b_available'),
+                maybe_count=table.c.maybe_count + bindparam('b_maybe'),
+                updated_at=now
+            ),
+            updates
+        )
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+
+def apply_aggregate_deltas(user_id, old_states, new_states):
+    """
+    Shift aggregate and group counts by one user's state changes (slot_index -> state
+    before and after) instead of recounting every user in those slots.
+    
+    Returns:
+        int: Slots whose counts changed
+    """
+    from app.models.group import GroupSlotCount
+    deltas = {}
+    for slot_index in old_states.keys() | new_states.keys():
+        old_state = old_states.get(slot_index, 0)
+        new_state = new_states.get(slot_index, 0)
+        delta = ((new_state == 2) - (old_state == 2), (new_state == 1) - (old_state == 1))
+        if delta != (0, 0):
+            deltas[slot_index] = delta
+    if not deltas:
+        return 0
+    
+    _shift_counts(AggregateSlotCount.__table__, deltas)
+    for group_id in db.session.execute(_user_groups([user_id])).scalars().all():
+        _shift_counts(GroupSlotCount.__table__, deltas, group_id=group_id)
+    return len(deltas)
+
+
+def copy_user_slots(user_id, source_start, source_end, target_starts, clear=True):
+    """
+    Copy one user's slots from a source range to each target start with a single
+    INSERT ... SELECT, then shift the aggregates by the difference in one pass.
+    Template weeks among the source and target weeks are materialized first.
+    Targets must not overlap the source or each other.
+    
+    Args:
+        user_id: Owner of the slots
+        source_start, source_end: Slot range to copy
+        target_starts: First slot of each copy
+        clear: Empty each target range first; otherwise unavailable source slots
+            leave the target's slots as they are
+    
+    Returns:
+        dict: slots_written and slots_changed counts
+    """
+    from app.utils.slots import WEEK_SLOTS, week_start_of
+    from app.utils.recurring import materialize_weeks
+    availability_table = AvailabilitySlot.__table__
+    length = source_end - source_start + 1
+    targets = [(start, start + length - 1) for start in sorted(target_starts)]
+    
+    # Whole weeks, since materializing a template week writes all of it
+    weeks = sorted({
+        week_start
+        for start, end in [(source_start, source_end)] + targets
+        for week_start in range(week_start_of(start), end + 1, WEEK_SLOTS)
+    })
+    spans = [(week_start, week_start + WEEK_SLOTS - 1) for week_start in weeks]
+    old_states = _user_states(user_id, spans)
+    materialize_weeks([user_id], weeks)
+    
+    source = select(availability_table.c.slot_index).where(
+        availability_table.c.user_id == user_id,
+        availability_table.c.slot_index >= source_start,
+        availability_table.c.slot_index <= source_end
+    )
+    target_conditions = []
+    for start, end in targets:
+        condition = and_(availability_table.c.slot_index >= start, availability_table.c.slot_index <= end)
+        if not clear:
+            condition = and_(condition, (availability_table.c.slot_index - (start - source_start)).in_(source))
+        target_conditions.append(condition)
+    db.session.execute(availability_table.delete().where(
+        availability_table.c.user_id == user_id,
+        or_(*target_conditions)
+    ))
+    
+    offsets = union_all(*[
+        select(literal(start - source_start).label('offset')) for start, _ in targets
+    ]).subquery()
+    copies = select(
+        availability_table.c.user_id,
+        availability_table.c.slot_index + offsets.c.offset,
+        availability_table.c.state,
+        literal(datetime.utcnow())
+    ).select_from(availability_table.join(offsets, true())).where(
+        availability_table.c.user_id == user_id,
+        availability_table.c.slot_index >= source_start,
+        availability_table.c.slot_index <= source_end
+    )
+    written = db.session.execute(availability_table.insert().from_select(
+        ['user_id', 'slot_index', 'state', 'updated_at'], copies
+    )).rowcount
+    
+    changed = apply_aggregate_deltas(user_id, old_states, _user_states(user_id, spans))
+    bump_week_versions(user_id, {
+        week_start
+        for start, end in targets
+        for week_start in range(week_start_of(start), end + 1, WEEK_SLOTS)
+    })
+    log_availability_change(db.session, [user_id])
+    return {'slots_written': written, 'slots_changed': changed}
+
+
 # Event listeners to update aggregate counts
 @event.listens_for(AvailabilitySlot, 'after_insert')
 @event.listens_for(AvailabilitySlot, 'after_update') 
 @event.listens_for(AvailabilitySlot, 'after_delete')
 def receive_after_change(mapper, connection, target):
     """Update aggregate immediately after availability change"""
+    log_availability_change(connection, [target.user_id])
+    
     # Use connection-level queries to count within the same transaction
     availability_table = AvailabilitySlot.__table__
     aggregate_table = AggregateSlotCount.__table__
@@ -129,3 +739,8 @@ def receive_after_change(mapper, connection, target):
                 maybe_count=maybe_count
             )
         )
+    
+    # And the counts of the user's groups
+    recount_group_counts(
+        connection, lambda column: column == target.slot_index, _user_groups([target.user_id])
+    )
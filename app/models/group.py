@@ -96,6 +96,23 @@ class GroupMembership(db.Model):
         }
 
 
+class GroupSlotCount(db.Model):
+    """
+    Per-group heatmap counts over the members' live slots, kept current by the
+    availability write path and by membership changes (see app/models/availability.py)
+    """
+    __tablename__ = 'group_slot_counts'
+    
+    group_id = db.Column(db.Integer, db.ForeignKey('groups.id'), primary_key=True)
+    slot_index = db.Column(db.Integer, primary_key=True)
+    available_count = db.Column(db.Integer, default=0, nullable=False)
+    maybe_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<GroupSlotCount group={self.group_id} slot={self.slot_index} available={self.available_count}>'
+
+
 class GroupInvite(db.Model):
     """Invitation to join a group"""
     __tablename__ = 'group_invites'
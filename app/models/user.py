@@ -1,6 +1,6 @@
-from app import db, login_manager
+from app import db, login_manager, password_hasher
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import validates
 from datetime import datetime
 import json
 
@@ -10,6 +10,8 @@ class User(UserMixin, db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     character_name = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    # Lowercased copy of character_name so case-insensitive lookups can use an index
+    character_name_lower = db.Column(db.String(64), unique=True, nullable=False, index=True)
     wow_class = db.Column(db.String(32), nullable=False)
     roles = db.Column(db.Text, nullable=True)  # JSON array of roles
     password_hash = db.Column(db.String(255), nullable=False)
@@ -21,13 +23,37 @@ class User(UserMixin, db.Model):
     # Relationships
     availability_slots = db.relationship('AvailabilitySlot', backref='user', lazy='dynamic', cascade='all, delete-orphan')
     
+    @staticmethod
+    def normalize_name(character_name):
+        """Normalize a character name for case-insensitive comparison"""
+        return character_name.strip().lower()
+    
+    @classmethod
+    def find_by_character_name(cls, character_name):
+        """Case-insensitive lookup by character name using the indexed lowercase column"""
+        return cls.query.filter_by(character_name_lower=cls.normalize_name(character_name)).first()
+    
+    @validates('character_name')
+    def validate_character_name(self, key, character_name):
+        """Keep character_name_lower in sync whenever the name is written"""
+        self.character_name_lower = self.normalize_name(character_name) if character_name else character_name
+        return character_name
+    
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password (may raise PasswordHasherBusy)"""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check password against hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check password against hash (may raise PasswordHasherBusy)"""
+        return password_hasher.verify(self.password_hash, password)
+    
+    def rehash_password_if_needed(self, password):
+        """Re-hash a verified password if the configured hash parameters changed.
+        Returns True if password_hash was updated and needs committing."""
+        if not password_hasher.needs_rehash(self.password_hash):
+            return False
+        self.set_password(password)
+        return True
     
     def get_roles(self):
         """Get roles as a list"""
@@ -1,14 +1,38 @@
-from flask import Blueprint, render_template, jsonify, send_file
+from flask import Blueprint, render_template, jsonify, request, current_app, Response
 from flask_login import login_required, current_user
 from functools import wraps
-from app import db
+from app import db, request_metrics, read_replicas, compute, write_queue, concurrency, password_hasher, retention, auditor
 from app.models.user import User
-from app.models.availability import AvailabilitySlot, AggregateSlotCount
-import csv
+from app.routes.auth import busy_response
+from app.models.availability import AvailabilitySlot, AggregateSlotCount, ArchivedWeek, rebuild_aggregate_range
+from app.models.group import GroupSlotCount
+from app.utils.archive import archived_slots
+from app.utils.auditor import audit_range, live_slot_range
+from app.utils.compute import ComputeBusy, report_progress
+from app.utils.encoding import MAX_DENSE_SLOTS, run_length_encode
+from app.utils.export import EXPORT_BATCH_SIZE, STATE_NAMES, csv_response, slot_to_iso
+from app.utils.importer import parse_import, load_import
+from app.utils.passwords import PasswordHasherBusy
+from app.utils.recurring import template_slots
+from app.utils.retention import purge_slots, optimize_database
+from sqlalchemy import func, select
+from heapq import merge
+from itertools import groupby
+import hmac
 import io
+import json
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
+# Seconds a full aggregate rebuild may run in a compute worker
+REBUILD_TIME_BUDGET = 600
+
+# Seconds a chunked purge (plus VACUUM) may run in a compute worker
+PURGE_TIME_BUDGET = 3600
+
+# Seconds an aggregate audit may run in a compute worker
+AUDIT_TIME_BUDGET = 600
+
 def admin_required(f):
     """Decorator to require admin or superuser access"""
     @wraps(f)
@@ -21,13 +45,51 @@ def admin_required(f):
     return decorated_function
 
 
+def metrics_access_required(f):
+    """Decorator allowing admins, or scrapers presenting METRICS_TOKEN as a bearer token"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = current_app.config.get('METRICS_TOKEN')
+        # Constant-time, and on bytes since headers may carry non-ASCII text
+        presented = request.headers.get('Authorization', '').encode()
+        if token and hmac.compare_digest(presented, f'Bearer {token}'.encode()):
+            return f(*args, **kwargs)
+        return admin_required(f)(*args, **kwargs)
+    return decorated_function
+
+
 @bp.route('/')
 @login_required
 @admin_required
 def index():
     """Admin dashboard"""
     users = User.query.order_by(User.created_at).all()
-    return render_template('admin/index.html', users=users)
+    metrics = request_metrics.snapshot()
+    # Endpoints issuing the most queries per request first, to surface N+1 patterns
+    endpoint_metrics = sorted(
+        metrics['endpoints'].items(),
+        key=lambda item: item[1]['avg_queries'],
+        reverse=True
+    )
+    return render_template('admin/index.html', users=users, metrics=metrics,
+                           endpoint_metrics=endpoint_metrics)
+
+
+@bp.route('/metrics', methods=['GET'])
+@metrics_access_required
+def metrics_prometheus():
+    """Request metrics in Prometheus text format"""
+    return Response(request_metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/api/metrics', methods=['GET'])
+@metrics_access_required
+def metrics_json():
+    """Request metrics, read replica health and concurrency classes as JSON"""
+    metrics = request_metrics.snapshot()
+    metrics['replicas'] = read_replicas.status()
+    metrics['concurrency'] = concurrency.status()
+    return jsonify(metrics), 200
 
 
 @bp.route('/api/users', methods=['GET'])
@@ -87,62 +149,285 @@ def demote_user(user_id):
 @admin_required
 def purge_schedule():
     """Purge all scheduling data (availability and aggregates) while preserving users"""
+    if not current_user.is_superuser:
+        return jsonify({'error': 'Only superusers can purge scheduling data'}), 403
+    return _start_purge(None, None)
+
+
+@bp.route('/api/purge', methods=['POST'])
+@login_required
+@admin_required
+def purge_range():
+    """Purge scheduling data before a slot ({before_slot}) or in a range ({start_slot, end_slot})"""
     if not current_user.is_superuser:
         return jsonify({'error': 'Only superusers can purge scheduling data'}), 403
     
+    data = request.get_json(silent=True) or {}
     try:
-        # Delete all availability slots
-        availability_count = AvailabilitySlot.query.count()
-        AvailabilitySlot.query.delete()
-        
-        # Delete all aggregate counts
-        aggregate_count = AggregateSlotCount.query.count()
+        if data.get('before_slot') is not None:
+            start_slot, end_slot = None, int(data['before_slot']) - 1
+        else:
+            start_slot, end_slot = int(data['start_slot']), int(data['end_slot'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Provide before_slot, or start_slot and end_slot'}), 400
+    if start_slot is not None and end_slot < start_slot:
+        return jsonify({'error': 'end_slot must not be before start_slot'}), 400
+    
+    return _start_purge(start_slot, end_slot)
+
+
+def _start_purge(start_slot, end_slot):
+    try:
+        job = compute.run('purge_slots', start_slot, end_slot, owner_id=current_user.id, budget=PURGE_TIME_BUDGET)
+    except ComputeBusy:
+        return compute.busy_response()
+    return compute.response(job)
+
+
+@compute.job('purge_slots')
+def purge_slots_job(start_slot, end_slot):
+    """Delete a slot range in chunks, reporting progress, then analyze/vacuum"""
+    result = purge_slots(start_slot, end_slot, progress=report_progress)
+    result.update(optimize_database(current_app.config.get('RETENTION_VACUUM', True)))
+    return {
+        'success': True,
+        'message': f"Purged {result['availability_deleted']} availability slots "
+                   f"and {result['aggregates_deleted']} aggregate counts",
+        **result
+    }
+
+
+@bp.route('/api/retention', methods=['GET'])
+@login_required
+@admin_required
+def retention_status():
+    """Retention policy settings, its last run, the oldest live slot and the archive size"""
+    oldest_slot = db.session.query(func.min(AvailabilitySlot.slot_index)).scalar()
+    archived_weeks, archive_bytes = db.session.query(
+        func.count(ArchivedWeek.week_start), func.sum(func.length(ArchivedWeek.data))
+    ).one()
+    return jsonify({
+        **retention.status(),
+        'oldest_slot': oldest_slot,
+        'archived_weeks': archived_weeks,
+        'archive_bytes': archive_bytes or 0
+    }), 200
+
+
+@bp.route('/api/rebuild-aggregates', methods=['POST'])
+@login_required
+@admin_required
+def rebuild_aggregates():
+    """Recount every aggregate from the availability slots (runs in a compute worker)"""
+    try:
+        job = compute.run('rebuild_aggregates', owner_id=current_user.id, budget=REBUILD_TIME_BUDGET)
+    except ComputeBusy:
+        return compute.busy_response()
+    return compute.response(job)
+
+
+@compute.job('rebuild_aggregates')
+def rebuild_aggregates_job():
+    """Rebuild aggregates over the whole slot range with set-based statements"""
+    first_slot, last_slot = db.session.query(
+        func.min(AvailabilitySlot.slot_index), func.max(AvailabilitySlot.slot_index)
+    ).one()
+    db.session.rollback()
+    
+    def rebuild():
         AggregateSlotCount.query.delete()
-        
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': f'Purged {availability_count} availability slots and {aggregate_count} aggregate counts',
-            'availability_deleted': availability_count,
-            'aggregates_deleted': aggregate_count
-        }), 200
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Failed to purge data: {str(e)}'}), 500
+        GroupSlotCount.query.delete()
+        if first_slot is None:
+            return 0
+        return rebuild_aggregate_range(first_slot, last_slot)
+    
+    aggregates = write_queue.run(rebuild)
+    return {'success': True, 'message': f'Rebuilt {aggregates} aggregate counts', 'aggregates': aggregates}
+
+
+@bp.route('/api/audit', methods=['GET'])
+@login_required
+@admin_required
+def audit_status():
+    """Audit schedule, cursor and the drift found by the last scheduled run on this host"""
+    return jsonify(auditor.status()), 200
+
+
+@bp.route('/api/audit', methods=['POST'])
+@login_required
+@admin_required
+def audit_aggregates():
+    """Compare aggregates with the live slots ({start_slot, end_slot}, default all) and repair drift (runs as a job)"""
+    data = request.get_json(silent=True) or {}
+    try:
+        start_slot = int(data['start_slot']) if data.get('start_slot') is not None else None
+        end_slot = int(data['end_slot']) if data.get('end_slot') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'start_slot and end_slot must be slot indices'}), 400
+    repair = bool(data.get('repair', True))
+    try:
+        job = compute.run('audit_aggregates', start_slot, end_slot, repair,
+                          owner_id=current_user.id, budget=AUDIT_TIME_BUDGET)
+    except ComputeBusy:
+        return compute.busy_response()
+    return compute.response(job)
+
+
+@compute.job('audit_aggregates')
+def audit_aggregates_job(start_slot, end_slot, repair):
+    """Audit a slot range (None = the first or last live slot), reporting progress"""
+    first_slot, last_slot = live_slot_range()
+    db.session.rollback()
+    if first_slot is None:
+        return {'success': True, 'message': 'Nothing to audit', 'slots_checked': 0}
+    result = audit_range(
+        first_slot if start_slot is None else start_slot,
+        last_slot if end_slot is None else end_slot,
+        repair=repair,
+        progress=report_progress
+    )
+    mismatches = result['aggregate_mismatches'] + result['group_mismatches']
+    return {
+        'success': True,
+        'message': f"Checked {result['slots_checked']} slots, found {mismatches} mismatched counts"
+                   + (f", repaired {result['repaired_slots']} slots" if repair and mismatches else ''),
+        **result
+    }
+
+
+@bp.route('/api/import', methods=['POST'])
+@login_required
+@admin_required
+@concurrency.limit('heavy')
+def import_availability():
+    """Import users and availability spans from a CSV or JSON-lines upload (see app/utils/importer.py)"""
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    file_format = request.form.get('format') or (
+        'jsonl' if upload.filename.lower().endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+    )
+    if file_format not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    
+    lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    try:
+        plan = parse_import(lines, file_format, current_app.config['WOW_CLASSES'], current_app.config['ROLES'])
+    except UnicodeDecodeError:
+        return jsonify({'error': 'The file must be UTF-8 text'}), 400
+    if plan.errors:
+        return jsonify({'error': 'The file has errors; nothing was imported', 'errors': plan.errors}), 400
+    
+    if request.form.get('dry_run') == '1':
+        return jsonify({'success': True, 'dry_run': True, **plan.summary()}), 200
+    
+    password = request.form.get('password')
+    try:
+        password_hash = password_hasher.hash(password) if password else None
+    except PasswordHasherBusy:
+        return busy_response()
+    
+    try:
+        result = write_queue.run(load_import, plan, password_hash)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'message': f"Imported {result['slots']} slots for {result['users_updated']} users "
+                   f"({result['users_created']} new)",
+        **result
+    }), 200
 
 
 @bp.route('/api/export/roster', methods=['GET'])
 @login_required
 @admin_required
+@concurrency.limit('heavy')
 def export_roster():
-    """Export roster as CSV"""
-    users = User.query.order_by(User.character_name).all()
-    
-    # Create CSV in memory
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow(['Character Name', 'Class', 'Roles', 'Timezone', 'Admin', 'Created At'])
-    
-    # Write data
-    for user in users:
-        roles = ', '.join(user.get_roles()) if user.get_roles() else ''
-        writer.writerow([
-            user.character_name,
-            user.wow_class,
-            roles,
-            user.timezone or '',
-            'Yes' if (user.is_admin or user.is_superuser) else 'No',
-            user.created_at.strftime('%Y-%m-%d %H:%M:%S') if user.created_at else ''
-        ])
-    
-    # Prepare response
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='roster.csv'
+    """Export roster as CSV, streamed (gzip=1 compresses it)"""
+    users_table = User.__table__
+    query = select(
+        users_table.c.character_name, users_table.c.wow_class, users_table.c.roles,
+        users_table.c.timezone, users_table.c.is_admin, users_table.c.is_superuser,
+        users_table.c.created_at
+    ).order_by(users_table.c.character_name).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    
+    def rows():
+        for name, wow_class, roles, timezone, is_admin, is_superuser, created_at in db.session.execute(query):
+            yield [
+                name,
+                wow_class,
+                ', '.join(_parse_roles(roles)),
+                timezone or '',
+                'Yes' if (is_admin or is_superuser) else 'No',
+                created_at.strftime('%Y-%m-%d %H:%M:%S') if created_at else ''
+            ]
+    
+    return csv_response(
+        ['Character Name', 'Class', 'Roles', 'Timezone', 'Admin', 'Created At'],
+        rows(), 'roster', compress=request.args.get('gzip') == '1'
     )
+
+
+@bp.route('/api/export/availability', methods=['GET'])
+@login_required
+@admin_required
+@concurrency.limit('heavy')
+def export_availability():
+    """
+    Export availability in a slot range as one CSV row per run of equal state, streamed.
+    Archived weeks and weekly templates are included, as in the timeline.
+    """
+    start_slot = request.args.get('start_slot', type=int)
+    end_slot = request.args.get('end_slot', type=int)
+    
+    if start_slot is None or end_slot is None or end_slot < start_slot:
+        return jsonify({'error': 'start_slot and end_slot are required'}), 400
+    if end_slot - start_slot + 1 > MAX_DENSE_SLOTS:
+        return jsonify({'error': f'Range too large (max {MAX_DENSE_SLOTS} slots)'}), 400
+    
+    slots_table = AvailabilitySlot.__table__
+    users_table = User.__table__
+    query = select(slots_table.c.user_id, slots_table.c.slot_index, slots_table.c.state).where(
+        slots_table.c.slot_index >= start_slot,
+        slots_table.c.slot_index <= end_slot
+    ).order_by(slots_table.c.user_id, slots_table.c.slot_index).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    
+    def rows():
+        users = {
+            user_id: (name, wow_class)
+            for user_id, name, wow_class in db.session.execute(
+                select(users_table.c.id, users_table.c.character_name, users_table.c.wow_class)
+            )
+        }
+        # Archived and template weeks have no live rows, so the ordered streams simply interleave
+        result = merge(
+            db.session.execute(query),
+            merge(archived_slots(start_slot, end_slot), template_slots(start_slot, end_slot)),
+            key=lambda row: (row[0], row[1])
+        )
+        for user_id, user_rows in groupby(result, key=lambda row: row[0]):
+            if user_id not in users:
+                continue
+            name, wow_class = users[user_id]
+            points = ((slot_index, state) for _, slot_index, state in user_rows)
+            for run_start, length, state in run_length_encode(points, start_slot, end_slot):
+                yield [
+                    name, wow_class, slot_to_iso(run_start), slot_to_iso(run_start + length),
+                    run_start, length, STATE_NAMES[state]
+                ]
+    
+    return csv_response(
+        ['Character Name', 'Class', 'Start (UTC)', 'End (UTC)', 'Start Slot', 'Slots', 'State'],
+        rows(), f'availability_{start_slot}_{end_slot}', compress=request.args.get('gzip') == '1'
+    )
+
+
+def _parse_roles(roles):
+    """Roles from the JSON column (as in User.get_roles)"""
+    try:
+        return json.loads(roles) if roles else []
+    except ValueError:
+        return []
@@ -1,12 +1,24 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from app import db, limiter
 from app.models.user import User
+from app.utils.passwords import PasswordHasherBusy
 import bleach
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
+BUSY_MESSAGE = 'The server is busy, please try again in a moment.'
+BUSY_RETRY_AFTER = '5'
+
+
+def busy_response():
+    """JSON response for when the password hashing pool is saturated"""
+    response = jsonify({'error': BUSY_MESSAGE})
+    response.headers['Retry-After'] = BUSY_RETRY_AFTER
+    return response, 503
+
+
 @bp.route('/signup', methods=['GET', 'POST'])
 @limiter.limit("5 per hour")
 def signup():
@@ -25,7 +37,7 @@ def signup():
             flash('All fields are required.', 'danger')
             return render_template('auth/signup.html')
         
-        if User.query.filter(func.lower(User.character_name) == func.lower(character_name)).first():
+        if User.find_by_character_name(character_name):
             flash('Character name already exists.', 'danger')
             return render_template('auth/signup.html')
         
@@ -34,7 +46,11 @@ def signup():
             character_name=character_name,
             wow_class=wow_class
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            flash(BUSY_MESSAGE, 'warning')
+            return render_template('auth/signup.html'), 503
         user.set_roles(roles)
         
         # First user becomes superuser
@@ -43,7 +59,13 @@ def signup():
             user.is_admin = True
         
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Lost a race with a concurrent signup for the same name
+            db.session.rollback()
+            flash('Character name already exists.', 'danger')
+            return render_template('auth/signup.html')
         
         login_user(user)
         flash(f'Welcome, {character_name}!', 'success')
@@ -66,9 +88,17 @@ def login():
             flash('Both fields are required.', 'danger')
             return render_template('auth/login.html')
         
-        user = User.query.filter(func.lower(User.character_name) == func.lower(character_name)).first()
+        user = User.find_by_character_name(character_name)
+        
+        try:
+            authenticated = user is not None and user.check_password(password)
+            if authenticated and user.rehash_password_if_needed(password):
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash(BUSY_MESSAGE, 'warning')
+            return render_template('auth/login.html'), 503
         
-        if user and user.check_password(password):
+        if authenticated:
             login_user(user, remember=True)
             next_page = request.args.get('next')
             return redirect(next_page if next_page else url_for('main.index'))
@@ -104,7 +134,7 @@ def api_signup():
     if not character_name or not wow_class or not password:
         return jsonify({'error': 'All fields are required'}), 400
     
-    if User.query.filter(func.lower(User.character_name) == func.lower(character_name)).first():
+    if User.find_by_character_name(character_name):
         return jsonify({'error': 'Character name already exists'}), 400
     
     # Create user
@@ -113,7 +143,10 @@ def api_signup():
         wow_class=wow_class,
         timezone=timezone
     )
-    user.set_password(password)
+    try:
+        user.set_password(password)
+    except PasswordHasherBusy:
+        return busy_response()
     user.set_roles(roles)
     
     # First user becomes superuser
@@ -122,7 +155,12 @@ def api_signup():
         user.is_admin = True
     
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent signup for the same name
+        db.session.rollback()
+        return jsonify({'error': 'Character name already exists'}), 400
     
     login_user(user)
     
@@ -143,9 +181,16 @@ def api_login():
     if not character_name or not password:
         return jsonify({'error': 'Both fields are required'}), 400
     
-    user = User.query.filter(func.lower(User.character_name) == func.lower(character_name)).first()
+    user = User.find_by_character_name(character_name)
+    
+    try:
+        authenticated = user is not None and user.check_password(password)
+        if authenticated and user.rehash_password_if_needed(password):
+            db.session.commit()
+    except PasswordHasherBusy:
+        return busy_response()
     
-    if user and user.check_password(password):
+    if authenticated:
         login_user(user, remember=True)
         return jsonify({
             'success': True,
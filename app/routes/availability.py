@@ -1,9 +1,24 @@
 from flask import Blueprint, request, jsonify, render_template
 from flask_login import login_required, current_user
-from app import db, limiter
-from app.models.availability import AvailabilitySlot, AggregateSlotCount
+from app import db, limiter, write_queue, write_behind, analytics, compute, concurrency, free_now
+from app.models.availability import (
+    AvailabilitySlot, AggregateSlotCount, IN_CHUNK_SIZE, save_user_slots, save_user_diff, copy_user_slots,
+    week_versions
+)
 from app.models.user import User
-from sqlalchemy import and_, or_
+from app.utils.archive import archived_slots, archived_counts, archived_weeks
+from app.utils.compute import ComputeBusy
+from app.utils.recurring import template_slots, template_counts, add_counts, get_template, set_template
+from app.utils.slots import WEEK_SLOTS, FIRST_MONDAY_SLOT, current_slot, current_week_start_slot, week_start_of
+from app.utils.ratelimit import slot_write_limit, slot_write_cost, range_read_limit, range_read_cost
+from app.utils.encoding import (
+    MAX_RESOLUTION, MAX_DENSE_SLOTS, DENSE_ENCODINGS,
+    run_length_encode, dense_counts, delta_varint_encode
+)
+from sqlalchemy import and_, or_, select, func, case
+from sqlalchemy.exc import IntegrityError
+from itertools import groupby, chain
+from heapq import merge
 import json
 
 bp = Blueprint('availability', __name__)
@@ -31,6 +46,7 @@ def heatmap():
 
 @bp.route('/api/availability', methods=['GET'])
 @login_required
+@concurrency.limit('heavy')
 def get_availability():
     """Get availability data with filters"""
     start_slot = request.args.get('start_slot', type=int)
@@ -59,8 +75,10 @@ def get_availability():
         )
     
     # Filter by user
+    user_filter = None
     if user_id:
         query = query.filter(AvailabilitySlot.user_id == user_id)
+        user_filter = {user_id}
     else:
         # Get users with filters
         user_query = User.query
@@ -75,6 +93,14 @@ def get_availability():
         user_ids = [u.id for u in user_query.all()]
         if user_ids:
             query = query.filter(AvailabilitySlot.user_id.in_(user_ids))
+            user_filter = set(user_ids)
+    
+    # One user's week versions, read before the slots: a save landing in between
+    # makes the client's next diff save conflict instead of overwriting it
+    versions = None
+    if user_id and start_slot is not None and end_slot is not None:
+        weeks = range(week_start_of(start_slot), end_slot + 1, WEEK_SLOTS)
+        versions = {str(week): version for week, version in week_versions(user_id, weeks).items()}
     
     # Filter by confidence level
     if confidence == 'available':
@@ -82,34 +108,143 @@ def get_availability():
     elif confidence == 'available_maybe':
         query = query.filter(AvailabilitySlot.state.in_([1, 2]))
     
-    # Get slots
-    slots = query.all()
+    # Get slots, plus any in archived weeks or coming from weekly templates
+    slots = [slot.to_dict() for slot in query.all()]
+    resolved = chain(
+        archived_slots(start_slot, end_slot, user_filter),
+        template_slots(start_slot, end_slot, user_filter)
+    )
+    for resolved_user_id, slot_index, state in resolved:
+        if confidence != 'available' or state == 2:
+            slots.append({
+                'id': None,
+                'user_id': resolved_user_id,
+                'slot_index': slot_index,
+                'state': state,
+                'updated_at': None
+            })
     
     # Get users
     if user_id:
         users = [User.query.get(user_id)]
     else:
-        user_ids = list(set(slot.user_id for slot in slots))
+        user_ids = list(set(slot['user_id'] for slot in slots))
         users = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
     
-    return jsonify({
-        'slots': [slot.to_dict() for slot in slots],
+    result = {
+        'slots': slots,
         'users': [user.to_dict() for user in users]
+    }
+    if versions is not None:
+        result['versions'] = versions
+    return jsonify(result), 200
+
+
+@bp.route('/api/availability/timeline', methods=['GET'])
+@login_required
+@limiter.shared_limit(range_read_limit, scope='range-reads', cost=range_read_cost)
+@concurrency.limit('heavy')
+def get_timeline():
+    """Get each user's availability in a range as run-length spans [start_slot, length, state]"""
+    start_slot = request.args.get('start_slot', type=int)
+    end_slot = request.args.get('end_slot', type=int)
+    resolution = request.args.get('resolution', 1, type=int)
+    wow_class = request.args.get('class')
+    role = request.args.get('role')
+    confidence = request.args.get('confidence', 'all')  # 'all', 'available', 'available_maybe'
+    
+    if start_slot is None or end_slot is None:
+        return jsonify({'error': 'start_slot and end_slot are required'}), 400
+    
+    if not 1 <= resolution <= MAX_RESOLUTION:
+        return jsonify({'error': f'resolution must be between 1 and {MAX_RESOLUTION} slots'}), 400
+    
+    # Plain rows in (user_id, slot_index) order, matching idx_user_slot; no ORM objects
+    slots_table = AvailabilitySlot.__table__
+    query = select(slots_table.c.user_id, slots_table.c.slot_index, slots_table.c.state).where(
+        slots_table.c.slot_index >= start_slot,
+        slots_table.c.slot_index <= end_slot
+    )
+    
+    if wow_class or role:
+        query = query.join(User.__table__, User.__table__.c.id == slots_table.c.user_id)
+        if wow_class:
+            query = query.where(User.__table__.c.wow_class == wow_class)
+        if role:
+            # Filter by role in JSON array
+            query = query.where(User.__table__.c.roles.like(f'%{role}%'))
+    
+    # Filter by confidence level
+    if confidence == 'available':
+        query = query.where(slots_table.c.state == 2)
+    elif confidence == 'available_maybe':
+        query = query.where(slots_table.c.state.in_([1, 2]))
+    
+    rows = db.session.execute(query.order_by(slots_table.c.user_id, slots_table.c.slot_index))
+    
+    # Archived and template weeks have no live rows, so the ordered streams simply interleave
+    user_filter = None
+    if wow_class or role:
+        user_query = User.query.with_entities(User.id)
+        if wow_class:
+            user_query = user_query.filter(User.wow_class == wow_class)
+        if role:
+            user_query = user_query.filter(User.roles.like(f'%{role}%'))
+        user_filter = {user_id for (user_id,) in user_query.all()}
+    resolved = [
+        row for row in merge(
+            archived_slots(start_slot, end_slot, user_filter),
+            template_slots(start_slot, end_slot, user_filter)
+        )
+        if confidence != 'available' or row[2] == 2
+    ]
+    if resolved:
+        rows = merge(rows, resolved, key=lambda row: (row[0], row[1]))
+    
+    runs = {}
+    for user_id, user_rows in groupby(rows, key=lambda row: row[0]):
+        user_runs = run_length_encode(
+            ((slot_index, state) for _, slot_index, state in user_rows),
+            start_slot, end_slot, resolution
+        )
+        if user_runs:
+            runs[user_id] = user_runs
+    
+    users = User.query.filter(User.id.in_(list(runs))).all() if runs else []
+    
+    return jsonify({
+        'start_slot': start_slot,
+        'end_slot': end_slot,
+        'resolution': resolution,
+        'users': [user.to_dict() for user in users],
+        'runs': {str(user_id): user_runs for user_id, user_runs in runs.items()}
     }), 200
 
 
 @bp.route('/api/availability/bulk', methods=['POST'])
+@write_behind.buffered
 @login_required
-@limiter.limit("100 per hour")
+@limiter.limit(slot_write_limit, cost=slot_write_cost)
 def bulk_update_availability():
-    """Bulk update availability slots"""
-    data = request.get_json()
+    """Bulk update availability slots
+    
+    With "versions" ({week_start: version} as loaded from /api/availability) only the
+    changed slots need to be sent: they are applied if every week they touch is
+    still at that version, otherwise 409 returns the current slots of the
+    conflicting weeks and nothing is written.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
     slots = data.get('slots', [])
     
     if not slots:
         return jsonify({'error': 'No slots provided'}), 400
+    if not isinstance(slots, list) or not all(isinstance(slot_data, dict) for slot_data in slots):
+        return jsonify({'error': 'slots must be a list of objects'}), 400
     
-    # Process each slot
+    # Validate slots; later entries for the same slot win
+    changes = {}
     for slot_data in slots:
         slot_index = slot_data.get('slot_index')
         state = slot_data.get('state')
@@ -121,40 +256,221 @@ def bulk_update_availability():
         if state not in [0, 1, 2]:
             continue
         
-        # Check if slot exists
-        existing_slot = AvailabilitySlot.query.filter_by(
-            user_id=current_user.id,
-            slot_index=slot_index
-        ).first()
-        
-        if existing_slot:
-            # Update or delete
-            if state == 0:
-                # Remove unavailable slots to save space
-                db.session.delete(existing_slot)
+        try:
+            changes[int(slot_index)] = state
+        except (TypeError, ValueError):
+            return jsonify({'error': 'slot_index must be an integer'}), 400
+    
+    frozen = archived_weeks(changes)
+    if frozen:
+        return jsonify({'error': 'Archived weeks are read-only', 'archived_weeks': frozen}), 409
+    
+    if data.get('versions') is not None:
+        try:
+            base_versions = {int(week): int(version) for week, version in data['versions'].items()}
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': 'versions must map week starts to integers'}), 400
+        try:
+            if write_behind.enabled:
+                versions, conflicts = write_behind.save(current_user.id, changes, base_versions)
             else:
-                existing_slot.state = state
-        else:
-            # Create new slot only if not unavailable
-            if state != 0:
-                new_slot = AvailabilitySlot(
-                    user_id=current_user.id,
-                    slot_index=slot_index,
-                    state=state
-                )
-                db.session.add(new_slot)
+                versions, conflicts = write_queue.run(save_user_diff, current_user.id, changes, base_versions)
+        except IntegrityError:
+            # Another save created the same week's version first
+            versions, conflicts = {}, {week_start_of(s): None for s in changes}
+        if conflicts:
+            # Current versions first, then the slots they cover
+            write_behind.flush_user(current_user.id)
+            conflicts = week_versions(current_user.id, conflicts)
+            return jsonify({
+                'error': 'Your availability changed since it was loaded',
+                'conflicts': [
+                    {
+                        'week_start': week_start,
+                        'version': version,
+                        'slots': [
+                            {'slot_index': slot_index, 'state': state}
+                            for slot_index, state in sorted(
+                                _resolved_states(current_user.id, week_start, week_start + WEEK_SLOTS - 1).items()
+                            )
+                        ]
+                    }
+                    for week_start, version in sorted(conflicts.items())
+                ]
+            }), 409
+        return jsonify({'success': True, 'versions': {str(week): version for week, version in versions.items()}}), 200
     
-    db.session.commit()
+    # Staged and coalesced with the user's next saves, or queued and batched with
+    # other writers on SQLite, or inline
+    if write_behind.enabled:
+        write_behind.save(current_user.id, changes)
+    else:
+        write_queue.run(save_user_slots, current_user.id, changes)
     
     return jsonify({'success': True}), 200
 
 
+# Longest source range and most copies for /api/availability/copy
+MAX_COPY_SLOTS = 4 * WEEK_SLOTS
+MAX_COPY_REPEAT = 52
+
+
+@bp.route('/api/availability/copy', methods=['POST'])
+@login_required
+@limiter.limit(slot_write_limit)
+def copy_availability():
+    """Copy the current user's slots from one range to others
+    
+    Body: {"source_start": a, "source_end": b, "target_start": c, "repeat": N, "clear": true}
+    copies slots a..b to c, then N - 1 more times, each a whole number of weeks
+    after the last (one week for sources up to a week long). With clear (the
+    default) each target becomes an exact copy; otherwise unavailable source
+    slots leave the target's slots alone.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        source_start = int(data['source_start'])
+        source_end = int(data['source_end'])
+        target_start = int(data['target_start'])
+        repeat = int(data.get('repeat', 1))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'source_start, source_end and target_start must be integers'}), 400
+    clear = data.get('clear', True)
+    if not isinstance(clear, bool):
+        return jsonify({'error': 'clear must be true or false'}), 400
+    
+    length = source_end - source_start + 1
+    if not 0 < length <= MAX_COPY_SLOTS:
+        return jsonify({'error': f'Source range must be between 1 and {MAX_COPY_SLOTS} slots'}), 400
+    if not 1 <= repeat <= MAX_COPY_REPEAT:
+        return jsonify({'error': f'repeat must be between 1 and {MAX_COPY_REPEAT}'}), 400
+    
+    stride = -(-length // WEEK_SLOTS) * WEEK_SLOTS
+    target_starts = [target_start + i * stride for i in range(repeat)]
+    if any(start <= source_end and start + length - 1 >= source_start for start in target_starts):
+        return jsonify({'error': 'Targets must not overlap the source range'}), 400
+    
+    # Only live rows are copied, and archived weeks can't be written
+    frozen = archived_weeks(chain.from_iterable(
+        chain(range(start, start + length, WEEK_SLOTS), [start + length - 1])
+        for start in [source_start] + target_starts
+    ))
+    if frozen:
+        return jsonify({'error': 'Archived weeks are read-only', 'archived_weeks': frozen}), 409
+    
+    result = write_queue.run(copy_user_slots, current_user.id, source_start, source_end, target_starts, clear)
+    return jsonify({'success': True, 'target_starts': target_starts, **result}), 200
+
+
+@bp.route('/api/availability/template', methods=['GET'])
+@login_required
+def get_availability_template():
+    """The current user's weekly template in effect this week (states from Monday 00:00 UTC), or null"""
+    template = get_template(current_user.id, current_week_start_slot())
+    if template is None:
+        return jsonify({'template': None}), 200
+    start_week, states = template
+    return jsonify({'template': {'start_week': start_week, 'states': list(states)}}), 200
+
+
+@bp.route('/api/availability/template', methods=['PUT'])
+@login_required
+@limiter.limit(slot_write_limit)
+def put_availability_template():
+    """Repeat a week every week from the current week on
+    
+    Body: {"start_slot": N} uses the user's saved availability in the 336 slots from N
+    (any alignment, e.g. local midnight), or {"states": [...]} gives 336 states from
+    Monday 00:00 UTC.
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('start_slot') is not None:
+        try:
+            start_slot = int(data['start_slot'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'start_slot must be an integer'}), 400
+        week = _resolved_states(current_user.id, start_slot, start_slot + WEEK_SLOTS - 1)
+        # Any 336 consecutive slots cover each offset of the week exactly once
+        states = [0] * WEEK_SLOTS
+        for slot_index in range(start_slot, start_slot + WEEK_SLOTS):
+            states[(slot_index - FIRST_MONDAY_SLOT) % WEEK_SLOTS] = week.get(slot_index, 0)
+    else:
+        states = data.get('states')
+        if not isinstance(states, list) or len(states) != WEEK_SLOTS or any(s not in (0, 1, 2) for s in states):
+            return jsonify({'error': f'states must be a list of {WEEK_SLOTS} values (0, 1 or 2)'}), 400
+    
+    start_week = current_week_start_slot()
+    write_queue.run(set_template, current_user.id, states, start_week)
+    return jsonify({'success': True, 'start_week': start_week}), 200
+
+
+@bp.route('/api/availability/template', methods=['DELETE'])
+@login_required
+def delete_availability_template():
+    """Stop repeating the weekly template from the current week on"""
+    write_queue.run(set_template, current_user.id, None, current_week_start_slot())
+    return jsonify({'success': True}), 200
+
+
+def _resolved_states(user_id, start_slot, end_slot):
+    """slot_index -> state for one user's live, archived and template slots in a range"""
+    slots_table = AvailabilitySlot.__table__
+    states = dict(db.session.execute(
+        select(slots_table.c.slot_index, slots_table.c.state).where(
+            slots_table.c.user_id == user_id,
+            slots_table.c.slot_index >= start_slot,
+            slots_table.c.slot_index <= end_slot
+        )
+    ).all())
+    for _, slot_index, state in chain(archived_slots(start_slot, end_slot, {user_id}),
+                                      template_slots(start_slot, end_slot, {user_id})):
+        states[slot_index] = state
+    return states
+
+
+@bp.route('/api/availability/free-now', methods=['GET'])
+@login_required
+def get_free_now():
+    """Who is free from start_slot (default: now) for the next `slots` slots, from the in-memory index"""
+    start_slot = request.args.get('start_slot', current_slot(), type=int)
+    slots = request.args.get('slots', 1, type=int)
+    end_slot = start_slot + slots - 1
+    
+    if slots < 1 or not free_now.covers(start_slot, end_slot):
+        return jsonify({'error': f'Range must lie within the next {free_now.hours} hours'}), 400
+    
+    available, maybe = free_now.free(start_slot, end_slot, request.args.get('class'), request.args.get('role'))
+    return jsonify({
+        'start_slot': start_slot,
+        'end_slot': end_slot,
+        'available': available,
+        'maybe': maybe
+    }), 200
+
+
 @bp.route('/api/availability/aggregate', methods=['GET'])
 @login_required
+@limiter.shared_limit(range_read_limit, scope='range-reads', cost=range_read_cost)
+@concurrency.limit('heavy')
 def get_aggregate():
-    """Get aggregate counts for heatmap"""
+    """Get aggregate counts for heatmap
+    
+    format=dense returns zero-filled available/maybe arrays for the whole range
+    (one entry per slot from start_slot), packed with encoding=delta-varint if asked.
+    class and role count only matching users instead of reading the stored aggregates.
+    """
     start_slot = request.args.get('start_slot', type=int)
     end_slot = request.args.get('end_slot', type=int)
+    dense = request.args.get('format') == 'dense'
+    encoding = request.args.get('encoding', 'plain')
+    wow_class = request.args.get('class')
+    role = request.args.get('role')
+    
+    if wow_class or role:
+        return _filtered_aggregate(start_slot, end_slot, wow_class, role, dense, encoding)
+    
+    if dense:
+        return _dense_aggregate(start_slot, end_slot, encoding)
     
     query = AggregateSlotCount.query
     
@@ -166,10 +482,121 @@ def get_aggregate():
             )
         )
     
-    aggregates = query.all()
+    aggregates = {agg.slot_index: agg.to_dict() for agg in query.all()}
+    # Archived weeks have no aggregate rows; template counts add to the stored ones
+    for slot_index, available, maybe in chain(archived_counts(start_slot, end_slot),
+                                              template_counts(start_slot, end_slot)):
+        aggregate = aggregates.setdefault(slot_index, {
+            'slot_index': slot_index, 'available_count': 0, 'maybe_count': 0, 'updated_at': None
+        })
+        aggregate['available_count'] += available
+        aggregate['maybe_count'] += maybe
+    
+    return jsonify({
+        'aggregates': list(aggregates.values())
+    }), 200
+
+
+def _check_dense_range(start_slot, end_slot, encoding):
+    """Error response for an unusable dense request, or None"""
+    if start_slot is None or end_slot is None:
+        return jsonify({'error': 'start_slot and end_slot are required'}), 400
+    
+    if not 0 <= end_slot - start_slot < MAX_DENSE_SLOTS:
+        return jsonify({'error': f'Range must be between 1 and {MAX_DENSE_SLOTS} slots'}), 400
+    
+    if encoding not in DENSE_ENCODINGS:
+        return jsonify({'error': f"encoding must be one of: {', '.join(DENSE_ENCODINGS)}"}), 400
+    
+    return None
+
+
+def _dense_response(start_slot, end_slot, available, maybe, encoding):
+    if encoding == 'delta-varint':
+        available = delta_varint_encode(available)
+        maybe = delta_varint_encode(maybe)
+    
+    return jsonify({
+        'start_slot': start_slot,
+        'end_slot': end_slot,
+        'encoding': encoding,
+        'available': available,
+        'maybe': maybe
+    }), 200
+
+
+def _dense_aggregate(start_slot, end_slot, encoding):
+    """Aggregate counts as fixed-stride arrays, without per-row dicts"""
+    error = _check_dense_range(start_slot, end_slot, encoding)
+    if error:
+        return error
+    
+    aggregate_table = AggregateSlotCount.__table__
+    rows = db.session.execute(
+        select(
+            aggregate_table.c.slot_index,
+            aggregate_table.c.available_count,
+            aggregate_table.c.maybe_count
+        ).where(
+            aggregate_table.c.slot_index >= start_slot,
+            aggregate_table.c.slot_index <= end_slot
+        )
+    )
+    rows = add_counts(rows, archived_counts(start_slot, end_slot), template_counts(start_slot, end_slot))
+    available, maybe = dense_counts(rows, start_slot, end_slot)
+    return _dense_response(start_slot, end_slot, available, maybe, encoding)
+
+
+def _filtered_aggregate(start_slot, end_slot, wow_class, role, dense, encoding):
+    """Heatmap counts over users matching a class and/or role filter"""
+    error = _check_dense_range(start_slot, end_slot, encoding)
+    if error:
+        return error
+    
+    user_query = User.query.with_entities(User.id)
+    if wow_class:
+        user_query = user_query.filter(User.wow_class == wow_class)
+    if role:
+        # Filter by role in JSON array
+        user_query = user_query.filter(User.roles.like(f'%{role}%'))
+    
+    if analytics.covers(start_slot, end_slot):
+        user_ids = [user_id for (user_id,) in user_query.all()]
+        available, maybe = analytics.counts(start_slot, end_slot, user_ids)
+    else:
+        slots_table = AvailabilitySlot.__table__
+        rows = db.session.execute(
+            select(
+                slots_table.c.slot_index,
+                func.sum(case((slots_table.c.state == 2, 1), else_=0)),
+                func.sum(case((slots_table.c.state == 1, 1), else_=0))
+            ).where(
+                slots_table.c.slot_index >= start_slot,
+                slots_table.c.slot_index <= end_slot,
+                slots_table.c.user_id.in_(user_query.subquery().select())
+            ).group_by(slots_table.c.slot_index)
+        )
+        user_ids = {user_id for (user_id,) in user_query.all()}
+        rows = add_counts(
+            rows,
+            archived_counts(start_slot, end_slot, user_ids),
+            template_counts(start_slot, end_slot, user_ids)
+        )
+        available, maybe = dense_counts(rows, start_slot, end_slot)
+    
+    if dense:
+        return _dense_response(start_slot, end_slot, available, maybe, encoding)
     
     return jsonify({
-        'aggregates': [agg.to_dict() for agg in aggregates]
+        'aggregates': [
+            {
+                'slot_index': start_slot + offset,
+                'available_count': available[offset],
+                'maybe_count': maybe[offset],
+                'updated_at': None
+            }
+            for offset in range(len(available)) if available[offset] or maybe[offset]
+        ]
     }), 200
 
 
@@ -182,6 +609,8 @@ def find_matches():
 
 @bp.route('/api/availability/find-matches')
 @login_required
+@limiter.shared_limit(range_read_limit, scope='range-reads', cost=range_read_cost)
+@concurrency.limit('heavy')
 def api_find_matches():
     """Find users with overlapping availability with current user"""
     start_slot = request.args.get('start_slot', type=int)
@@ -190,74 +619,91 @@ def api_find_matches():
     if not start_slot or not end_slot:
         return jsonify({'error': 'start_slot and end_slot are required'}), 400
     
-    # Get current user's available slots (state=2)
-    my_slots = AvailabilitySlot.query.filter(
-        AvailabilitySlot.user_id == current_user.id,
-        AvailabilitySlot.state == 2,
-        AvailabilitySlot.slot_index >= start_slot,
-        AvailabilitySlot.slot_index <= end_slot
-    ).all()
+    if analytics.covers(start_slot, end_slot):
+        return _find_matches_from_matrix(start_slot, end_slot)
     
-    my_slot_indices = [s.slot_index for s in my_slots]
+    # Overlap scans over a big roster run in a compute worker
+    try:
+        job = compute.run('find_matches', current_user.id, start_slot, end_slot, owner_id=current_user.id)
+    except ComputeBusy:
+        return compute.busy_response()
+    return compute.response(job)
+
+
+@compute.job('find_matches')
+def find_matches_job(user_id, start_slot, end_slot):
+    """Find users with overlapping availability with a user (SQL version)"""
+    me = db.session.get(User, user_id)
+    slots_table = AvailabilitySlot.__table__
+    
+    # Get the user's available slots (state=2), archived and template weeks included
+    my_slots_dict = {
+        slot_index: state for slot_index, state in _resolved_states(me.id, start_slot, end_slot).items()
+        if state == 2
+    }
+    my_slot_indices = sorted(my_slots_dict)
     
     if not my_slot_indices:
-        return jsonify({'matches': [], 'message': 'No availability set'}), 200
+        return {'matches': [], 'message': 'No availability set'}
     
     # Find other users with availability in the same slots
-    from sqlalchemy import func
-    overlaps = db.session.query(
-        AvailabilitySlot.user_id,
-        func.count(AvailabilitySlot.slot_index).label('overlap_count')
-    ).filter(
-        AvailabilitySlot.slot_index.in_(my_slot_indices),
-        AvailabilitySlot.state == 2,
-        AvailabilitySlot.user_id != current_user.id
-    ).group_by(AvailabilitySlot.user_id).order_by(
-        func.count(AvailabilitySlot.slot_index).desc()
-    ).all()
-    
-    # Get user details and calculate percentages
+    overlap_counts = {}
+    for i in range(0, len(my_slot_indices), IN_CHUNK_SIZE):
+        for match_id, overlap_count in db.session.execute(
+            select(slots_table.c.user_id, func.count(slots_table.c.slot_index)).where(
+                slots_table.c.slot_index.in_(my_slot_indices[i:i + IN_CHUNK_SIZE]),
+                slots_table.c.state == 2,
+                slots_table.c.user_id != me.id
+            ).group_by(slots_table.c.user_id)
+        ):
+            overlap_counts[match_id] = overlap_counts.get(match_id, 0) + overlap_count
+    # Archived and template weeks have no live rows, so their overlaps simply add up
+    resolved = list(merge(archived_slots(start_slot, end_slot), template_slots(start_slot, end_slot)))
+    for match_id, slot_index, state in resolved:
+        if state == 2 and match_id != me.id and slot_index in my_slots_dict:
+            overlap_counts[match_id] = overlap_counts.get(match_id, 0) + 1
+    overlaps = sorted(overlap_counts.items(), key=lambda item: (-item[1], item[0]))
+    
+    # Get user details and all slots in range (not just available) of every match at once
+    match_ids = [match_id for match_id, _ in overlaps]
+    users = {}
+    slots_data = {match_id: {} for match_id in match_ids}
+    for i in range(0, len(match_ids), IN_CHUNK_SIZE):
+        chunk = match_ids[i:i + IN_CHUNK_SIZE]
+        users.update((user.id, user) for user in User.query.filter(User.id.in_(chunk)).all())
+        for match_id, slot_index, state in db.session.execute(
+            select(slots_table.c.user_id, slots_table.c.slot_index, slots_table.c.state).where(
+                slots_table.c.user_id.in_(chunk),
+                slots_table.c.slot_index >= start_slot,
+                slots_table.c.slot_index <= end_slot
+            )
+        ):
+            slots_data[match_id][slot_index] = state
+    for match_id, slot_index, state in resolved:
+        if match_id in slots_data:
+            slots_data[match_id][slot_index] = state
+    
+    # Calculate percentages
     matches = []
     total_my_slots = len(my_slot_indices)
-    slots_data = {}
-    
-    # Include current user in the data
-    current_user_data = {
-        'user_id': current_user.id,
-        'character_name': current_user.character_name,
-        'wow_class': current_user.wow_class,
-        'roles': current_user.get_roles(),
+    
+    # Include the user in the data
+    my_data = {
+        'user_id': me.id,
+        'character_name': me.character_name,
+        'wow_class': me.wow_class,
+        'roles': me.get_roles(),
         'overlap_count': total_my_slots,
         'overlap_percent': 100.0,
         'total_slots': total_my_slots
     }
+    slots_data[me.id] = my_slots_dict
     
-    # Get current user's slot data
-    my_slots_dict = {}
-    for slot in my_slots:
-        my_slots_dict[slot.slot_index] = slot.state
-    slots_data[current_user.id] = my_slots_dict
-    
-    for user_id, overlap_count in overlaps:
-        user = User.query.get(user_id)
+    for match_id, overlap_count in overlaps:
+        user = users.get(match_id)
         if user:
-            # Get user's all slots in range (not just available)
-            user_slots = AvailabilitySlot.query.filter(
-                AvailabilitySlot.user_id == user_id,
-                AvailabilitySlot.slot_index >= start_slot,
-                AvailabilitySlot.slot_index <= end_slot
-            ).all()
-            
-            # Build slot dictionary for this user
-            user_slots_dict = {}
-            user_total_slots = 0
-            for slot in user_slots:
-                user_slots_dict[slot.slot_index] = slot.state
-                if slot.state == 2:
-                    user_total_slots += 1
-            
-            slots_data[user_id] = user_slots_dict
-            
+            user_slots_dict = slots_data[match_id]
+            user_total_slots = sum(1 for state in user_slots_dict.values() if state == 2)
             overlap_percent = (overlap_count / total_my_slots) * 100 if total_my_slots > 0 else 0
             
             matches.append({
@@ -269,13 +715,61 @@ def api_find_matches():
                 'overlap_percent': round(overlap_percent, 1),
                 'total_slots': user_total_slots
             })
+        else:
+            del slots_data[match_id]
+    
+    return {
+        'matches': matches,
+        'my_slot_count': total_my_slots,
+        'current_user': my_data,
+        'slots_data': slots_data,
+        'start_slot': start_slot,
+        'end_slot': end_slot
+    }
+
+
+def _find_matches_from_matrix(start_slot, end_slot):
+    """find-matches answered from the in-memory analytics matrix"""
+    total_my_slots, overlaps = analytics.overlaps(current_user.id, start_slot, end_slot)
+    
+    if not total_my_slots:
+        return jsonify({'matches': [], 'message': 'No availability set'}), 200
+    
+    match_ids = [user_id for user_id, _, _ in overlaps]
+    users = {user.id: user for user in User.query.filter(User.id.in_(match_ids)).all()} if match_ids else {}
+    slots_data = analytics.user_states([current_user.id] + match_ids, start_slot, end_slot)
+    # Only the current user's available slots, as in the SQL path
+    slots_data[current_user.id] = {
+        slot_index: state for slot_index, state in slots_data[current_user.id].items() if state == 2
+    }
+    
+    matches = []
+    for user_id, overlap_count, user_total_slots in overlaps:
+        user = users.get(user_id)
+        if user:
+            matches.append({
+                'user_id': user.id,
+                'character_name': user.character_name,
+                'wow_class': user.wow_class,
+                'roles': user.get_roles(),
+                'overlap_count': overlap_count,
+                'overlap_percent': round((overlap_count / total_my_slots) * 100, 1),
+                'total_slots': user_total_slots
+            })
     
     return jsonify({
         'matches': matches,
         'my_slot_count': total_my_slots,
-        'current_user': current_user_data,
+        'current_user': {
+            'user_id': current_user.id,
+            'character_name': current_user.character_name,
+            'wow_class': current_user.wow_class,
+            'roles': current_user.get_roles(),
+            'overlap_count': total_my_slots,
+            'overlap_percent': 100.0,
+            'total_slots': total_my_slots
+        },
         'slots_data': slots_data,
         'start_slot': start_slot,
         'end_slot': end_slot
     }), 200
-
@@ -5,13 +5,19 @@ Handles group creation, invitations, membership management, and visualization.
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from functools import wraps
-from app import db, limiter
-from app.models.group import Group, GroupMembership, GroupInvite
+from app import db, limiter, analytics, concurrency
+from app.models.group import Group, GroupMembership, GroupInvite, GroupSlotCount
 from app.models.user import User
-from app.models.availability import AvailabilitySlot, AggregateSlotCount
+from app.models.availability import AvailabilitySlot, recount_group_counts
+from app.utils.archive import archived_counts, archived_slots
 from app.utils.group_names import generate_unique_group_name
+from app.utils.encoding import MAX_DENSE_SLOTS
+from app.utils.ratelimit import range_read_limit, range_read_cost
+from app.utils.recurring import template_counts, template_slots, add_counts
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from itertools import chain
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('group', __name__)
 
@@ -109,7 +115,9 @@ def invitations():
     
     # Get pending invites created within last 3 days
     cutoff = datetime.utcnow() - timedelta(days=3)
-    pending_invites = GroupInvite.query.filter(
+    pending_invites = GroupInvite.query.options(
+        joinedload(GroupInvite.group), joinedload(GroupInvite.inviter)
+    ).filter(
         GroupInvite.invitee_id == current_user.id,
         GroupInvite.status == 'pending',
         GroupInvite.created_at >= cutoff
@@ -143,6 +151,8 @@ def create_group():
             user_id=current_user.id
         )
         db.session.add(membership)
+        db.session.flush()
+        recount_group_counts(db.session, group_ids=[group.id])
         db.session.commit()
         
         return jsonify({
@@ -244,6 +254,8 @@ def accept_invite(group_id, invite_id):
         user_id=current_user.id
     )
     db.session.add(membership)
+    db.session.flush()
+    recount_group_counts(db.session, group_ids=[group_id])
     db.session.commit()
     
     return jsonify({
@@ -303,6 +315,8 @@ def leave_group(group_id):
     
     # Remove membership
     db.session.delete(membership)
+    db.session.flush()
+    recount_group_counts(db.session, group_ids=[group_id])
     db.session.commit()
     
     return jsonify({
@@ -331,6 +345,7 @@ def disband_group(group_id):
     group_name = group.name
     
     # Delete group (cascades to memberships and invites)
+    GroupSlotCount.query.filter_by(group_id=group_id).delete()
     db.session.delete(group)
     db.session.commit()
     
@@ -342,8 +357,13 @@ def disband_group(group_id):
 
 @bp.route('/api/groups/<int:group_id>/schedule-data')
 @login_required
+@concurrency.limit('heavy')
 def get_group_schedule_data(group_id):
-    """Get availability data for all group members"""
+    """
+    Get availability data for all group members: per slot, each member's state
+    (user_states) and the available/maybe counts. user_states=0 returns only the
+    counts, which come from group_slot_counts without reading any member's slots.
+    """
     group = Group.query.get_or_404(group_id)
     
     # Check if user is a member
@@ -357,41 +377,136 @@ def get_group_schedule_data(group_id):
     if not start_slot or not end_slot:
         return jsonify({'error': 'start_slot and end_slot are required'}), 400
     
-    # Get member IDs
     member_ids = [m.user_id for m in group.memberships.all()]
     
-    if not member_ids:
-        return jsonify({'slots': []}), 200
-    
-    # Query availability for all members
-    slots = AvailabilitySlot.query.filter(
-        AvailabilitySlot.user_id.in_(member_ids),
-        AvailabilitySlot.slot_index >= start_slot,
-        AvailabilitySlot.slot_index <= end_slot
-    ).all()
+    counts = {
+        slot_index: (available, maybe)
+        for slot_index, available, maybe in _group_counts(group_id, member_ids, start_slot, end_slot)
+        if available or maybe
+    }
+    if request.args.get('user_states') == '0':
+        user_states = {}
+    else:
+        user_states = _member_states(member_ids, start_slot, end_slot)
     
-    # Group by slot_index and user
-    result = {}
-    for slot in slots:
-        slot_idx = slot.slot_index
-        if slot_idx not in result:
-            result[slot_idx] = {}
-        result[slot_idx][slot.user_id] = slot.state
-    
-    # Convert to list format with member count
     slots_list = []
-    for slot_idx, user_states in result.items():
-        available_count = sum(1 for state in user_states.values() if state == 2)
-        slots_list.append({
-            'slot_index': slot_idx,
-            'user_states': user_states,
-            'available_count': available_count,
+    for slot_index in sorted(counts.keys() | user_states.keys()):
+        available, maybe = counts.get(slot_index, (0, 0))
+        slot = {
+            'slot_index': slot_index,
+            'available_count': available,
+            'maybe_count': maybe,
             'total_members': len(member_ids)
-        })
+        }
+        if slot_index in user_states:
+            slot['user_states'] = user_states[slot_index]
+        slots_list.append(slot)
     
     return jsonify({'slots': slots_list}), 200
 
 
+def _member_states(member_ids, start_slot, end_slot):
+    """slot_index -> {user_id: state} for the members' live, archived and template slots in a range"""
+    if not member_ids:
+        return {}
+    slots_table = AvailabilitySlot.__table__
+    live = db.session.execute(
+        select(slots_table.c.user_id, slots_table.c.slot_index, slots_table.c.state).where(
+            slots_table.c.user_id.in_(member_ids),
+            slots_table.c.slot_index >= start_slot,
+            slots_table.c.slot_index <= end_slot
+        )
+    )
+    members = set(member_ids)
+    states = {}
+    for user_id, slot_index, state in chain(live, archived_slots(start_slot, end_slot, members),
+                                            template_slots(start_slot, end_slot, members)):
+        states.setdefault(slot_index, {})[user_id] = state
+    return states
+
+
+def _group_counts(group_id, member_ids, start_slot, end_slot):
+    """
+    (slot_index, available, maybe) rows for a group in slot order: one indexed range
+    read of group_slot_counts plus the members' archived and template counts
+    """
+    group_table = GroupSlotCount.__table__
+    rows = db.session.execute(
+        select(group_table.c.slot_index, group_table.c.available_count, group_table.c.maybe_count).where(
+            group_table.c.group_id == group_id,
+            group_table.c.slot_index >= start_slot,
+            group_table.c.slot_index <= end_slot
+        )
+    )
+    members = set(member_ids)
+    return add_counts(
+        rows,
+        archived_counts(start_slot, end_slot, members),
+        template_counts(start_slot, end_slot, members)
+    )
+
+
+@bp.route('/api/groups/<int:group_id>/windows')
+@login_required
+@limiter.shared_limit(range_read_limit, scope='range-reads', cost=range_read_cost)
+@concurrency.limit('heavy')
+def get_group_windows(group_id):
+    """Find time windows where enough group members are available"""
+    group = Group.query.get_or_404(group_id)
+    
+    # Check if user is a member
+    if not group.is_member(current_user.id):
+        return jsonify({'error': 'You are not a member of this group'}), 403
+    
+    start_slot = request.args.get('start_slot', type=int)
+    end_slot = request.args.get('end_slot', type=int)
+    min_length = request.args.get('min_length', 1, type=int)  # in slots
+    
+    if not start_slot or not end_slot:
+        return jsonify({'error': 'start_slot and end_slot are required'}), 400
+    
+    if end_slot - start_slot >= MAX_DENSE_SLOTS:
+        return jsonify({'error': f'Range must be at most {MAX_DENSE_SLOTS} slots'}), 400
+    
+    member_ids = [m.user_id for m in group.memberships.all()]
+    # Default: every member available
+    min_available = request.args.get('min_available', len(member_ids), type=int)
+    
+    if analytics.covers(start_slot, end_slot):
+        windows = analytics.windows(member_ids, start_slot, end_slot, min_available, min_length)
+        return jsonify(_windows_result(windows, min_available, member_ids)), 200
+    
+    counts = {
+        slot_index: available
+        for slot_index, available, _ in _group_counts(group_id, member_ids, start_slot, end_slot)
+    }
+    windows = _find_windows(counts, start_slot, end_slot, min_available, min_length)
+    return jsonify(_windows_result(windows, min_available, member_ids)), 200
+
+
+def _windows_result(windows, min_available, member_ids):
+    return {
+        'windows': [{'start_slot': start, 'length': length} for start, length in windows],
+        'min_available': min_available,
+        'total_members': len(member_ids)
+    }
+
+
+def _find_windows(counts, start_slot, end_slot, min_available, min_length):
+    """[start_slot, length] runs of slots with at least min_available members available"""
+    windows = []
+    run_start = None
+    for slot_index in range(start_slot, end_slot + 2):
+        if slot_index <= end_slot and counts.get(slot_index, 0) >= min_available:
+            if run_start is None:
+                run_start = slot_index
+        elif run_start is not None:
+            if slot_index - run_start >= min_length:
+                windows.append([run_start, slot_index - run_start])
+            run_start = None
+    return windows
+
+
 @bp.route('/api/invitations/pending')
 @login_required
 def get_pending_invitations():
@@ -399,9 +514,11 @@ def get_pending_invitations():
     # Expire old invites
     expire_old_invites()
     
-    # Get pending invites within last 3 days
+    # Get pending invites within last 3 days, with the names to_dict() shows
     cutoff = datetime.utcnow() - timedelta(days=3)
-    invites = GroupInvite.query.filter(
+    invites = GroupInvite.query.options(
+        joinedload(GroupInvite.group), joinedload(GroupInvite.inviter), joinedload(GroupInvite.invitee)
+    ).filter(
         GroupInvite.invitee_id == current_user.id,
         GroupInvite.status == 'pending',
         GroupInvite.created_at >= cutoff
@@ -0,0 +1,50 @@
+"""
+Job status routes for long-running computations (see app/utils/compute.py).
+"""
+from flask import Blueprint, jsonify
+from flask_login import login_required, current_user
+from app import compute
+
+bp = Blueprint('jobs', __name__)
+
+
+def _visible_job(job_id):
+    """The job if it exists and belongs to the current user (admins see every job)"""
+    job = compute.get(job_id)
+    if job is None:
+        return None
+    if job['owner_id'] != current_user.id and not current_user.is_admin:
+        return None
+    return job
+
+
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """Poll a job; includes the result once it is done"""
+    job = _visible_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({
+        'id': job['id'],
+        'name': job['name'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'progress': job.get('progress'),
+        'result': job['result'],
+        'error': job['error']
+    }), 200
+
+
+@bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+@login_required
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = _visible_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    compute.cancel(job_id)
+    return jsonify({'success': True, 'status': job['status']}), 200
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, render_template, redirect, url_fo
 from flask_login import login_required, current_user
 from app import db
 from app.models.user import User
+from app.utils.passwords import PasswordHasherBusy
 import bleach
 
 bp = Blueprint('user', __name__)
@@ -34,7 +35,12 @@ def update_profile_form():
     
     # Update password if provided
     if password:
-        current_user.set_password(password)
+        try:
+            current_user.set_password(password)
+        except PasswordHasherBusy:
+            db.session.rollback()
+            flash('The server is busy, please try again in a moment.', 'warning')
+            return redirect(url_for('user.profile'))
     
     db.session.commit()
     
@@ -67,7 +73,13 @@ def update_profile():
     
     # Update password if provided
     if 'password' in data and data['password']:
-        current_user.set_password(data['password'])
+        try:
+            current_user.set_password(data['password'])
+        except PasswordHasherBusy:
+            db.session.rollback()
+            response = jsonify({'error': 'The server is busy, please try again in a moment.'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
     
     db.session.commit()
     
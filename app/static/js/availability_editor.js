@@ -1,6 +1,8 @@
 // Availability Editor - Personal availability management
 (function() {
     let currentSlots = {};  // Map of slot_index to state
+    let baseSlots = {};     // Slot states as last loaded or saved
+    let weekVersions = {};  // Map of week start slot to the version the edits are based on
     let selectionMode = 2;  // Default to Available (2)
     let isSelecting = false;
     let startSlotIndex = null;
@@ -21,6 +23,11 @@
     }
     
     // Convert slot index to date
+    // Slot index of the Monday 00:00 UTC starting the week of a slot
+    function weekStartOf(slotIndex) {
+        return slotIndex - (((slotIndex - 192) % 336) + 336) % 336;
+    }
+    
     function slotIndexToDate(slotIndex) {
         const timestamp = slotIndex * 1800 * 1000;
         return new Date(timestamp);
@@ -102,6 +109,8 @@
                 response.slots.forEach(slot => {
                     currentSlots[slot.slot_index] = slot.state;
                 });
+                baseSlots = { ...currentSlots };
+                weekVersions = response.versions || {};
                 
                 // Build and render grid
                 const gridHtml = buildAvailabilityGrid(startDate, endDate);
@@ -159,19 +168,21 @@
         }
     }
     
-    // Save availability to server
-    function saveAvailability() {
-        // Build slots array
+    // Save the slots changed since the last load or save, against the loaded week versions
+    function saveChanges(onSaved) {
         const slots = [];
+        const versions = {};
         for (const slotIndex in currentSlots) {
-            slots.push({
-                slot_index: parseInt(slotIndex),
-                state: currentSlots[slotIndex]
-            });
+            const state = currentSlots[slotIndex];
+            if (state !== (baseSlots[slotIndex] || 0)) {
+                slots.push({ slot_index: parseInt(slotIndex), state: state });
+                const weekStart = weekStartOf(parseInt(slotIndex));
+                versions[weekStart] = weekVersions[weekStart] || 0;
+            }
         }
         
         if (slots.length === 0) {
-            alert('No changes to save');
+            onSaved(false);
             return;
         }
         
@@ -179,16 +190,151 @@
             url: '/api/availability/bulk',
             method: 'POST',
             contentType: 'application/json',
-            data: JSON.stringify({ slots }),
+            data: JSON.stringify({ slots, versions }),
             success: function(response) {
-                alert('Availability saved successfully!');
+                slots.forEach(slot => {
+                    baseSlots[slot.slot_index] = slot.state;
+                });
+                Object.assign(weekVersions, response.versions);
+                onSaved(true);
             },
             error: function(xhr) {
+                if (xhr.status === 409 && xhr.responseJSON?.conflicts) {
+                    rebaseWeeks(xhr.responseJSON.conflicts);
+                    alert('Your availability was changed elsewhere since you loaded it. Your edits are shown on top of the latest version; review them and save again.');
+                    return;
+                }
                 alert('Error saving availability: ' + (xhr.responseJSON?.error || 'Unknown error'));
             }
         });
     }
     
+    // Take the server's slots for conflicting weeks and keep the local edits on top
+    function rebaseWeeks(conflicts) {
+        conflicts.forEach(conflict => {
+            const serverSlots = {};
+            conflict.slots.forEach(slot => {
+                serverSlots[slot.slot_index] = slot.state;
+            });
+            for (let slotIndex = conflict.week_start; slotIndex < conflict.week_start + 336; slotIndex++) {
+                const local = currentSlots[slotIndex] || 0;
+                const edited = local !== (baseSlots[slotIndex] || 0);
+                baseSlots[slotIndex] = serverSlots[slotIndex] || 0;
+                const $cell = $(`.slot-cell[data-slot="${slotIndex}"]`);
+                if ($cell.length) {
+                    updateCell($cell, edited ? local : baseSlots[slotIndex]);
+                } else {
+                    currentSlots[slotIndex] = edited ? local : baseSlots[slotIndex];
+                }
+            }
+            weekVersions[conflict.week_start] = conflict.version;
+        });
+    }
+    
+    // Save availability to server
+    function saveAvailability() {
+        saveChanges(function(saved) {
+            alert(saved ? 'Availability saved successfully!' : 'No changes to save');
+        });
+    }
+    
+    // Show whether a weekly template is in effect
+    function loadTemplateStatus() {
+        $.ajax({
+            url: '/api/availability/template',
+            method: 'GET',
+            success: function(response) {
+                if (response.template) {
+                    const since = slotIndexToDate(response.template.start_week).toLocaleDateString();
+                    $('#template_status').text(`Your availability repeats every week (since ${since}). Edited weeks keep their changes.`).show();
+                    $('#stop_repeating').show();
+                } else {
+                    $('#template_status').hide();
+                    $('#stop_repeating').hide();
+                }
+            }
+        });
+    }
+    
+    // Save the changed slots, then run next
+    function saveThen(next) {
+        saveChanges(function() {
+            next();
+        });
+    }
+    
+    // Save, then repeat the first 7 loaded days every week
+    function repeatWeekly() {
+        const startDate = $('#start_date').val();
+        if (!startDate || !confirm('Repeat the first 7 days shown here every week from this week on?')) {
+            return;
+        }
+        saveThen(function() {
+            $.ajax({
+                url: '/api/availability/template',
+                method: 'PUT',
+                contentType: 'application/json',
+                data: JSON.stringify({ start_slot: dateTimeToSlotIndex(startDate, 0, 0) }),
+                success: function() {
+                    loadTemplateStatus();
+                    loadAvailability();
+                },
+                error: function(xhr) {
+                    alert('Error setting weekly schedule: ' + (xhr.responseJSON?.error || 'Unknown error'));
+                }
+            });
+        });
+    }
+    
+    // Save, then copy the first 7 loaded days over the following weeks on the server
+    function copyForward() {
+        const startDate = $('#start_date').val();
+        if (!startDate) {
+            return;
+        }
+        const weeks = parseInt(prompt('Copy the first 7 days shown here to how many following weeks?', '4'));
+        if (!weeks || weeks < 1) {
+            return;
+        }
+        const sourceStart = dateTimeToSlotIndex(startDate, 0, 0);
+        saveThen(function() {
+            $.ajax({
+                url: '/api/availability/copy',
+                method: 'POST',
+                contentType: 'application/json',
+                data: JSON.stringify({
+                    source_start: sourceStart,
+                    source_end: sourceStart + 335,
+                    target_start: sourceStart + 336,
+                    repeat: weeks
+                }),
+                success: function() {
+                    loadAvailability();
+                },
+                error: function(xhr) {
+                    alert('Error copying availability: ' + (xhr.responseJSON?.error || 'Unknown error'));
+                }
+            });
+        });
+    }
+    
+    function stopRepeating() {
+        if (!confirm('Stop repeating your weekly schedule from this week on?')) {
+            return;
+        }
+        $.ajax({
+            url: '/api/availability/template',
+            method: 'DELETE',
+            success: function() {
+                loadTemplateStatus();
+                loadAvailability();
+            },
+            error: function(xhr) {
+                alert('Error: ' + (xhr.responseJSON?.error || 'Unknown error'));
+            }
+        });
+    }
+    
     // Clear all selections
     function clearAll() {
         if (confirm('Are you sure you want to clear all availability in this date range?')) {
@@ -225,6 +371,12 @@
         // Clear all button
         $('#clear_all').click(clearAll);
         
+        // Weekly template
+        $('#repeat_weekly').click(repeatWeekly);
+        $('#copy_forward').click(copyForward);
+        $('#stop_repeating').click(stopRepeating);
+        loadTemplateStatus();
+        
         function updateModeDisplay(mode) {
             $('#current_mode_text').text(mode);
         }
@@ -1,6 +1,6 @@
 // Heatmap Viewer - Aggregated availability heatmap
 (function() {
-    let aggregateData = [];
+    let aggregateData = null;
     let timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
     
     // Convert slot index to readable time
@@ -35,18 +35,14 @@
     }
     
     // Build heatmap grid
+    // aggregates is a dense response: available[i] is the count for slot start_slot + i
     function buildHeatmapGrid(startDate, endDate, aggregates) {
         const start = new Date(startDate);
         const end = new Date(endDate);
+        const available = aggregates.available;
         
         // Find max count for intensity scaling
-        const maxCount = Math.max(...aggregates.map(a => a.available_count), 1);
-        
-        // Create aggregate map
-        const aggMap = {};
-        aggregates.forEach(agg => {
-            aggMap[agg.slot_index] = agg.available_count;
-        });
+        const maxCount = available.reduce((max, count) => Math.max(max, count), 1);
         
         let html = '<div class="heatmap-grid-wrapper">';
         html += '<table class="table table-bordered table-sm heatmap-table">';
@@ -73,7 +69,7 @@
                 // Cells for each day
                 days.forEach(day => {
                     const slotIndex = dateTimeToSlotIndex(day, hour, minute);
-                    const count = aggMap[slotIndex] || 0;
+                    const count = available[slotIndex - aggregates.start_slot] || 0;
                     const intensityClass = getIntensityClass(count, maxCount);
                     html += `<td class="heatmap-cell ${intensityClass}" data-slot="${slotIndex}" data-count="${count}" title="${count} available"></td>`;
                 });
@@ -107,10 +103,11 @@
             method: 'GET',
             data: {
                 start_slot: startSlot,
-                end_slot: endSlot
+                end_slot: endSlot,
+                format: 'dense'
             },
             success: function(response) {
-                aggregateData = response.aggregates;
+                aggregateData = response;
                 
                 // Build and render grid
                 const gridHtml = buildHeatmapGrid(startDate, endDate, aggregateData);
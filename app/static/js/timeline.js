@@ -203,26 +203,31 @@
         const params = {
             start_slot: startSlot,
             end_slot: endSlot,
-            confidence: confidenceFilter
+            confidence: confidenceFilter,
+            // Hourly spans are plenty for ranges wider than four weeks
+            resolution: (endSlot - startSlot + 1) > 48 * 28 ? 2 : 1
         };
         
         if (classFilter) params.class = classFilter;
         if (roleFilter) params.role = roleFilter;
         
         $.ajax({
-            url: '/api/availability',
+            url: '/api/availability/timeline',
             method: 'GET',
             data: params,
             success: function(response) {
                 usersData = response.users;
                 
-                // Organize slots by user
+                // Expand each user's [start_slot, length, state] runs into a slot map
                 slotsData = {};
-                response.slots.forEach(slot => {
-                    if (!slotsData[slot.user_id]) {
-                        slotsData[slot.user_id] = {};
-                    }
-                    slotsData[slot.user_id][slot.slot_index] = slot.state;
+                Object.keys(response.runs).forEach(userId => {
+                    const userSlots = {};
+                    response.runs[userId].forEach(([start, length, state]) => {
+                        for (let i = 0; i < length; i++) {
+                            userSlots[start + i] = state;
+                        }
+                    });
+                    slotsData[userId] = userSlots;
                 });
                 
                 // Build and render grids
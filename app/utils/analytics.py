@@ -0,0 +1,275 @@
+"""
+In-memory availability matrix for analytics queries.
+Holds a users x slots int8 state matrix for a rolling window (this week plus the
+next few) and answers find-matches overlaps, filtered heatmap counts and group
+window searches as vectorized NumPy operations instead of row-by-row queries.
+
+Each worker process keeps its own copy. Before answering, it reads the shared
+availability_changes log and reloads only the users whose rows changed since
+its last look, so writes made by any worker are visible on the next request.
+
+NumPy is optional: without it (or with ANALYTICS_ENGINE off) callers fall back
+to SQL.
+"""
+import logging
+import threading
+import time
+from sqlalchemy import select, func
+from app.utils.slots import WEEK_SLOTS, current_week_start_slot
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+# Change ids can commit out of order on PostgreSQL; re-read this many recent ids
+CHANGE_ID_OVERLAP = 256
+# More changed users than this since the last refresh reloads the whole window
+FULL_RELOAD_USERS = 500
+
+
+class ChangeFeed:
+    """
+    A per-worker cache's position in the shared availability_changes log.
+    Change ids can commit out of order, so the last CHANGE_ID_OVERLAP ids are
+    re-read on every look and the ones already applied are skipped.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.version = 0
+        self._seen = set()
+
+    def mark_current(self, session):
+        """Treat everything logged so far as applied (call before a full load)"""
+        from app.models.availability import AvailabilityChange
+        change_table = AvailabilityChange.__table__
+        self.reset()
+        self.remember(session.execute(
+            select(change_table.c.id).where(
+                change_table.c.id > select(func.coalesce(func.max(change_table.c.id), 0)).scalar_subquery()
+                - CHANGE_ID_OVERLAP
+            )
+        ).scalars())
+
+    def pending(self, session):
+        """(change_id, user_id) entries not applied yet; user_id None is a bulk change"""
+        from app.models.availability import AvailabilityChange
+        change_table = AvailabilityChange.__table__
+        floor = max(0, self.version - CHANGE_ID_OVERLAP)
+        return [
+            (change_id, user_id)
+            for change_id, user_id in session.execute(
+                select(change_table.c.id, change_table.c.user_id).where(change_table.c.id > floor)
+            )
+            if change_id not in self._seen
+        ]
+
+    def remember(self, change_ids):
+        """Mark entries as applied"""
+        self._seen.update(change_ids)
+        if self._seen:
+            self.version = max(self.version, max(self._seen))
+        floor = self.version - CHANGE_ID_OVERLAP
+        self._seen = {change_id for change_id in self._seen if change_id > floor}
+
+
+def find_runs(mask, start_slot, min_length=1):
+    """[start_slot, length] runs of True in a boolean array at least min_length long"""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    keep = lengths >= min_length
+    return [[int(start_slot + s), int(n)] for s, n in zip(starts[keep], lengths[keep])]
+
+
+class AvailabilityMatrix:
+    """Flask extension keeping a users x slots state matrix for the analytics window"""
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        self.enabled = False
+        self.weeks = 5
+        self._lock = threading.Lock()
+        self._feed = ChangeFeed()
+        self._reset()
+        if app is not None and db is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.weeks = app.config.get('ANALYTICS_WEEKS', self.weeks)
+        self.enabled = bool(app.config.get('ANALYTICS_ENGINE'))
+        if self.enabled and np is None:
+            logger.warning('ANALYTICS_ENGINE is on but NumPy is not installed; using SQL queries')
+            self.enabled = False
+        self._reset()
+        app.extensions['analytics'] = self
+
+    def _reset(self):
+        self.matrix = None
+        self.rows = {}           # user_id -> row index
+        self.row_users = []      # row index -> user_id
+        self.window_start = None
+        self._feed.reset()
+        self._refreshed_at = 0.0
+
+    @property
+    def window_end(self):
+        return self.window_start + self.weeks * WEEK_SLOTS - 1
+
+    def covers(self, start_slot, end_slot):
+        """True if the engine is on and the range lies inside the current window"""
+        if not self.enabled or start_slot is None or end_slot is None:
+            return False
+        window_start = current_week_start_slot()
+        return window_start <= start_slot <= end_slot <= window_start + self.weeks * WEEK_SLOTS - 1
+
+    # ============= LOADING =============
+
+    def _refresh(self):
+        from app.models.availability import CHANGE_LOG_RETENTION
+        window_start = current_week_start_slot()
+        stale = time.monotonic() - self._refreshed_at > CHANGE_LOG_RETENTION.total_seconds() / 2
+        if self.matrix is None or window_start != self.window_start or stale:
+            self._load_all(window_start)
+            return
+
+        changes = self._feed.pending(self.db.session)
+        self._refreshed_at = time.monotonic()
+        if not changes:
+            return
+
+        user_ids = {user_id for _, user_id in changes}
+        if None in user_ids or len(user_ids) > FULL_RELOAD_USERS:
+            self._load_all(window_start)
+            return
+        self._reload_users(user_ids)
+        self._feed.remember(change_id for change_id, _ in changes)
+
+    def _window_rows(self, user_ids=None):
+        from app.models.availability import AvailabilitySlot
+        from app.utils.recurring import template_slots
+        slots_table = AvailabilitySlot.__table__
+        query = select(slots_table.c.user_id, slots_table.c.slot_index, slots_table.c.state).where(
+            slots_table.c.slot_index >= self.window_start,
+            slots_table.c.slot_index <= self.window_end
+        )
+        if user_ids is not None:
+            query = query.where(slots_table.c.user_id.in_(list(user_ids)))
+        rows = self.db.session.execute(query).all()
+        rows.extend(template_slots(self.window_start, self.window_end, set(user_ids) if user_ids is not None else None))
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
+        data = np.array(rows, dtype=np.int64)
+        return data[:, 0], data[:, 1] - self.window_start, data[:, 2].astype(np.int8)
+
+    def _load_all(self, window_start):
+        """Rebuild the whole matrix for the window starting at window_start"""
+        started = time.perf_counter()
+        # Read the change ids first: anything committed after this is re-applied later
+        self._reset()
+        self._feed.mark_current(self.db.session)
+        self.window_start = window_start
+
+        user_ids, offsets, states = self._window_rows()
+        self.row_users, row_index = np.unique(user_ids, return_inverse=True)
+        self.row_users = [int(user_id) for user_id in self.row_users]
+        self.rows = {user_id: i for i, user_id in enumerate(self.row_users)}
+        self.matrix = np.zeros((max(len(self.row_users), 1), self.weeks * WEEK_SLOTS), dtype=np.int8)
+        self.matrix[row_index, offsets] = states
+        self._refreshed_at = time.monotonic()
+        logger.info('Loaded availability matrix: %d users x %d slots in %.1f ms',
+                    len(self.row_users), self.matrix.shape[1], (time.perf_counter() - started) * 1000)
+
+    def _reload_users(self, user_ids):
+        for user_id in user_ids:
+            if user_id in self.rows:
+                self.matrix[self.rows[user_id]] = 0
+            else:
+                self._add_row(user_id)
+        loaded_ids, offsets, states = self._window_rows(user_ids)
+        rows = np.array([self.rows[int(user_id)] for user_id in loaded_ids], dtype=np.int64)
+        self.matrix[rows, offsets] = states
+
+    def _add_row(self, user_id):
+        if len(self.row_users) == self.matrix.shape[0]:
+            # Grow by doubling so a stream of new users stays cheap
+            grown = np.zeros((self.matrix.shape[0] * 2, self.matrix.shape[1]), dtype=np.int8)
+            grown[:self.matrix.shape[0]] = self.matrix
+            self.matrix = grown
+        self.rows[user_id] = len(self.row_users)
+        self.row_users.append(user_id)
+
+    # ============= QUERIES =============
+
+    def _slice(self, start_slot, end_slot):
+        return self.matrix[:len(self.row_users), start_slot - self.window_start:end_slot - self.window_start + 1]
+
+    def overlaps(self, user_id, start_slot, end_slot):
+        """
+        Users available (state 2) in the same slots as user_id.
+
+        Returns:
+            tuple: (number of user_id's available slots,
+                    [(user_id, overlap_count, available_slots)] sorted by overlap, most first)
+        """
+        with self._lock:
+            self._refresh()
+            if user_id not in self.rows:
+                return 0, []
+            available = self._slice(start_slot, end_slot) == 2
+            mine = available[self.rows[user_id]]
+            overlap = available[:, mine].sum(axis=1)
+            totals = available.sum(axis=1)
+            overlap[self.rows[user_id]] = 0
+            order = np.argsort(-overlap, kind='stable')
+            matches = [
+                (self.row_users[i], int(overlap[i]), int(totals[i]))
+                for i in order if overlap[i] > 0
+            ]
+            return int(mine.sum()), matches
+
+    def user_states(self, user_ids, start_slot, end_slot):
+        """{user_id: {slot_index: state}} for the users' non-zero slots in the range"""
+        with self._lock:
+            self._refresh()
+            window = self._slice(start_slot, end_slot)
+            result = {}
+            for user_id in user_ids:
+                result[user_id] = {}
+                if user_id in self.rows:
+                    row = window[self.rows[user_id]]
+                    for offset in np.flatnonzero(row):
+                        result[user_id][start_slot + int(offset)] = int(row[offset])
+            return result
+
+    def counts(self, start_slot, end_slot, user_ids=None):
+        """
+        Per-slot available and maybe counts over the given users (all users if None).
+
+        Returns:
+            tuple: (available, maybe) lists with one entry per slot from start_slot
+        """
+        with self._lock:
+            self._refresh()
+            window = self._slice(start_slot, end_slot)
+            if user_ids is not None:
+                window = window[[self.rows[u] for u in user_ids if u in self.rows]]
+            return (window == 2).sum(axis=0).tolist(), (window == 1).sum(axis=0).tolist()
+
+    def windows(self, user_ids, start_slot, end_slot, min_available, min_length=1):
+        """[start_slot, length] runs where at least min_available of the users are available"""
+        with self._lock:
+            self._refresh()
+            window = self._slice(start_slot, end_slot)
+            window = window[[self.rows[u] for u in user_ids if u in self.rows]]
+            available = (window == 2).sum(axis=0)
+            return find_runs(available >= min_available, start_slot, min_length)
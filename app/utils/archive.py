@@ -0,0 +1,283 @@
+"""
+Cold storage for completed weeks.
+Past weeks are never edited, so the archiver freezes each one into a single
+compressed row of availability_archive_weeks and deletes its live availability
+and aggregate rows. The hot tables (and their indexes) then only hold recent
+and future weeks, while the availability, timeline and heatmap APIs read
+archived ranges through the helpers below. Archived weeks are read-only.
+
+Snapshot format (zlib-compressed, little-endian):
+    uint8 format version, uint32 user count
+    336 x uint32 available counts, 336 x uint32 maybe counts
+    per user: uint32 user_id, 84 bytes of states (2 bits per slot, 4 slots per byte)
+"""
+import logging
+import struct
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import select, func
+from app import db
+from app.models.availability import (
+    AvailabilitySlot, AggregateSlotCount, ArchivedWeek, AvailabilityVersion, PendingSlot, log_availability_change,
+    write_pending_slots
+)
+from app.models.group import GroupSlotCount
+from app.utils.slots import FIRST_MONDAY_SLOT, WEEK_SLOTS, current_week_start_slot, week_start_of
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<BI')
+_COUNTS = struct.Struct(f'<{WEEK_SLOTS}I')
+_USER_ID = struct.Struct('<I')
+_PACKED_STATES = WEEK_SLOTS // 4
+
+
+def pack_states(states):
+    """Pack WEEK_SLOTS states (0-2) at 2 bits each, 4 slots per byte"""
+    return bytes(
+        states[i] | states[i + 1] << 2 | states[i + 2] << 4 | states[i + 3] << 6
+        for i in range(0, WEEK_SLOTS, 4)
+    )
+
+
+def unpack_states(packed):
+    """Tuple of WEEK_SLOTS states from pack_states() output"""
+    return tuple((byte >> shift) & 3 for byte in packed for shift in (0, 2, 4, 6))
+
+
+def pack_week(users):
+    """
+    Encode a week as a compressed snapshot.
+
+    Args:
+        users: dict of user_id -> list of WEEK_SLOTS states
+
+    Returns:
+        bytes
+    """
+    available = [0] * WEEK_SLOTS
+    maybe = [0] * WEEK_SLOTS
+    parts = []
+    for user_id in sorted(users):
+        states = users[user_id]
+        for offset, state in enumerate(states):
+            if state == 2:
+                available[offset] += 1
+            elif state == 1:
+                maybe[offset] += 1
+        parts.append(_USER_ID.pack(user_id))
+        parts.append(pack_states(states))
+    payload = _HEADER.pack(FORMAT_VERSION, len(users)) + _COUNTS.pack(*available) + _COUNTS.pack(*maybe)
+    return zlib.compress(payload + b''.join(parts), 9)
+
+
+@lru_cache(maxsize=64)
+def unpack_week(data):
+    """(users, available, maybe) from a snapshot; users maps user_id -> tuple of states"""
+    payload = zlib.decompress(data)
+    version, user_count = _HEADER.unpack_from(payload)
+    if version != FORMAT_VERSION:
+        raise ValueError(f'Unknown archive format {version}')
+    offset = _HEADER.size
+    available = _COUNTS.unpack_from(payload, offset)
+    maybe = _COUNTS.unpack_from(payload, offset + _COUNTS.size)
+    offset += 2 * _COUNTS.size
+    users = {}
+    for _ in range(user_count):
+        user_id, = _USER_ID.unpack_from(payload, offset)
+        users[user_id] = unpack_states(payload[offset + _USER_ID.size:offset + _USER_ID.size + _PACKED_STATES])
+        offset += _USER_ID.size + _PACKED_STATES
+    return users, available, maybe
+
+
+# ============= READING =============
+
+def _may_be_archived(start_slot):
+    """Only completed weeks are archived, so current-week reads skip the archive table"""
+    return start_slot is None or start_slot < current_week_start_slot()
+
+
+def _snapshots(start_slot, end_slot):
+    """(week_start, first offset, last offset, snapshot) for archived weeks overlapping a range"""
+    if not _may_be_archived(start_slot):
+        return
+    query = select(ArchivedWeek.week_start, ArchivedWeek.data).order_by(ArchivedWeek.week_start)
+    if start_slot is not None:
+        query = query.where(ArchivedWeek.week_start > start_slot - WEEK_SLOTS)
+    if end_slot is not None:
+        query = query.where(ArchivedWeek.week_start <= end_slot)
+    for week_start, data in db.session.execute(query).all():
+        first = 0 if start_slot is None else max(0, start_slot - week_start)
+        last = WEEK_SLOTS - 1 if end_slot is None else min(WEEK_SLOTS - 1, end_slot - week_start)
+        yield week_start, first, last, unpack_week(data)
+
+
+def archived_slots(start_slot, end_slot, user_ids=None):
+    """
+    Non-zero archived (user_id, slot_index, state) rows in a range (None = unbounded),
+    in (user_id, slot_index) order.
+
+    Args:
+        user_ids: Optional collection of users to include
+    """
+    rows = []
+    for week_start, first, last, (users, _, _) in _snapshots(start_slot, end_slot):
+        for user_id, states in users.items():
+            if user_ids is not None and user_id not in user_ids:
+                continue
+            rows.extend(
+                (user_id, week_start + offset, states[offset])
+                for offset in range(first, last + 1) if states[offset]
+            )
+    rows.sort()
+    return rows
+
+
+def archived_counts(start_slot, end_slot, user_ids=None):
+    """
+    Archived (slot_index, available, maybe) rows in a range with at least one non-zero count.
+    Without user_ids the stored aggregate arrays are used; with them only those users are counted.
+    """
+    rows = []
+    for week_start, first, last, (users, available, maybe) in _snapshots(start_slot, end_slot):
+        if user_ids is not None:
+            available = [0] * WEEK_SLOTS
+            maybe = [0] * WEEK_SLOTS
+            for user_id in users.keys() & set(user_ids):
+                states = users[user_id]
+                for offset in range(first, last + 1):
+                    if states[offset] == 2:
+                        available[offset] += 1
+                    elif states[offset] == 1:
+                        maybe[offset] += 1
+        rows.extend(
+            (week_start + offset, available[offset], maybe[offset])
+            for offset in range(first, last + 1) if available[offset] or maybe[offset]
+        )
+    return rows
+
+
+def archived_weeks(slot_indices):
+    """Sorted week starts of archived weeks containing any of these slots"""
+    weeks = {week_start_of(slot_index) for slot_index in slot_indices}
+    weeks = [week for week in weeks if week < current_week_start_slot()]
+    if not weeks:
+        return []
+    return sorted(db.session.execute(
+        select(ArchivedWeek.week_start).where(ArchivedWeek.week_start.in_(weeks))
+    ).scalars())
+
+
+# ============= ARCHIVING =============
+
+def _apply_pending(start_slot, end_slot):
+    """Apply the staged saves of users with staged slots in a range. Runs inside a write."""
+    pending_table = PendingSlot.__table__
+    condition = pending_table.c.slot_index <= end_slot
+    if start_slot is not None:
+        condition = condition & (pending_table.c.slot_index >= start_slot)
+    user_ids = db.session.execute(select(func.distinct(pending_table.c.user_id)).where(condition)).scalars().all()
+    if user_ids:
+        write_pending_slots(user_ids)
+
+
+def archive_week(week_start):
+    """
+    Move one week's live rows into its snapshot. Runs inside a write (the caller commits).
+    Rows are deleted with RETURNING, so exactly what is removed gets archived;
+    rows written after an earlier archive of the week are merged in, and so are
+    the weeks of users who follow a template.
+
+    Returns:
+        int: Live availability rows archived
+    """
+    slots_table = AvailabilitySlot.__table__
+    aggregate_table = AggregateSlotCount.__table__
+    group_table = GroupSlotCount.__table__
+    end_slot = week_start + WEEK_SLOTS - 1
+
+    # Saves staged by the write-behind buffer before the week froze are applied first
+    _apply_pending(week_start, end_slot)
+
+    from app.utils.recurring import template_weeks
+    templates = template_weeks(week_start, end_slot)
+    rows = db.session.execute(
+        slots_table.delete().where(
+            slots_table.c.slot_index >= week_start,
+            slots_table.c.slot_index <= end_slot
+        ).returning(slots_table.c.user_id, slots_table.c.slot_index, slots_table.c.state)
+    ).all()
+    db.session.execute(aggregate_table.delete().where(
+        aggregate_table.c.slot_index >= week_start,
+        aggregate_table.c.slot_index <= end_slot
+    ))
+    db.session.execute(group_table.delete().where(
+        group_table.c.slot_index >= week_start,
+        group_table.c.slot_index <= end_slot
+    ))
+    # Archived weeks are read-only, so nothing saves against their versions
+    version_table = AvailabilityVersion.__table__
+    db.session.execute(version_table.delete().where(version_table.c.week_start == week_start))
+    if not rows and not templates:
+        return 0
+
+    existing = db.session.get(ArchivedWeek, week_start)
+    users = {}
+    if existing is not None:
+        users = {user_id: list(states) for user_id, states in unpack_week(existing.data)[0].items()}
+    for user_id, _, states in templates:
+        users[user_id] = list(states)
+    for user_id, slot_index, state in rows:
+        users.setdefault(user_id, [0] * WEEK_SLOTS)[slot_index - week_start] = state
+    users = {user_id: states for user_id, states in users.items() if any(states)}
+
+    values = {
+        'user_count': len(users),
+        'slot_count': sum(1 for states in users.values() for state in states if state),
+        'data': pack_week(users),
+        'archived_at': datetime.utcnow(),
+    }
+    archive_table = ArchivedWeek.__table__
+    if existing is not None:
+        db.session.expunge(existing)
+        db.session.execute(archive_table.update().where(archive_table.c.week_start == week_start).values(**values))
+    else:
+        db.session.execute(archive_table.insert().values(week_start=week_start, **values))
+    log_availability_change(db.session)
+    return len(rows)
+
+
+def archive_before(before_slot, progress=None):
+    """
+    Archive every week that ends before before_slot (never the current week).
+    Each week is its own transaction through the write queue.
+
+    Args:
+        before_slot: Weeks starting at or after week_start_of(before_slot) stay live
+        progress: Optional callable receiving {'weeks', 'total'} after each week
+
+    Returns:
+        dict: weeks_archived and slots_archived counts
+    """
+    from app import write_queue
+    cutoff = min(week_start_of(before_slot), current_week_start_slot())
+    slots_table = AvailabilitySlot.__table__
+    # Weeks with only staged slots have no live rows to be found by yet
+    write_queue.run(_apply_pending, None, cutoff - 1)
+    weeks = db.session.execute(
+        select(func.distinct(slots_table.c.slot_index - (slots_table.c.slot_index - FIRST_MONDAY_SLOT) % WEEK_SLOTS))
+        .where(slots_table.c.slot_index < cutoff)
+    ).scalars().all()
+    db.session.rollback()  # don't hold a read transaction open while the writes run
+    weeks = sorted(weeks)
+
+    slots_archived = 0
+    for done, week_start in enumerate(weeks, 1):
+        slots_archived += write_queue.run(archive_week, week_start)
+        if progress:
+            progress({'weeks': done, 'total': len(weeks)})
+
+    logger.info('Archived %d weeks (%d slots) before slot %s', len(weeks), slots_archived, cutoff)
+    return {'weeks_archived': len(weeks), 'slots_archived': slots_archived}
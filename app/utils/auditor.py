@@ -0,0 +1,300 @@
+"""
+Aggregate consistency auditor.
+The heatmap aggregates and group counts are kept current incrementally, so a
+write that bypasses the usual paths (a manual DELETE, a crash between
+statements, concurrent deltas on PostgreSQL) can leave them off. The auditor
+walks the live slot range one week at a time, compares the stored counts with
+a GROUP BY over availability_slots and recounts only the slots that differ.
+Mismatches are compared again inside the repairing write, so saves landing
+between the two reads aren't counted as drift.
+
+With AUDIT_INTERVAL_MINUTES set, one worker per host audits for at most
+AUDIT_TIME_BUDGET_SECONDS per run, resuming where the previous run stopped and
+starting over after the last slot. The cursor and the last run's drift
+metrics are kept in the instance folder.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from sqlalchemy import select, func, case, and_
+from app.utils.slots import WEEK_SLOTS
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; every worker may run the audit
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Slots compared per pair of GROUP BY queries
+AUDIT_WINDOW_SLOTS = WEEK_SLOTS
+
+# Mismatches listed in a result
+EXAMPLE_LIMIT = 10
+
+# Delay before a worker's first scheduled audit
+FIRST_AUDIT_DELAY = 120
+
+
+def _slot_condition(column, start_slot, end_slot, slots):
+    if slots is not None:
+        return column.in_(slots)
+    return and_(column >= start_slot, column <= end_slot)
+
+
+def _counts(rows):
+    """key -> (available, maybe), leaving out all-zero counts"""
+    counts = {}
+    for *key, available, maybe in rows:
+        available, maybe = available or 0, maybe or 0
+        if available or maybe:
+            counts[key[0] if len(key) == 1 else tuple(key)] = (available, maybe)
+    return counts
+
+
+def _aggregate_counts(start_slot, end_slot, slots=None):
+    """(stored, actual) counts by slot_index"""
+    from app import db
+    from app.models.availability import AvailabilitySlot, AggregateSlotCount
+    slots_table = AvailabilitySlot.__table__
+    aggregate_table = AggregateSlotCount.__table__
+    stored = db.session.execute(
+        select(aggregate_table.c.slot_index, aggregate_table.c.available_count, aggregate_table.c.maybe_count)
+        .where(_slot_condition(aggregate_table.c.slot_index, start_slot, end_slot, slots))
+    ).all()
+    actual = db.session.execute(
+        select(
+            slots_table.c.slot_index,
+            func.sum(case((slots_table.c.state == 2, 1), else_=0)),
+            func.sum(case((slots_table.c.state == 1, 1), else_=0))
+        ).where(_slot_condition(slots_table.c.slot_index, start_slot, end_slot, slots))
+        .group_by(slots_table.c.slot_index)
+    ).all()
+    return _counts(stored), _counts(actual)
+
+
+def _group_counts(start_slot, end_slot, slots=None):
+    """(stored, actual) counts by (group_id, slot_index)"""
+    from app import db
+    from app.models.availability import AvailabilitySlot
+    from app.models.group import GroupMembership, GroupSlotCount
+    slots_table = AvailabilitySlot.__table__
+    membership_table = GroupMembership.__table__
+    group_table = GroupSlotCount.__table__
+    stored = db.session.execute(
+        select(group_table.c.group_id, group_table.c.slot_index, group_table.c.available_count,
+               group_table.c.maybe_count)
+        .where(_slot_condition(group_table.c.slot_index, start_slot, end_slot, slots))
+    ).all()
+    actual = db.session.execute(
+        select(
+            membership_table.c.group_id,
+            slots_table.c.slot_index,
+            func.sum(case((slots_table.c.state == 2, 1), else_=0)),
+            func.sum(case((slots_table.c.state == 1, 1), else_=0))
+        ).select_from(
+            slots_table.join(membership_table, membership_table.c.user_id == slots_table.c.user_id)
+        ).where(_slot_condition(slots_table.c.slot_index, start_slot, end_slot, slots))
+        .group_by(membership_table.c.group_id, slots_table.c.slot_index)
+    ).all()
+    return _counts(stored), _counts(actual)
+
+
+def _mismatches(stored, actual):
+    """key -> (stored, actual) for keys whose counts differ"""
+    return {
+        key: (stored.get(key, (0, 0)), actual.get(key, (0, 0)))
+        for key in stored.keys() | actual.keys()
+        if stored.get(key, (0, 0)) != actual.get(key, (0, 0))
+    }
+
+
+def _drift(mismatches):
+    return max((abs(s[0] - a[0]) + abs(s[1] - a[1]) for s, a in mismatches.values()), default=0)
+
+
+def _repair(aggregate_slots, group_slots):
+    """
+    Compare the suspect slots again and recount those that still differ.
+    Runs inside a write (the caller commits).
+
+    Returns:
+        tuple: (aggregate mismatches, group mismatches) that were confirmed and repaired
+    """
+    from app import db
+    from app.models.availability import IN_CHUNK_SIZE, refresh_aggregate_slots, log_availability_change
+    aggregates, groups = {}, {}
+    for slots, counts, confirmed in ((sorted(aggregate_slots), _aggregate_counts, aggregates),
+                                     (sorted(group_slots), _group_counts, groups)):
+        for i in range(0, len(slots), IN_CHUNK_SIZE):
+            confirmed.update(_mismatches(*counts(None, None, slots[i:i + IN_CHUNK_SIZE])))
+    if aggregates or groups:
+        # Recounts the aggregate and every group count of these slots
+        refresh_aggregate_slots(set(aggregates) | {slot_index for _, slot_index in groups})
+        # Cached heatmaps were computed from the drifted counts
+        log_availability_change(db.session)
+    return aggregates, groups
+
+
+def live_slot_range():
+    """(first, last) slot with live rows or stored counts, or (None, None)"""
+    from app import db
+    from app.models.availability import AvailabilitySlot, AggregateSlotCount
+    from app.models.group import GroupSlotCount
+    firsts, lasts = [], []
+    for column in (AvailabilitySlot.slot_index, AggregateSlotCount.slot_index, GroupSlotCount.slot_index):
+        first, last = db.session.query(func.min(column), func.max(column)).one()
+        if first is not None:
+            firsts.append(first)
+            lasts.append(last)
+    return (min(firsts), max(lasts)) if firsts else (None, None)
+
+
+def audit_range(start_slot, end_slot, repair=True, budget=None, progress=None):
+    """
+    Audit aggregates and group counts from start_slot to end_slot, AUDIT_WINDOW_SLOTS at a time.
+
+    Args:
+        repair: Recount the slots found to differ
+        budget: Optional seconds after which no further window is started (the first always is)
+        progress: Optional callable receiving {'slot', 'end_slot'} after each window
+
+    Returns:
+        dict: Drift metrics; next_slot is where to resume, or None when the range was finished
+    """
+    from app import db, write_queue
+    started = time.perf_counter()
+    result = {
+        'start_slot': start_slot,
+        'end_slot': end_slot,
+        'next_slot': None,
+        'slots_checked': 0,
+        'aggregate_mismatches': 0,
+        'group_mismatches': 0,
+        'max_drift': 0,
+        'repaired_slots': 0,
+        'examples': [],
+    }
+    slot = start_slot
+    while slot <= end_slot:
+        # At least one window per run, so a scheduled audit always moves on
+        if budget is not None and slot > start_slot and time.perf_counter() - started > budget:
+            result['next_slot'] = slot
+            break
+        window_end = min(slot + AUDIT_WINDOW_SLOTS - 1, end_slot)
+        aggregates = _mismatches(*_aggregate_counts(slot, window_end))
+        groups = _mismatches(*_group_counts(slot, window_end))
+        db.session.rollback()  # don't hold a read transaction open while repairing or between windows
+
+        if (aggregates or groups) and repair:
+            aggregates, groups = write_queue.run(_repair, set(aggregates), {s for _, s in groups})
+            result['repaired_slots'] += len(set(aggregates) | {s for _, s in groups})
+        result['aggregate_mismatches'] += len(aggregates)
+        result['group_mismatches'] += len(groups)
+        result['max_drift'] = max(result['max_drift'], _drift(aggregates), _drift(groups))
+        for key, (stored, actual) in sorted(aggregates.items())[:EXAMPLE_LIMIT - len(result['examples'])]:
+            result['examples'].append({'slot_index': key, 'stored': list(stored), 'actual': list(actual)})
+
+        result['slots_checked'] += window_end - slot + 1
+        slot = window_end + 1
+        if progress:
+            progress({'slot': slot, 'end_slot': end_slot})
+
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    if result['aggregate_mismatches'] or result['group_mismatches']:
+        logger.warning('Aggregate audit of slots %s to %s found %d aggregate and %d group mismatches '
+                       '(largest drift %d)%s', start_slot, end_slot, result['aggregate_mismatches'],
+                       result['group_mismatches'], result['max_drift'], ', repaired' if repair else '')
+    return result
+
+
+class AggregateAuditor:
+    """Flask extension auditing a slice of the aggregates on a schedule"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 0
+        self.budget = 10.0
+        self.state_path = None
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('AUDIT_INTERVAL_MINUTES', 0) * 60
+        self.budget = app.config.get('AUDIT_TIME_BUDGET_SECONDS', self.budget)
+        self.state_path = os.path.join(app.instance_path, 'audit.state')
+        if self.interval:
+            app.before_request(self._ensure_thread)
+        app.extensions['auditor'] = self
+
+    def run_once(self, state=None):
+        """Audit from the saved cursor for up to the time budget; returns the new state"""
+        state = state if state is not None else self.state()
+        first_slot, last_slot = live_slot_range()
+        if first_slot is None:
+            return {'cursor': None, 'last_run': time.time(), 'result': None}
+        cursor = state.get('cursor')
+        start = cursor if cursor is not None and first_slot <= cursor <= last_slot else first_slot
+        result = audit_range(start, last_slot, budget=self.budget)
+        return {'cursor': result['next_slot'], 'last_run': time.time(), 'result': result}
+
+    def state(self):
+        """Cursor, time and result of the last scheduled audit on this host"""
+        try:
+            with open(self.state_path) as f:
+                return json.loads(f.read() or '{}')
+        except (OSError, ValueError):
+            return {}
+
+    def status(self):
+        return {
+            'interval_minutes': self.interval / 60,
+            'time_budget_seconds': self.budget,
+            **self.state(),
+        }
+
+    # ============= BACKGROUND AUDIT =============
+
+    def _ensure_thread(self):
+        """Start the auditor lazily so it is never inherited across a fork"""
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='aggregate-audit', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _loop(self):
+        time.sleep(FIRST_AUDIT_DELAY * random.uniform(0.5, 1.5))
+        while True:
+            try:
+                with self.app.app_context():
+                    self._run_if_due()
+            except Exception:
+                logger.exception('Aggregate audit failed')
+            # Jitter so workers started together don't check in lockstep
+            time.sleep(min(self.interval, 3600) * random.uniform(0.8, 1.2))
+
+    def _run_if_due(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path, 'a+') as state_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(state_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # another worker is running it
+            state = self.state()
+            if state.get('last_run') and time.time() - state['last_run'] < self.interval:
+                return
+            state = self.run_once(state)
+            state_file.seek(0)
+            state_file.truncate()
+            state_file.write(json.dumps(state))
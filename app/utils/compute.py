@@ -0,0 +1,392 @@
+"""
+Process pool for heavy scheduling computations.
+Overlap scans, window searches and admin aggregate rebuilds run in separate
+worker processes so the gunicorn request thread stays free for cheap endpoints.
+
+- Every job has a time budget; a job that exceeds it (or is cancelled) has its
+  worker process killed and replaced.
+- Job ids are derived from the job name, arguments, owner and the current
+  availability version, so repeating a request before anything changes returns
+  the cached result.
+- Job state is written to small JSON files in COMPUTE_JOB_DIR, so any gunicorn
+  worker can answer /api/jobs/<id> polls and cancellations.
+
+A request waits up to COMPUTE_INLINE_WAIT seconds for its job and otherwise
+answers 202 with a job id to poll. With COMPUTE_WORKERS = 0 jobs run inline.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import wait as wait_for_connections
+from flask import jsonify, url_for
+
+logger = logging.getLogger(__name__)
+
+# name -> function, registered with @compute.job(name) in the route modules
+JOBS = {}
+
+PENDING_STATUSES = ('queued', 'running')
+BUSY_RETRY_AFTER = '5'
+
+
+# (pipe, job id) of the job running in this worker process
+_running = None
+
+
+class ComputeBusy(Exception):
+    """Raised when the compute queue is full"""
+
+
+def report_progress(progress):
+    """Publish JSON progress data for the running job (shown by /api/jobs/<id>); no-op inline"""
+    if _running is not None:
+        connection, job_id = _running
+        connection.send((job_id, 'progress', progress, None))
+
+
+def _worker_main(connection, config_name, config_overrides):
+    """Worker process: build an app once, then run jobs sent over the pipe"""
+    global _running
+    from app import create_app, db
+    app = create_app(config_name, skip_schema_check=True, config_overrides=config_overrides)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        job_id, name, args = message
+        _running = (connection, job_id)
+        try:
+            with app.app_context():
+                result = JOBS[name](*args)
+                db.session.remove()
+            _running = None
+            connection.send((job_id, 'done', result, None))
+        except Exception as e:  # reported to the client through the job status
+            _running = None
+            logger.exception('Compute job %s (%s) failed', job_id, name)
+            connection.send((job_id, 'error', None, str(e)))
+
+
+class _Worker:
+    def __init__(self, context, config_name, config_overrides):
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_connection, config_name, config_overrides),
+            name='compute-worker', daemon=True
+        )
+        self.process.start()
+        child_connection.close()
+        self.job = None
+        self.deadline = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join(1)
+        self.connection.close()
+
+
+class ComputeExecutor:
+    """Flask extension running registered jobs in worker processes with time budgets"""
+
+    def __init__(self, app=None):
+        self.workers = 1
+        self.time_budget = 30.0
+        self.inline_wait = 2.0
+        self.queue_limit = 16
+        self.result_ttl = 300.0
+        self.job_dir = None
+        self.config_name = None
+        self.config_overrides = {}
+        self._queue = None
+        self._futures = {}
+        self._thread = None
+        self._thread_pid = None
+        self._pool = []
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, config_name=None, config_overrides=None):
+        """Worker processes rebuild the app from the same config name and overrides"""
+        self.shutdown()
+        self.workers = max(0, app.config.get('COMPUTE_WORKERS', self.workers))
+        self.time_budget = app.config.get('COMPUTE_TIME_BUDGET', self.time_budget)
+        self.inline_wait = app.config.get('COMPUTE_INLINE_WAIT', self.inline_wait)
+        self.queue_limit = app.config.get('COMPUTE_QUEUE_LIMIT', self.queue_limit)
+        self.result_ttl = app.config.get('COMPUTE_RESULT_TTL', self.result_ttl)
+        self.job_dir = app.config.get('COMPUTE_JOB_DIR') or os.path.join(app.instance_path, 'jobs')
+        self.config_name = config_name
+        # Workers must not start pools of their own
+        self.config_overrides = dict(config_overrides or {}, COMPUTE_WORKERS=0, METRICS_ENABLED=False)
+        app.extensions['compute'] = self
+
+    def job(self, name):
+        """Register a job function; it runs in an app context and must return JSON data"""
+        def decorator(fn):
+            JOBS[name] = fn
+            return fn
+        return decorator
+
+    # ============= SUBMITTING =============
+
+    def submit(self, name, *args, owner_id=None, budget=None):
+        """
+        Start a job, or reuse a cached or in-flight one with the same inputs.
+
+        Returns:
+            dict: The job record (see get())
+        """
+        from app.models.availability import availability_version
+        budget = budget or self.time_budget
+        if self.workers == 0:
+            return self._run_inline(name, args, owner_id, budget)
+
+        key = json.dumps([name, args, owner_id, availability_version()], default=str)
+        job_id = hashlib.sha256(key.encode()).hexdigest()[:32]
+
+        with self._lock:
+            existing = self.get(job_id)
+            if existing and self._reusable(existing):
+                return existing
+
+            jobs = self._ensure_thread()
+            if len(self._futures) >= self.workers + self.queue_limit:
+                raise ComputeBusy('Compute queue is full')
+            job = self._new_job(job_id, name, owner_id, budget)
+            self._write(job)
+            self._futures[job_id] = Future()
+            jobs.put((job, args))
+            return job
+
+    def _new_job(self, job_id, name, owner_id, budget):
+        return {
+            'id': job_id,
+            'name': name,
+            'owner_id': owner_id,
+            'status': 'queued',
+            'budget': budget,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+            'progress': None,
+            'result': None,
+            'error': None,
+        }
+
+    def _reusable(self, job):
+        age = time.time() - job['updated_at']
+        if job['status'] == 'done':
+            return age < self.result_ttl
+        if job['status'] in PENDING_STATUSES:
+            # A record nobody has touched for longer than its budget belongs to a dead worker
+            return job['id'] in self._futures or age < job['budget'] + 5
+        return False
+
+    def _run_inline(self, name, args, owner_id, budget):
+        """COMPUTE_WORKERS = 0: run in the request, without budgets or job records"""
+        from app import db
+        job = self._new_job(None, name, owner_id, budget)
+        try:
+            job['result'] = JOBS[name](*args)
+            job['status'] = 'done'
+        except Exception as e:
+            db.session.rollback()
+            logger.exception('Compute job %s failed', name)
+            job['status'] = 'error'
+            job['error'] = str(e)
+        job['updated_at'] = time.time()
+        return job
+
+    def run(self, name, *args, owner_id=None, budget=None):
+        """Submit a job and wait up to COMPUTE_INLINE_WAIT seconds for it to finish"""
+        job = self.submit(name, *args, owner_id=owner_id, budget=budget)
+        future = self._futures.get(job['id']) if job['id'] else None
+        if job['status'] in PENDING_STATUSES and future is not None:
+            try:
+                future.result(timeout=self.inline_wait)
+            except FutureTimeoutError:
+                pass
+            job = self.get(job['id']) or job
+        return job
+
+    def response(self, job):
+        """Flask response for a job: its result, 202 while it runs, or an error"""
+        if job['status'] == 'done':
+            return jsonify(job['result']), 200
+        if job['status'] in PENDING_STATUSES:
+            return jsonify({
+                'job_id': job['id'],
+                'status': job['status'],
+                'status_url': url_for('jobs.get_job', job_id=job['id'])
+            }), 202
+        if job['status'] == 'timeout':
+            return jsonify({'error': 'This computation took too long, try a smaller range'}), 504
+        if job['status'] == 'cancelled':
+            return jsonify({'error': 'This computation was cancelled'}), 409
+        return jsonify({'error': job['error'] or 'Computation failed'}), 500
+
+    def busy_response(self):
+        response = jsonify({'error': 'The server is busy with other computations, please try again'})
+        response.status_code = 503
+        response.headers['Retry-After'] = BUSY_RETRY_AFTER
+        return response
+
+    # ============= JOB RECORDS =============
+
+    def _path(self, job_id):
+        return os.path.join(self.job_dir, f'{job_id}.json')
+
+    def get(self, job_id):
+        """The job record, or None if it is unknown or expired"""
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, job):
+        os.makedirs(self.job_dir, exist_ok=True)
+        temp_path = self._path(job['id']) + f'.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(temp_path, self._path(job['id']))
+
+    def cancel(self, job_id):
+        """Ask whichever process runs the job to stop it"""
+        job = self.get(job_id)
+        if job and job['status'] in PENDING_STATUSES:
+            open(self._path(job_id) + '.cancel', 'w').close()
+        return job
+
+    def _finish(self, job, status, result=None, error=None):
+        job.update(status=status, result=result, error=error, updated_at=time.time())
+        self._write(job)
+        try:
+            os.remove(self._path(job['id']) + '.cancel')
+        except OSError:
+            pass
+        future = self._futures.pop(job['id'], None)
+        if future is not None:
+            future.set_result(job)
+
+    def _prune(self):
+        """Remove job records older than the result TTL"""
+        cutoff = time.time() - max(self.result_ttl, self.time_budget) * 2
+        try:
+            names = os.listdir(self.job_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.job_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    # ============= DISPATCHER =============
+
+    def _ensure_thread(self):
+        """Start the dispatcher lazily so it is never inherited across a fork"""
+        if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+            self._queue = queue.Queue()
+            self._futures = {}
+            self._pool = []
+            self._thread = threading.Thread(target=self._dispatch, args=(self._queue,),
+                                             name='compute-dispatcher', daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+        return self._queue
+
+    def _dispatch(self, jobs):
+        context = multiprocessing.get_context('spawn')
+        pending = []
+        last_prune = time.monotonic()
+        while True:
+            try:
+                while True:
+                    item = jobs.get_nowait()
+                    if item is None:
+                        return
+                    pending.append(item)
+            except queue.Empty:
+                pass
+
+            # Hand queued jobs to idle workers, starting workers up to the limit
+            while pending:
+                worker = next((w for w in self._pool if w.job is None), None)
+                if worker is None and len(self._pool) < self.workers:
+                    worker = _Worker(context, self.config_name, self.config_overrides)
+                    self._pool.append(worker)
+                if worker is None:
+                    break
+                job, args = pending.pop(0)
+                worker.job = job
+                worker.deadline = time.monotonic() + job['budget']
+                job.update(status='running', updated_at=time.time())
+                self._write(job)
+                worker.connection.send((job['id'], job['name'], args))
+
+            busy = [w for w in self._pool if w.job is not None]
+            ready = wait_for_connections([w.connection for w in busy], timeout=0.2) if busy else []
+            if not busy:
+                time.sleep(0.05 if pending else 0.2)
+
+            for worker in busy:
+                if worker.connection in ready:
+                    try:
+                        job_id, status, result, error = worker.connection.recv()
+                    except (EOFError, OSError):
+                        self._replace(worker, 'error', 'Worker process exited')
+                        continue
+                    if status == 'progress':
+                        worker.job.update(progress=result, updated_at=time.time())
+                        self._write(worker.job)
+                        continue
+                    job, worker.job = worker.job, None
+                    self._finish(job, status, result, error)
+                elif time.monotonic() > worker.deadline:
+                    logger.warning('Compute job %s (%s) exceeded its %.0fs budget',
+                                   worker.job['id'], worker.job['name'], worker.job['budget'])
+                    self._replace(worker, 'timeout')
+                elif os.path.exists(self._path(worker.job['id']) + '.cancel'):
+                    self._replace(worker, 'cancelled')
+
+            # Cancelled before a worker picked them up
+            for item in list(pending):
+                if os.path.exists(self._path(item[0]['id']) + '.cancel'):
+                    pending.remove(item)
+                    self._finish(item[0], 'cancelled')
+
+            if time.monotonic() - last_prune > 60:
+                self._prune()
+                last_prune = time.monotonic()
+
+    def _replace(self, worker, status, error=None):
+        """Kill a worker (and its job); a new one is started when needed"""
+        job = worker.job
+        worker.kill()
+        self._pool.remove(worker)
+        self._finish(job, status, error=error)
+
+    def shutdown(self):
+        """Stop the dispatcher and kill the worker processes"""
+        if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(2)
+        for worker in self._pool:
+            worker.kill()
+        self._pool = []
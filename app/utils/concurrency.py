@@ -0,0 +1,149 @@
+"""
+Concurrency classes for request handling.
+Every endpoint belongs to a class (cheap or heavy), and each class has a bounded
+number of requests in flight per host. When the heavy class is full, a request
+waits briefly for a slot and is then shed with 503 + Retry-After, so long
+timeline and find-matches queries cannot occupy every gunicorn worker while
+login and saves (cheap) keep responding.
+
+Slots are lock files in CONCURRENCY_LOCK_DIR held with flock, so the limits are
+shared by all workers on the host and a crashed worker releases its slots.
+
+An endpoint's class comes from, in order: CONCURRENCY_ROUTE_CLASSES[endpoint],
+the @concurrency.limit(name) decorator, CONCURRENCY_ROUTE_CLASSES[blueprint],
+then 'cheap'.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from flask import current_app, g, request, jsonify
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; limits are per process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLASS = 'cheap'
+
+# Pause between attempts to grab a slot while waiting
+POLL_INTERVAL = 0.02
+
+
+class SlotPool:
+    """The slots of one class; acquire() returns a token to release, or None on timeout"""
+
+    def __init__(self, name, limit, directory):
+        self.name = name
+        self.limit = limit
+        self.directory = directory
+        self._semaphore = threading.BoundedSemaphore(limit) if fcntl is None else None
+
+    def acquire(self, timeout):
+        if self._semaphore is not None:
+            return self._semaphore if self._semaphore.acquire(timeout=timeout) else None
+        deadline = time.monotonic() + timeout
+        while True:
+            # Start at a random slot so concurrent requests don't all contend for slot 0
+            first = random.randrange(self.limit)
+            for i in range(self.limit):
+                fd = self._try_slot((first + i) % self.limit)
+                if fd is not None:
+                    return fd
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL * random.uniform(0.5, 1.5))
+
+    def _try_slot(self, slot):
+        # A fresh open file description per attempt, so threads of one worker exclude each other too
+        fd = os.open(os.path.join(self.directory, f'{self.name}.{slot}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return fd
+        except OSError:
+            os.close(fd)
+            return None
+
+    def release(self, token):
+        if self._semaphore is not None:
+            self._semaphore.release()
+        else:
+            os.close(token)  # closing the descriptor drops the flock
+
+
+class ConcurrencyLimits:
+    """Flask extension bounding in-flight requests per concurrency class"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.classes = {}
+        self.route_classes = {}
+        self.pools = {}
+        self.shed = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CONCURRENCY_LIMITS_ENABLED', True)
+        self.classes = app.config.get('CONCURRENCY_CLASSES', {})
+        self.route_classes = app.config.get('CONCURRENCY_ROUTE_CLASSES', {})
+        directory = app.config.get('CONCURRENCY_LOCK_DIR') or os.path.join(app.instance_path, 'concurrency')
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+        self.pools = {
+            name: SlotPool(name, settings['limit'], directory)
+            for name, settings in self.classes.items() if settings.get('limit')
+        }
+        self.shed = {name: 0 for name in self.classes}
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+        app.extensions['concurrency'] = self
+
+    def limit(self, name):
+        """Put a view in a concurrency class (route configuration can override it)"""
+        def decorator(fn):
+            fn.concurrency_class = name
+            return fn
+        return decorator
+
+    def class_for(self, endpoint, blueprint, view):
+        if endpoint in self.route_classes:
+            return self.route_classes[endpoint]
+        if hasattr(view, 'concurrency_class'):
+            return view.concurrency_class
+        return self.route_classes.get(blueprint, DEFAULT_CLASS)
+
+    def _before_request(self):
+        if not self.enabled or request.endpoint in (None, 'static'):
+            return None
+        view = current_app.view_functions.get(request.endpoint)
+        name = self.class_for(request.endpoint, request.blueprint, view)
+        pool = self.pools.get(name)
+        if pool is None:
+            return None
+        token = pool.acquire(self.classes[name].get('wait', 0))
+        if token is None:
+            self.shed[name] = self.shed.get(name, 0) + 1
+            logger.warning('Shedding %s (%s class full: %d in flight)', request.endpoint, name, pool.limit)
+            response = jsonify({'error': 'The server is busy, please try again shortly'})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(self.classes[name].get('retry_after', 5))
+            return response
+        g._concurrency_slot = (pool, token)
+        return None
+
+    def _teardown_request(self, exc=None):
+        slot = g.pop('_concurrency_slot', None)
+        if slot is not None:
+            pool, token = slot
+            pool.release(token)
+
+    def status(self):
+        """Per-class settings and requests shed by this worker"""
+        return {
+            name: dict(settings, shed=self.shed.get(name, 0))
+            for name, settings in self.classes.items()
+        }
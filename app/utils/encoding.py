@@ -0,0 +1,112 @@
+"""
+Compact encodings for availability API responses.
+Painted schedules are mostly long blocks of the same state, so the timeline
+sends each user's slots as run-length spans instead of one object per slot.
+Heatmap counts are sent as dense zero-filled arrays, optionally delta/varint
+packed into a base64 string.
+"""
+import base64
+
+# Coarsest timeline resolution, in slots (one day)
+MAX_RESOLUTION = 48
+
+# Longest range served as dense arrays, in slots (one year)
+MAX_DENSE_SLOTS = 48 * 366
+
+DENSE_ENCODINGS = ('plain', 'delta-varint')
+
+
+def run_length_encode(points, start_slot, end_slot, resolution=1):
+    """
+    Collapse (slot_index, state) pairs into [start_slot, length, state] runs.
+
+    Args:
+        points: (slot_index, state) pairs sorted by slot_index; missing slots are unavailable
+        start_slot: First slot of the requested range, where buckets are aligned
+        end_slot: Last slot of the requested range (runs are clipped to it)
+        resolution: Bucket width in slots; a bucket takes the highest state of its slots
+
+    Returns:
+        list: [start, length, state] runs in slot units, without unavailable (state 0) runs
+    """
+    runs = []
+    bucket = None
+    bucket_state = 0
+
+    def close_bucket():
+        bucket_start = start_slot + bucket * resolution
+        length = min(bucket_start + resolution, end_slot + 1) - bucket_start
+        last = runs[-1] if runs else None
+        if last and last[2] == bucket_state and last[0] + last[1] == bucket_start:
+            last[1] += length
+        else:
+            runs.append([bucket_start, length, bucket_state])
+
+    for slot_index, state in points:
+        if not state:
+            continue
+        slot_bucket = (slot_index - start_slot) // resolution
+        if slot_bucket != bucket:
+            if bucket is not None:
+                close_bucket()
+            bucket = slot_bucket
+            bucket_state = state
+        else:
+            bucket_state = max(bucket_state, state)
+    if bucket is not None:
+        close_bucket()
+    return runs
+
+
+def dense_counts(rows, start_slot, end_slot):
+    """
+    Spread (slot_index, available_count, maybe_count) rows over zero-filled arrays.
+
+    Returns:
+        tuple: (available, maybe) lists with one entry per slot from start_slot to end_slot
+    """
+    size = end_slot - start_slot + 1
+    available = [0] * size
+    maybe = [0] * size
+    for slot_index, available_count, maybe_count in rows:
+        offset = slot_index - start_slot
+        if 0 <= offset < size:
+            available[offset] = available_count or 0
+            maybe[offset] = maybe_count or 0
+    return available, maybe
+
+
+def delta_varint_encode(values):
+    """
+    Pack integers as zigzag-encoded deltas in LEB128 varints, base64 encoded.
+    Neighbouring slots have similar counts, so most deltas fit in one byte.
+    """
+    out = bytearray()
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        zigzag = (delta << 1) ^ (delta >> 63)
+        while zigzag >= 0x80:
+            out.append((zigzag & 0x7F) | 0x80)
+            zigzag >>= 7
+        out.append(zigzag)
+    return base64.b64encode(bytes(out)).decode('ascii')
+
+
+def delta_varint_decode(encoded):
+    """Inverse of delta_varint_encode"""
+    values = []
+    previous = 0
+    zigzag = 0
+    shift = 0
+    for byte in base64.b64decode(encoded):
+        zigzag |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += (zigzag >> 1) ^ -(zigzag & 1)
+        values.append(previous)
+        zigzag = 0
+        shift = 0
+    return values
@@ -0,0 +1,70 @@
+"""
+Streaming CSV exports.
+Rows are read from the database in batches (yield_per) and written to the
+response as they are produced, so an export of months of availability never
+sits in the worker's memory as a whole. Output can be gzip-compressed on the fly.
+"""
+import csv
+import io
+import zlib
+from datetime import datetime, timezone
+from flask import Response, stream_with_context
+from app.utils.slots import SLOT_SECONDS
+
+# Rows fetched from the database per round trip
+EXPORT_BATCH_SIZE = 1000
+
+# Bytes of CSV buffered before a chunk is sent
+CHUNK_SIZE = 64 * 1024
+
+STATE_NAMES = {1: 'maybe', 2: 'available'}
+
+
+def slot_to_iso(slot_index):
+    """UTC start time of a slot, e.g. 2007-01-16T00:00:00Z"""
+    return datetime.fromtimestamp(slot_index * SLOT_SECONDS, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def csv_chunks(header, rows):
+    """Encode rows as CSV and yield them in chunks of about CHUNK_SIZE bytes"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    """Gzip a byte stream as it is produced"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def csv_response(header, rows, filename, compress=False):
+    """
+    Stream rows as a CSV download (filename.csv, or filename.csv.gz if compress).
+    rows may be a generator reading the database; it runs inside the request context.
+    """
+    chunks = csv_chunks(header, rows)
+    if compress:
+        chunks = gzip_chunks(chunks)
+        filename += '.csv.gz'
+        mimetype = 'application/gzip'
+    else:
+        filename += '.csv'
+        mimetype = 'text/csv'
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
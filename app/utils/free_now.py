@@ -0,0 +1,194 @@
+"""
+"Who's free now" index.
+Each worker keeps the sets of users available (and maybe) in every slot from the
+current one through the next FREE_NOW_HOURS hours, plus the users of each class
+and role. A lookup intersects a few small sets in memory.
+
+The index follows the shared availability_changes log like the analytics
+matrix, reloading only the users whose rows changed, but looks at it at most
+every FREE_NOW_POLL_SECONDS so lookups normally touch no database at all. When a
+slot boundary passes, the slots that went by are dropped and the new last slots
+are loaded.
+"""
+import logging
+import threading
+import time
+from sqlalchemy import select
+from app.utils.analytics import ChangeFeed
+from app.utils.slots import current_slot
+
+logger = logging.getLogger(__name__)
+
+# More changed users than this since the last look reloads the whole index
+FULL_RELOAD_USERS = 500
+
+# User names, classes and roles are re-read this often
+USER_REFRESH_SECONDS = 60
+
+
+class FreeNowIndex:
+    """Flask extension mapping the next few hours' slots to sets of available users"""
+
+    def __init__(self, app=None, db=None):
+        self.db = None
+        self.hours = 6
+        self.poll_interval = 1.0
+        self._lock = threading.Lock()
+        self._feed = ChangeFeed()
+        self._reset()
+        if app is not None and db is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.db = db
+        self.hours = app.config.get('FREE_NOW_HOURS', self.hours)
+        self.poll_interval = app.config.get('FREE_NOW_POLL_SECONDS', self.poll_interval)
+        self._reset()
+        app.extensions['free_now'] = self
+
+    def _reset(self):
+        self.window_start = None
+        self.available = {}      # slot_index -> user ids with state 2
+        self.maybe = {}          # slot_index -> user ids with state 1
+        self.users = {}          # user_id -> public user dict
+        self.by_class = {}       # wow_class -> user ids
+        self.by_role = {}        # role -> user ids
+        self._feed.reset()
+        self._loaded_at = 0.0
+        self._polled_at = 0.0
+        self._users_loaded_at = 0.0
+
+    @property
+    def slots(self):
+        return self.hours * 2
+
+    @property
+    def window_end(self):
+        return self.window_start + self.slots - 1
+
+    def covers(self, start_slot, end_slot):
+        """True if the range lies between the current slot and the end of the index"""
+        now = current_slot()
+        return now <= start_slot <= end_slot <= now + self.slots - 1
+
+    # ============= LOADING =============
+
+    def _refresh(self):
+        from app.models.availability import CHANGE_LOG_RETENTION
+        now = current_slot()
+        stale = time.monotonic() - self._loaded_at > CHANGE_LOG_RETENTION.total_seconds() / 2
+        if self.window_start is None or now >= self.window_start + self.slots or stale:
+            self._load_all(now)
+            return
+        if now != self.window_start:
+            self._roll_forward(now)
+
+        if time.monotonic() - self._polled_at >= self.poll_interval:
+            changes = self._feed.pending(self.db.session)
+            self._polled_at = time.monotonic()
+            user_ids = {user_id for _, user_id in changes}
+            if None in user_ids or len(user_ids) > FULL_RELOAD_USERS:
+                self._load_all(now)
+                return
+            if user_ids:
+                self._reload_users(user_ids)
+            self._feed.remember(change_id for change_id, _ in changes)
+
+        if time.monotonic() - self._users_loaded_at > USER_REFRESH_SECONDS:
+            self._load_users()
+
+    def _rows(self, start_slot, end_slot, user_ids=None):
+        from app.models.availability import AvailabilitySlot
+        from app.utils.recurring import template_slots
+        slots_table = AvailabilitySlot.__table__
+        query = select(slots_table.c.user_id, slots_table.c.slot_index, slots_table.c.state).where(
+            slots_table.c.slot_index >= start_slot,
+            slots_table.c.slot_index <= end_slot
+        )
+        if user_ids is not None:
+            query = query.where(slots_table.c.user_id.in_(list(user_ids)))
+        rows = self.db.session.execute(query).all()
+        rows.extend(template_slots(start_slot, end_slot, set(user_ids) if user_ids is not None else None))
+        return rows
+
+    def _add_slots(self, start_slot, end_slot, user_ids=None):
+        for slot_index in range(start_slot, end_slot + 1):
+            self.available.setdefault(slot_index, set())
+            self.maybe.setdefault(slot_index, set())
+        for user_id, slot_index, state in self._rows(start_slot, end_slot, user_ids):
+            if state == 2:
+                self.available[slot_index].add(user_id)
+            elif state == 1:
+                self.maybe[slot_index].add(user_id)
+
+    def _load_all(self, now):
+        started = time.perf_counter()
+        # Read the change ids first: anything committed after this is re-applied later
+        self._reset()
+        self._feed.mark_current(self.db.session)
+        self.window_start = now
+        self._add_slots(self.window_start, self.window_end)
+        self._load_users()
+        self._loaded_at = self._polled_at = time.monotonic()
+        logger.info('Loaded free-now index: %d slots from %d in %.1f ms',
+                    self.slots, now, (time.perf_counter() - started) * 1000)
+
+    def _roll_forward(self, now):
+        """Drop the slots that went by and load the new last ones"""
+        old_end = self.window_end
+        for slot_index in range(self.window_start, now):
+            self.available.pop(slot_index, None)
+            self.maybe.pop(slot_index, None)
+        self.window_start = now
+        self._add_slots(old_end + 1, self.window_end)
+
+    def _reload_users(self, user_ids):
+        for slot_index in range(self.window_start, self.window_end + 1):
+            self.available[slot_index] -= user_ids
+            self.maybe[slot_index] -= user_ids
+        self._add_slots(self.window_start, self.window_end, user_ids)
+
+    def _load_users(self):
+        from app.models.user import User
+        users, by_class, by_role = {}, {}, {}
+        for user in User.query.all():
+            info = {
+                'id': user.id,
+                'character_name': user.character_name,
+                'wow_class': user.wow_class,
+                'roles': user.get_roles(),
+            }
+            users[user.id] = info
+            by_class.setdefault(user.wow_class, set()).add(user.id)
+            for role in info['roles']:
+                by_role.setdefault(role, set()).add(user.id)
+        self.users, self.by_class, self.by_role = users, by_class, by_role
+        self._users_loaded_at = time.monotonic()
+
+    # ============= QUERIES =============
+
+    def free(self, start_slot, end_slot, wow_class=None, role=None):
+        """
+        Users free for the whole range (which covers() must accept).
+
+        Returns:
+            tuple: (available, maybe) lists of user dicts sorted by name; available users
+                   have state 2 in every slot, maybe users at least state 1 in every slot
+        """
+        with self._lock:
+            self._refresh()
+            # A slot boundary may have passed since covers(): those slots are gone
+            slots = range(start_slot, end_slot + 1)
+            available = set.intersection(*(self.available.get(s, set()) for s in slots))
+            free = set.intersection(*(self.available.get(s, set()) | self.maybe.get(s, set()) for s in slots))
+            if free - self.users.keys():
+                self._load_users()  # signed up since the last user refresh
+            if wow_class:
+                free &= self.by_class.get(wow_class, set())
+            if role:
+                free &= self.by_role.get(role, set())
+            users = sorted((self.users[u] for u in free if u in self.users), key=lambda u: u['character_name'])
+            return (
+                [user for user in users if user['id'] in available],
+                [user for user in users if user['id'] not in available]
+            )
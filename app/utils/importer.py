@@ -0,0 +1,357 @@
+"""
+Bulk import of users and availability spans (guild migrations).
+
+Input is CSV or JSON lines. One streaming pass validates every record and keeps
+only the spans; nothing is written if any record is invalid. Loading then
+inserts the new users and the expanded slots in bulk (COPY on PostgreSQL,
+executemany elsewhere) and recomputes the aggregates once for the imported range.
+
+For each user with spans in the file, the import replaces that user's
+availability between the earliest and latest slot of the file. Existing users
+keep their class, roles and timezone.
+
+CSV columns (header names are case-insensitive; the availability export format
+is accepted as is):
+    character_name, class, roles, timezone, and a span given as either
+    start_slot + slots or start + end (ISO 8601 UTC), with state
+    available / maybe / unavailable (or 2 / 1 / 0).
+    Rows without a span only declare the user.
+
+JSON lines: the same fields per line, or one line per user with a "spans" list
+of {start_slot, slots | start, end, state} objects and "roles" as a list.
+"""
+import csv
+import io
+import json
+import secrets
+from datetime import datetime, timezone
+from sqlalchemy import insert, select
+from app import db
+from app.models.user import User
+from app.models.availability import (
+    AvailabilitySlot, IN_CHUNK_SIZE, rebuild_aggregate_range, refresh_aggregate_slots, bump_week_versions,
+    log_availability_change, write_pending_slots
+)
+from app.utils.archive import archived_weeks
+from app.utils.recurring import materialize_weeks
+from app.utils.slots import SLOT_SECONDS, WEEK_SLOTS, week_start_of
+
+# Stop collecting errors after this many
+MAX_IMPORT_ERRORS = 50
+
+# Longest range one file may cover, in slots (one year)
+MAX_IMPORT_SLOTS = 48 * 366
+
+# Rows per executemany / COPY batch
+LOAD_CHUNK_SIZE = 5000
+
+STATES = {'available': 2, 'maybe': 1, 'unavailable': 0, '2': 2, '1': 1, '0': 0}
+
+# Header spellings -> field names
+CSV_FIELDS = {
+    'character_name': 'character_name', 'character': 'character_name', 'name': 'character_name',
+    'class': 'wow_class', 'wow_class': 'wow_class',
+    'roles': 'roles', 'timezone': 'timezone',
+    'start_slot': 'start_slot', 'slots': 'slots', 'end_slot': 'end_slot',
+    'start': 'start', 'start_(utc)': 'start', 'end': 'end', 'end_(utc)': 'end',
+    'state': 'state',
+}
+
+
+class ImportPlan:
+    """Validated contents of an import file"""
+
+    def __init__(self):
+        self.users = {}    # lowercase name -> {'character_name', 'wow_class', 'roles', 'timezone'}
+        self.spans = {}    # lowercase name -> [(start_slot, length, state)] in file order
+        self.errors = []
+        self.records = 0
+        self.start_slot = None
+        self.end_slot = None
+
+    def error(self, line, message):
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append(f'Line {line}: {message}')
+
+    def summary(self):
+        return {
+            'records': self.records,
+            'users': len(self.users),
+            'spans': sum(len(spans) for spans in self.spans.values()),
+            'start_slot': self.start_slot,
+            'end_slot': self.end_slot,
+        }
+
+
+def parse_import(lines, file_format, classes, roles):
+    """
+    Validate an import in one pass over its lines.
+
+    Args:
+        lines: Iterable of text lines (e.g. a file opened in text mode)
+        file_format: 'csv' or 'jsonl'
+        classes: Valid class names (WOW_CLASSES)
+        roles: Valid role names (ROLES)
+
+    Returns:
+        ImportPlan: check plan.errors before loading it
+    """
+    plan = ImportPlan()
+    records = _csv_records(lines) if file_format == 'csv' else _jsonl_records(lines)
+    for line, record in records:
+        plan.records += 1
+        try:
+            _add_record(plan, record, classes, roles)
+        except ValueError as e:
+            plan.error(line, str(e))
+    if plan.start_slot is not None and plan.end_slot - plan.start_slot + 1 > MAX_IMPORT_SLOTS:
+        plan.errors.append(f'The file covers more than {MAX_IMPORT_SLOTS} slots')
+    if not plan.users and not plan.errors:
+        plan.errors.append('The file has no records')
+    return plan
+
+
+def _csv_records(lines):
+    reader = csv.reader(lines)
+    header = next(reader, None)
+    if header is None:
+        return
+    fields = [CSV_FIELDS.get(name.strip().lower().replace(' ', '_')) for name in header]
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        record = {field: value.strip() for field, value in zip(fields, row) if field and value.strip()}
+        yield reader.line_num, record
+
+
+def _jsonl_records(lines):
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, record
+
+
+def _add_record(plan, record, classes, roles):
+    if not isinstance(record, dict):
+        raise ValueError('not a JSON object')
+    name = str(record.get('character_name') or '').strip()
+    if not name or len(name) > 64:
+        raise ValueError('character_name is required (at most 64 characters)')
+    key = User.normalize_name(name)
+
+    user = plan.users.get(key)
+    if user is None:
+        user = plan.users[key] = {'character_name': name, 'wow_class': None, 'roles': [], 'timezone': None}
+    wow_class = record.get('wow_class') or record.get('class')
+    if wow_class:
+        if wow_class not in classes:
+            raise ValueError(f'unknown class {wow_class!r}')
+        user['wow_class'] = wow_class
+    record_roles = record.get('roles')
+    if isinstance(record_roles, str):
+        record_roles = [role.strip() for role in record_roles.replace(';', ',').split(',') if role.strip()]
+    if record_roles:
+        if not isinstance(record_roles, list):
+            raise ValueError('roles must be a list')
+        unknown = [role for role in record_roles if role not in roles]
+        if unknown:
+            raise ValueError(f'unknown roles {unknown}')
+        user['roles'] = sorted(set(user['roles']) | set(record_roles))
+    if record.get('timezone'):
+        user['timezone'] = str(record['timezone'])[:64]
+
+    spans = record['spans'] if isinstance(record.get('spans'), list) else [record]
+    for span in spans:
+        parsed = _parse_span(span)
+        if parsed is None:
+            continue
+        start, length, state = parsed
+        plan.spans.setdefault(key, []).append(parsed)
+        end = start + length - 1
+        plan.start_slot = start if plan.start_slot is None else min(plan.start_slot, start)
+        plan.end_slot = end if plan.end_slot is None else max(plan.end_slot, end)
+
+
+def _parse_span(span):
+    """(start_slot, length, state), or None if the record has no span"""
+    if not isinstance(span, dict):
+        raise ValueError('spans must be objects')
+    if span.get('start_slot') is not None:
+        start = _integer(span['start_slot'], 'start_slot')
+        if span.get('slots') is not None:
+            length = _integer(span['slots'], 'slots')
+        elif span.get('end_slot') is not None:
+            length = _integer(span['end_slot'], 'end_slot') - start + 1
+        else:
+            raise ValueError('start_slot needs slots or end_slot')
+    elif span.get('start') or span.get('end'):
+        start = _slot_from_time(span.get('start'), 'start')
+        length = _slot_from_time(span.get('end'), 'end') - start
+    else:
+        return None
+
+    if length < 1 or length > MAX_IMPORT_SLOTS:
+        raise ValueError('span must cover between 1 slot and a year')
+    state = STATES.get(str(span.get('state', '')).strip().lower())
+    if state is None:
+        raise ValueError('state must be available, maybe or unavailable')
+    return start, length, state
+
+
+def _integer(value, field):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be an integer')
+
+
+def _slot_from_time(value, field):
+    """Slot index of an ISO 8601 time on a half-hour boundary (UTC if no offset is given)"""
+    try:
+        moment = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{field} must be an ISO 8601 time')
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    timestamp = int(moment.timestamp())
+    if timestamp % SLOT_SECONDS:
+        raise ValueError(f'{field} must be on a half-hour boundary')
+    return timestamp // SLOT_SECONDS
+
+
+def load_import(plan, password_hash=None):
+    """
+    Write a validated plan with bulk statements. Runs inside a write (the caller commits).
+
+    Args:
+        plan: ImportPlan without errors
+        password_hash: Password hash for new users (None: a random, unusable password)
+
+    Returns:
+        dict: Counts of created users and slots, and the rebuilt range
+    """
+    users_table = User.__table__
+    slots_table = AvailabilitySlot.__table__
+    now = datetime.utcnow()
+
+    if plan.spans and archived_weeks(range(week_start_of(plan.start_slot), plan.end_slot + 1, WEEK_SLOTS)):
+        raise ValueError('The file covers archived weeks, which are read-only')
+
+    # New users, with bulk inserts
+    user_ids = {}
+    keys = list(plan.users)
+    for chunk in _batches(keys, IN_CHUNK_SIZE):
+        user_ids.update(db.session.execute(
+            select(users_table.c.character_name_lower, users_table.c.id)
+            .where(users_table.c.character_name_lower.in_(chunk))
+        ).all())
+    new_users = [plan.users[key] for key in keys if key not in user_ids]
+    missing_class = [user['character_name'] for user in new_users if not user['wow_class']]
+    if missing_class:
+        raise ValueError(f'New users need a class: {", ".join(missing_class[:10])}')
+    if new_users:
+        password_hash = password_hash or f'!{secrets.token_hex(16)}'
+        for chunk in _batches(new_users):
+            db.session.execute(insert(users_table), [{
+                'character_name': user['character_name'],
+                'character_name_lower': User.normalize_name(user['character_name']),
+                'wow_class': user['wow_class'],
+                'roles': json.dumps(user['roles']) if user['roles'] else None,
+                'password_hash': password_hash,
+                'timezone': user['timezone'],
+                'is_superuser': False,
+                'is_admin': False,
+                'created_at': now,
+            } for user in chunk])
+        for chunk in _batches([User.normalize_name(user['character_name']) for user in new_users], IN_CHUNK_SIZE):
+            user_ids.update(db.session.execute(
+                select(users_table.c.character_name_lower, users_table.c.id)
+                .where(users_table.c.character_name_lower.in_(chunk))
+            ).all())
+
+    # Replace the imported users' availability in the file's range
+    slot_count = 0
+    if plan.spans:
+        touched = [user_ids[key] for key in plan.spans]
+        # Saves staged before the import must not land on top of it later
+        write_pending_slots(touched)
+        # Template weeks become rows first; the file's range replaces them like any other rows
+        materialized = materialize_weeks(touched, range(week_start_of(plan.start_slot), plan.end_slot + 1, WEEK_SLOTS))
+        refresh_aggregate_slots([s for s in materialized if s < plan.start_slot or s > plan.end_slot])
+        for chunk in _batches(touched, IN_CHUNK_SIZE):
+            db.session.execute(slots_table.delete().where(
+                slots_table.c.user_id.in_(chunk),
+                slots_table.c.slot_index >= plan.start_slot,
+                slots_table.c.slot_index <= plan.end_slot
+            ))
+        slot_count = _insert_slots(_slot_rows(plan, user_ids, now))
+        rebuild_aggregate_range(plan.start_slot, plan.end_slot)
+        weeks = range(week_start_of(plan.start_slot), plan.end_slot + 1, WEEK_SLOTS)
+        for user_id in touched:
+            bump_week_versions(user_id, weeks)
+        log_availability_change(db.session)
+
+    return {
+        'users_created': len(new_users),
+        'users_updated': len(plan.spans),
+        'slots': slot_count,
+        'start_slot': plan.start_slot,
+        'end_slot': plan.end_slot,
+    }
+
+
+def _slot_rows(plan, user_ids, now):
+    """(user_id, slot_index, state, updated_at) rows, one user at a time; later spans win"""
+    for key, spans in plan.spans.items():
+        states = {}
+        for start, length, state in spans:
+            for slot_index in range(start, start + length):
+                states[slot_index] = state
+        user_id = user_ids[key]
+        for slot_index in sorted(states):
+            if states[slot_index]:
+                yield user_id, slot_index, states[slot_index], now
+
+
+def _batches(rows, size=LOAD_CHUNK_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert_slots(rows):
+    """Bulk insert slot rows with COPY on PostgreSQL, executemany elsewhere"""
+    connection = db.session.connection()
+    count = 0
+    if connection.dialect.name == 'postgresql':
+        copy_sql = (f'COPY {AvailabilitySlot.__tablename__} (user_id, slot_index, state, updated_at) '
+                    'FROM STDIN WITH (FORMAT csv)')
+        cursor = connection.connection.cursor()
+        try:
+            for batch in _batches(rows):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(copy_sql, buffer)
+                count += len(batch)
+        finally:
+            cursor.close()
+        return count
+
+    for batch in _batches(rows):
+        db.session.execute(insert(AvailabilitySlot.__table__), [
+            {'user_id': user_id, 'slot_index': slot_index, 'state': state, 'updated_at': updated_at}
+            for user_id, slot_index, state, updated_at in batch
+        ])
+        count += len(batch)
+    return count
@@ -0,0 +1,259 @@
+"""
+Request-level performance instrumentation.
+Records per-endpoint latency histograms plus the number and total time of SQL
+statements issued during each request, and logs slow requests and slow queries.
+
+Metrics are kept in memory per worker process; each gunicorn worker reports
+its own numbers (the `pid` is included in every export).
+"""
+import logging
+import os
+import threading
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Cumulative-style histogram with fixed bucket bounds"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket is +Inf
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs including +Inf"""
+        running = 0
+        result = []
+        for bound, count in zip(list(self.bounds) + [float('inf')], self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it"""
+        if not self.total:
+            return 0
+        rank = q * self.total
+        for bound, running in self.cumulative():
+            if running >= rank:
+                return self.max if bound == float('inf') else bound
+        return self.max
+
+
+class EndpointStats:
+    """Aggregated measurements for one endpoint"""
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = 0.0
+        self.errors = 0
+        self.slow = 0
+
+    def to_dict(self):
+        count = self.latency.total or 1
+        return {
+            'requests': self.latency.total,
+            'errors': self.errors,
+            'slow_requests': self.slow,
+            'avg_ms': round(self.latency.sum / count * 1000, 2),
+            'p50_ms': round(self.latency.quantile(0.5) * 1000, 2),
+            'p95_ms': round(self.latency.quantile(0.95) * 1000, 2),
+            'max_ms': round(self.latency.max * 1000, 2),
+            'avg_queries': round(self.queries.sum / count, 2),
+            'max_queries': self.queries.max,
+            'avg_query_ms': round(self.query_seconds / count * 1000, 2),
+        }
+
+
+class RequestMetrics:
+    """Flask extension that times requests and counts SQL statements per request"""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.slow_request_seconds = 1.0
+        self.slow_query_seconds = 0.25
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._slow_queries = 0
+        self._background_queries = 0
+        self._started_at = time.time()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register request hooks and SQLAlchemy engine listeners"""
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.slow_request_seconds = app.config.get('SLOW_REQUEST_MS', 1000) / 1000.0
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 250) / 1000.0
+        app.extensions['request_metrics'] = self
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        # Listen on the Engine class so every engine (primary or otherwise) is covered
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        if self not in _active_metrics:
+            _active_metrics.append(self)
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_query_count = 0
+        g._metrics_query_seconds = 0.0
+
+    def _after_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        query_count = g.pop('_metrics_query_count', 0)
+        query_seconds = g.pop('_metrics_query_seconds', 0.0)
+        endpoint = request.endpoint or 'unmatched'
+        slow = elapsed >= self.slow_request_seconds
+
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, EndpointStats())
+            stats.latency.observe(elapsed)
+            stats.queries.observe(query_count)
+            stats.query_seconds += query_seconds
+            if response.status_code >= 500:
+                stats.errors += 1
+            if slow:
+                stats.slow += 1
+
+        if slow:
+            logger.warning(
+                'Slow request: %s %s (%s) took %.0f ms with %d queries (%.0f ms in SQL)',
+                request.method, request.path, endpoint, elapsed * 1000,
+                query_count, query_seconds * 1000
+            )
+        return response
+
+    def record_query(self, statement, seconds):
+        """Attribute one SQL statement to the current request"""
+        if has_request_context() and '_metrics_query_count' in g:
+            g._metrics_query_count += 1
+            g._metrics_query_seconds += seconds
+            where = request.endpoint
+        else:
+            with self._lock:
+                self._background_queries += 1
+            where = 'background'
+
+        if seconds >= self.slow_query_seconds:
+            with self._lock:
+                self._slow_queries += 1
+            logger.warning(
+                'Slow query (%.0f ms, %s): %s',
+                seconds * 1000, where, ' '.join(statement.split())[:500]
+            )
+
+    def snapshot(self):
+        """JSON-friendly copy of the current measurements"""
+        with self._lock:
+            endpoints = {name: stats.to_dict() for name, stats in self._endpoints.items()}
+            return {
+                'pid': os.getpid(),
+                'uptime_seconds': round(time.time() - self._started_at, 1),
+                'slow_queries': self._slow_queries,
+                'background_queries': self._background_queries,
+                'endpoints': endpoints,
+            }
+
+    def prometheus(self):
+        """Render the measurements in the Prometheus text exposition format"""
+        pid = os.getpid()
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def histogram_lines(name, endpoint, hist):
+            labels = f'endpoint="{endpoint}",pid="{pid}"'
+            for bound, running in hist.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {running}')
+            lines.append(f'{name}_sum{{{labels}}} {hist.sum}')
+            lines.append(f'{name}_count{{{labels}}} {hist.total}')
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+            header('scheduler_request_duration_seconds', 'histogram', 'Request latency by endpoint')
+            for endpoint, stats in endpoints:
+                histogram_lines('scheduler_request_duration_seconds', endpoint, stats.latency)
+
+            header('scheduler_request_queries', 'histogram', 'SQL statements issued per request')
+            for endpoint, stats in endpoints:
+                histogram_lines('scheduler_request_queries', endpoint, stats.queries)
+
+            header('scheduler_request_query_seconds_total', 'counter', 'Time spent in SQL by endpoint')
+            for endpoint, stats in endpoints:
+                lines.append(
+                    f'scheduler_request_query_seconds_total{{endpoint="{endpoint}",pid="{pid}"}} {stats.query_seconds}'
+                )
+
+            header('scheduler_request_errors_total', 'counter', 'Responses with a 5xx status')
+            for endpoint, stats in endpoints:
+                lines.append(f'scheduler_request_errors_total{{endpoint="{endpoint}",pid="{pid}"}} {stats.errors}')
+
+            header('scheduler_slow_requests_total', 'counter', 'Requests slower than SLOW_REQUEST_MS')
+            for endpoint, stats in endpoints:
+                lines.append(f'scheduler_slow_requests_total{{endpoint="{endpoint}",pid="{pid}"}} {stats.slow}')
+
+            header('scheduler_slow_queries_total', 'counter', 'SQL statements slower than SLOW_QUERY_MS')
+            lines.append(f'scheduler_slow_queries_total{{pid="{pid}"}} {self._slow_queries}')
+
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        """Clear all measurements"""
+        with self._lock:
+            self._endpoints = {}
+            self._slow_queries = 0
+            self._background_queries = 0
+            self._started_at = time.time()
+
+
+# Extensions that receive engine events (normally just the app-wide instance)
+_active_metrics = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_metrics_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    for metrics in _active_metrics:
+        metrics.record_query(statement, elapsed)
@@ -0,0 +1,240 @@
+"""
+Lightweight versioned schema migrations.
+The database records a single schema version number. Workers only compare that
+number at startup; the actual schema changes are applied once by `migrate.py`.
+
+To add a migration, append a function decorated with @migration(N, description)
+where N is the next version number. Migrations receive a SQLAlchemy connection
+inside a transaction and should be written so that re-running them is harmless.
+"""
+from collections import namedtuple
+from sqlalchemy import MetaData, Table, Column, Integer, DateTime, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+from datetime import datetime
+from app import db
+
+Migration = namedtuple('Migration', ['version', 'description', 'upgrade'])
+
+MIGRATIONS = []
+
+schema_metadata = MetaData()
+schema_version_table = Table(
+    'schema_version', schema_metadata,
+    Column('version', Integer, nullable=False),
+    Column('applied_at', DateTime, nullable=False, default=datetime.utcnow)
+)
+
+
+class MigrationError(Exception):
+    """Raised when a migration cannot be applied or the schema is out of date"""
+
+
+def migration(version, description):
+    """Register a migration function for the given schema version"""
+    def decorator(fn):
+        if MIGRATIONS and version != MIGRATIONS[-1].version + 1:
+            raise ValueError(f'Migration {version} registered out of order')
+        MIGRATIONS.append(Migration(version, description, fn))
+        return fn
+    return decorator
+
+
+def head_version():
+    """Schema version the current code expects"""
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def get_schema_version(connection):
+    """Return the recorded schema version, or 0 if none has been recorded"""
+    try:
+        return connection.execute(
+            select(schema_version_table.c.version).order_by(schema_version_table.c.version.desc()).limit(1)
+        ).scalar() or 0
+    except DBAPIError:
+        # Table does not exist yet. Roll back so PostgreSQL can keep using the connection.
+        connection.rollback()
+        return 0
+
+
+def _set_schema_version(connection, version):
+    connection.execute(schema_version_table.delete())
+    connection.execute(schema_version_table.insert().values(version=version, applied_at=datetime.utcnow()))
+
+
+def pending_migrations(current_version):
+    """Migrations newer than current_version, in order"""
+    return [m for m in MIGRATIONS if m.version > current_version]
+
+
+def upgrade(engine=None, log=print):
+    """
+    Bring the database up to head_version().
+    A brand new database gets the full current schema in one step; an existing
+    database runs each pending migration in its own transaction.
+
+    Returns:
+        tuple: (version before, version after)
+    """
+    engine = engine or db.engine
+    schema_metadata.create_all(engine)
+
+    with engine.connect() as connection:
+        current = get_schema_version(connection)
+
+    target = head_version()
+    if current >= target:
+        return current, current
+
+    existing_tables = set(inspect(engine).get_table_names()) - {'schema_version'}
+    if current == 0 and not existing_tables:
+        log(f'Creating schema at version {target}')
+        with engine.begin() as connection:
+            db.metadata.create_all(connection)
+            _set_schema_version(connection, target)
+        return current, target
+
+    for m in pending_migrations(current):
+        log(f'Applying migration {m.version}: {m.description}')
+        with engine.begin() as connection:
+            m.upgrade(connection)
+            _set_schema_version(connection, m.version)
+
+    return current, target
+
+
+def check_schema(app):
+    """
+    Startup check: compare the recorded schema version with head_version().
+    Applies pending migrations when AUTO_MIGRATE is set, otherwise refuses to start
+    on an outdated schema.
+    """
+    with db.engine.connect() as connection:
+        current = get_schema_version(connection)
+
+    target = head_version()
+    if current == target:
+        return
+
+    if current > target:
+        app.logger.warning(
+            'Database schema version %s is newer than this code (%s)', current, target
+        )
+        return
+
+    if app.config.get('AUTO_MIGRATE'):
+        upgrade(log=app.logger.info)
+        return
+
+    raise MigrationError(
+        f'Database schema is at version {current} but the code expects {target}. '
+        f'Run "python migrate.py" before starting the application.'
+    )
+
+
+# ============= HELPERS =============
+
+def column_exists(connection, table_name, column_name):
+    """Check whether a column exists on a table"""
+    return column_name in [c['name'] for c in inspect(connection).get_columns(table_name)]
+
+
+def index_exists(connection, table_name, index_name):
+    """Check whether an index exists on a table"""
+    return index_name in [i['name'] for i in inspect(connection).get_indexes(table_name)]
+
+
+def create_missing_tables(connection, *tables):
+    """Create the given model tables if they do not exist yet"""
+    for table in tables:
+        table.create(connection, checkfirst=True)
+
+
+# ============= MIGRATIONS =============
+
+@migration(1, 'Baseline schema: users, availability, aggregates and groups')
+def baseline(connection):
+    """Replaces db.create_all() at startup and migrate_groups.py"""
+    from app.models.user import User
+    from app.models.availability import AvailabilitySlot, AggregateSlotCount
+    from app.models.group import Group, GroupMembership, GroupInvite
+    create_missing_tables(
+        connection,
+        User.__table__, AvailabilitySlot.__table__, AggregateSlotCount.__table__,
+        Group.__table__, GroupMembership.__table__, GroupInvite.__table__
+    )
+
+
+@migration(2, 'Indexed lowercase character name (users.character_name_lower)')
+def character_name_lower(connection):
+    """Replaces migrate_character_names.py"""
+    from app.models.user import User
+
+    if not column_exists(connection, 'users', 'character_name_lower'):
+        duplicates = connection.execute(text(
+            "SELECT lower(character_name) FROM users "
+            "GROUP BY lower(character_name) HAVING count(*) > 1"
+        )).scalars().all()
+        if duplicates:
+            raise MigrationError(
+                'Character names differ only by case, rename them first: ' + ', '.join(duplicates)
+            )
+        connection.execute(text("ALTER TABLE users ADD COLUMN character_name_lower VARCHAR(64)"))
+
+    # Backfill in Python so the normalization matches User.normalize_name
+    rows = connection.execute(text(
+        "SELECT id, character_name FROM users WHERE character_name_lower IS NULL"
+    )).fetchall()
+    for user_id, character_name in rows:
+        connection.execute(
+            text("UPDATE users SET character_name_lower = :name WHERE id = :id"),
+            {'name': User.normalize_name(character_name), 'id': user_id}
+        )
+
+    if not index_exists(connection, 'users', 'ix_users_character_name_lower'):
+        connection.execute(text(
+            "CREATE UNIQUE INDEX ix_users_character_name_lower ON users (character_name_lower)"
+        ))
+
+
+@migration(3, 'Availability change log (availability_changes)')
+def availability_changes(connection):
+    """Shared version counter for in-memory availability caches"""
+    from app.models.availability import AvailabilityChange
+    create_missing_tables(connection, AvailabilityChange.__table__)
+
+
+@migration(4, 'Compressed archive of past weeks (availability_archive_weeks)')
+def availability_archive_weeks(connection):
+    """Cold storage for completed weeks, see app/utils/archive.py"""
+    from app.models.availability import ArchivedWeek
+    create_missing_tables(connection, ArchivedWeek.__table__)
+
+
+@migration(5, 'Recurring weekly templates and week overrides (availability_templates, availability_weeks)')
+def availability_templates(connection):
+    """Per-user weekly templates, see app/utils/recurring.py"""
+    from app.models.availability import AvailabilityTemplate, AvailabilityWeek
+    create_missing_tables(connection, AvailabilityTemplate.__table__, AvailabilityWeek.__table__)
+
+
+@migration(6, 'Per-group availability counts (group_slot_counts)')
+def group_slot_counts(connection):
+    """Group heatmap counts kept current on every write, backfilled here"""
+    from app.models.availability import recount_group_counts
+    from app.models.group import GroupSlotCount
+    create_missing_tables(connection, GroupSlotCount.__table__)
+    recount_group_counts(connection)
+
+
+@migration(7, 'Per-user week versions for diff saves (availability_versions)')
+def availability_versions(connection):
+    """Optimistic concurrency for the availability editor"""
+    from app.models.availability import AvailabilityVersion
+    create_missing_tables(connection, AvailabilityVersion.__table__)
+
+
+@migration(8, 'Staged write-behind saves (availability_pending)')
+def availability_pending(connection):
+    """Saves accepted by the write-behind buffer, visible to every worker until applied"""
+    from app.models.availability import PendingSlot
+    create_missing_tables(connection, PendingSlot.__table__)
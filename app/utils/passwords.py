@@ -0,0 +1,93 @@
+"""
+Host-wide bound on password hashing.
+At most PASSWORD_HASH_WORKERS hashes run at once across all workers on the
+host, so a burst of logins cannot pin every gunicorn worker on CPU. Up to
+PASSWORD_HASH_QUEUE_LIMIT more callers wait for a turn; callers beyond that fail
+fast with PasswordHasherBusy. A request holds a gunicorn worker while it waits, so
+it waits at most PASSWORD_HASH_REQUEST_TIMEOUT seconds (a fraction of a second);
+command line tools and other work outside a request wait up to
+PASSWORD_HASH_TIMEOUT seconds. A hash that has started always runs to completion
+in the caller's own thread; the timeouts only bound the wait before it.
+
+Turns are flock'd slot files in CONCURRENCY_LOCK_DIR, as for the concurrency
+classes, so a crashed worker releases its turn.
+"""
+import os
+from functools import lru_cache
+from flask import has_request_context
+from werkzeug.security import generate_password_hash, check_password_hash
+from app.utils.concurrency import SlotPool
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a turn to hash didn't come in time"""
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    """
+    Expand a werkzeug method string to the prefix stored in hashes.
+    For example 'scrypt' is stored as 'scrypt:32768:8:1'.
+    """
+    return generate_password_hash('', method=method, salt_length=1).split('$', 1)[0]
+
+
+class PasswordHasher:
+    """Flask extension that bounds concurrent password hashing per host"""
+
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.salt_length = 16
+        self.max_workers = 1
+        self.queue_limit = 4
+        self.timeout = 5.0
+        self.request_timeout = 0.25
+        self.directory = None
+        self._running = None
+        self._admitted = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read hashing parameters and limits from the app config"""
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.salt_length = app.config.get('PASSWORD_HASH_SALT_LENGTH', self.salt_length)
+        self.max_workers = max(1, app.config.get('PASSWORD_HASH_WORKERS', self.max_workers))
+        self.queue_limit = max(0, app.config.get('PASSWORD_HASH_QUEUE_LIMIT', self.queue_limit))
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self.request_timeout = min(self.timeout, app.config.get('PASSWORD_HASH_REQUEST_TIMEOUT', self.request_timeout))
+        self.directory = app.config.get('CONCURRENCY_LOCK_DIR') or os.path.join(app.instance_path, 'concurrency')
+        os.makedirs(self.directory, exist_ok=True)
+        # One turn per running hash, and one admission per running or waiting hash
+        self._running = SlotPool('password-hash', self.max_workers, self.directory)
+        self._admitted = SlotPool('password-hash-queue', self.max_workers + self.queue_limit, self.directory)
+        app.extensions['password_hasher'] = self
+
+    def _run(self, fn, *args):
+        """Run fn once a host-wide turn is free, failing fast when the queue is full"""
+        admission = self._admitted.acquire(0)
+        if admission is None:
+            raise PasswordHasherBusy('Password hashing queue is full')
+        try:
+            # Requests park a worker while waiting, so they only wait briefly
+            turn = self._running.acquire(self.request_timeout if has_request_context() else self.timeout)
+            if turn is None:
+                raise PasswordHasherBusy('Timed out waiting to hash a password')
+            try:
+                return fn(*args)
+            finally:
+                self._running.release(turn)
+        finally:
+            self._admitted.release(admission)
+
+    def hash(self, password):
+        """Hash a password with the configured method"""
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        """Check a password against a stored hash"""
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if a stored hash was made with different parameters than configured"""
+        return pwhash.split('$', 1)[0] != _method_prefix(self.method)
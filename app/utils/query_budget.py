@@ -0,0 +1,104 @@
+"""
+Query budget helpers for catching N+1 regressions.
+Counts the SQL statements issued through an engine so tests and benchmarks can
+assert that an endpoint issues a fixed number of queries regardless of how much
+data is in the database.
+
+Example:
+    with assert_query_budget(4):
+        client.get('/api/availability/find-matches?start_slot=1&end_slot=336')
+
+    assert_constant_queries(
+        setup=lambda n: seed_users(n),
+        run=lambda: client.get('/api/groups/1/schedule-data?start_slot=1&end_slot=336'),
+        scales=(5, 50, 500)
+    )
+"""
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import db
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a block of code issues more queries than its budget"""
+
+
+class QueryCounter:
+    """Records SQL statements executed on an engine by the current thread"""
+
+    def __init__(self, engine=None, all_threads=False):
+        self.engine = engine
+        self.all_threads = all_threads
+        self.statements = []
+        self._thread_id = None
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _listener(self, conn, cursor, statement, parameters, context, executemany):
+        if self.all_threads or threading.get_ident() == self._thread_id:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        self.engine = self.engine or db.engine
+        self._thread_id = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._listener)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, 'before_cursor_execute', self._listener)
+        return False
+
+    def report(self):
+        """Numbered list of the recorded statements, for failure messages"""
+        return '\n'.join(
+            f'{i}. {" ".join(statement.split())}' for i, statement in enumerate(self.statements, 1)
+        )
+
+
+def count_queries(engine=None, all_threads=False):
+    """Context manager yielding a QueryCounter for the enclosed block"""
+    return QueryCounter(engine=engine, all_threads=all_threads)
+
+
+@contextmanager
+def assert_query_budget(budget, engine=None):
+    """Fail if the enclosed block issues more than `budget` SQL statements"""
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(
+            f'Expected at most {budget} queries, got {counter.count}:\n{counter.report()}'
+        )
+
+
+def assert_constant_queries(setup, run, scales=(5, 50, 500), budget=None, engine=None):
+    """
+    Check that `run` issues the same number of queries at every data scale.
+
+    Args:
+        setup: Callable taking a scale (e.g. number of users) that grows the data set
+        run: Callable exercising the code under test (e.g. a test client request)
+        scales: Increasing data sizes to try
+        budget: Optional upper bound on the query count at every scale
+        engine: Engine to watch (defaults to db.engine)
+
+    Returns:
+        dict: scale -> number of queries issued by `run`
+    """
+    counts = {}
+    for scale in scales:
+        setup(scale)
+        with count_queries(engine) as counter:
+            run()
+        counts[scale] = counter.count
+        if budget is not None and counter.count > budget:
+            raise QueryBudgetExceeded(
+                f'Expected at most {budget} queries at scale {scale}, got {counter.count}:\n{counter.report()}'
+            )
+
+    if len(set(counts.values())) > 1:
+        raise QueryBudgetExceeded(f'Query count grows with data size: {counts}')
+    return counts
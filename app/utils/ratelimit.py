@@ -0,0 +1,146 @@
+"""
+Rate limiting helpers for Flask-Limiter.
+
+- Requests are keyed by the logged-in user, so guild members behind one NAT do
+  not share a bucket. Anonymous requests (login, signup) fall back to the IP.
+- Expensive endpoints are charged by cost instead of one hit per request:
+  saves by the number of days of slots written, range reads by the number of
+  weeks requested.
+- SQLiteStorage keeps the counters in a local SQLite file, so every gunicorn
+  worker on the host sees the same counts without running Redis.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app, request
+from flask_login import current_user
+from flask_limiter.util import get_remote_address
+from limits.storage import Storage
+
+# Cost units: one day of slots written, one week of range read
+SLOTS_PER_WRITE_UNIT = 48
+SLOTS_PER_READ_UNIT = 336
+
+# Cost of a range read without start_slot/end_slot (about a year of slots)
+UNBOUNDED_READ_COST = 52
+
+# Expired counters are deleted every this many increments (per process)
+PRUNE_EVERY = 1000
+
+
+def rate_limit_key():
+    """The current user's id, or the client IP for anonymous requests"""
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    return f'ip:{get_remote_address()}'
+
+
+def slot_write_limit():
+    return current_app.config['RATELIMIT_SLOT_WRITES']
+
+
+def range_read_limit():
+    return current_app.config['RATELIMIT_RANGE_READS']
+
+
+def slot_write_cost():
+    """Days of slots in a bulk save body (at least 1)"""
+    data = request.get_json(silent=True) or {}
+    slots = data.get('slots') if isinstance(data, dict) else None
+    return max(1, math.ceil(len(slots or ()) / SLOTS_PER_WRITE_UNIT))
+
+
+def range_read_cost():
+    """Weeks spanned by start_slot/end_slot (at least 1)"""
+    start_slot = request.args.get('start_slot', type=int)
+    end_slot = request.args.get('end_slot', type=int)
+    if start_slot is None or end_slot is None:
+        return UNBOUNDED_READ_COST
+    return max(1, math.ceil((end_slot - start_slot + 1) / SLOTS_PER_READ_UNIT))
+
+
+class SQLiteStorage(Storage):
+    """
+    Fixed-window counters in a SQLite file: sqlite:///relative/path or sqlite:////absolute/path.
+    Each increment is a single upsert, so concurrent workers never lose hits.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        self.path = uri[len('sqlite:///'):] if uri else ''
+        if not self.path:
+            raise ValueError('SQLite rate limit storage needs a file path, e.g. sqlite:////tmp/ratelimit.db')
+        self.timeout = float(options.get('timeout', 5))
+        self._local = threading.local()
+        self._increments = 0
+        self._created = False
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        """A connection per thread, reopened after a fork"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            return connection
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None,
+                                     check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        if not self._created:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS rate_limits '
+                '(key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires REAL NOT NULL)'
+            )
+            self._created = True
+        self._local.connection = connection
+        self._local.pid = os.getpid()
+        return connection
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        # An expired counter restarts at amount with a new window
+        value, = self._connection().execute(
+            'INSERT INTO rate_limits (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'value = CASE WHEN expires <= ? THEN excluded.value ELSE value + excluded.value END, '
+            'expires = CASE WHEN expires <= ? THEN excluded.expires ELSE expires END '
+            'RETURNING value',
+            (key, amount, now + expiry, now, now)
+        ).fetchone()
+        self._increments += 1
+        if self._increments % PRUNE_EVERY == 0:
+            self._connection().execute('DELETE FROM rate_limits WHERE expires <= ?', (now,))
+        return value
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM rate_limits WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute(
+            'SELECT expires FROM rate_limits WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self._connection().execute('DELETE FROM rate_limits').rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM rate_limits WHERE key = ?', (key,))
@@ -0,0 +1,304 @@
+"""
+Recurring weekly availability templates.
+Most members keep the same schedule every week. Instead of 336 rows per week, a
+member can save a template: one availability_templates row (the week packed at
+2 bits per slot) that applies to every week from its start_week on. Templates are
+resolved at read time by the availability, timeline and heatmap APIs and by the
+analytics matrix; heatmap counts add the templates' counts to the stored
+aggregates without materializing any slots.
+
+A week is an override (availability_weeks) when its live rows replace the
+template, possibly with nothing. The first save that changes a template week
+materializes it: the template's slots are written as rows and the week is
+marked, then the save applies on top. Setting a template marks every later
+week that already has rows, so live rows and a template never both count for
+the same user and week.
+"""
+from datetime import datetime
+from functools import lru_cache
+from sqlalchemy import select, func
+from app import db
+from app.models.availability import (
+    AvailabilitySlot, AvailabilityTemplate, AvailabilityWeek, IN_CHUNK_SIZE,
+    log_availability_change, refresh_aggregate_slots
+)
+from app.utils.archive import archived_weeks, pack_states, unpack_states
+from app.utils.slots import FIRST_MONDAY_SLOT, WEEK_SLOTS, week_start_of
+
+
+@lru_cache(maxsize=4096)
+def _states(data):
+    return unpack_states(data)
+
+
+def _templates(end_slot=None, user_ids=None):
+    """user_id -> [(start_week, states or None)] in start_week order"""
+    template_table = AvailabilityTemplate.__table__
+    query = select(template_table.c.user_id, template_table.c.start_week, template_table.c.data).order_by(
+        template_table.c.user_id, template_table.c.start_week
+    )
+    if end_slot is not None:
+        query = query.where(template_table.c.start_week <= end_slot)
+    if user_ids is None:
+        queries = [query]
+    else:
+        user_ids = sorted(set(user_ids))
+        queries = [
+            query.where(template_table.c.user_id.in_(user_ids[i:i + IN_CHUNK_SIZE]))
+            for i in range(0, len(user_ids), IN_CHUNK_SIZE)
+        ]
+    templates = {}
+    for chunk_query in queries:
+        for user_id, start_week, data in db.session.execute(chunk_query):
+            templates.setdefault(user_id, []).append((start_week, _states(data) if data is not None else None))
+    return templates
+
+
+def _in_effect(versions, week_start):
+    states = None
+    for start_week, version_states in versions:
+        if start_week > week_start:
+            break
+        states = version_states
+    return states
+
+
+def _overrides(first_week, last_week):
+    week_table = AvailabilityWeek.__table__
+    return set(db.session.execute(
+        select(week_table.c.user_id, week_table.c.week_start).where(
+            week_table.c.week_start >= first_week,
+            week_table.c.week_start <= last_week
+        )
+    ).tuples())
+
+
+def template_weeks(start_slot, end_slot, user_ids=None):
+    """
+    (user_id, week_start, states) for the weeks overlapping a range that come from
+    a template: one is in effect, the week is no override and isn't archived.
+    Templates repeat forever, so unbounded ranges resolve none.
+
+    Args:
+        user_ids: Optional set of users to include
+    """
+    if start_slot is None or end_slot is None or end_slot < start_slot:
+        return []
+    templates = _templates(end_slot, user_ids)
+    if not templates:
+        return []
+    first_week = max(week_start_of(start_slot), min(versions[0][0] for versions in templates.values()))
+    last_week = week_start_of(end_slot)
+    if first_week > last_week:
+        return []
+    overrides = _overrides(first_week, last_week)
+    archived = set(archived_weeks(range(first_week, last_week + 1, WEEK_SLOTS)))
+
+    weeks = []
+    for user_id, versions in templates.items():
+        for week_start in range(max(first_week, versions[0][0]), last_week + 1, WEEK_SLOTS):
+            if week_start in archived or (user_id, week_start) in overrides:
+                continue
+            states = _in_effect(versions, week_start)
+            if states is not None:
+                weeks.append((user_id, week_start, states))
+    return weeks
+
+
+def template_slots(start_slot, end_slot, user_ids=None):
+    """Non-zero template (user_id, slot_index, state) rows in a range, in (user_id, slot_index) order"""
+    rows = []
+    for user_id, week_start, states in template_weeks(start_slot, end_slot, user_ids):
+        first = max(0, start_slot - week_start)
+        last = min(WEEK_SLOTS - 1, end_slot - week_start)
+        rows.extend(
+            (user_id, week_start + offset, states[offset])
+            for offset in range(first, last + 1) if states[offset]
+        )
+    rows.sort()
+    return rows
+
+
+def template_counts(start_slot, end_slot, user_ids=None):
+    """Template (slot_index, available, maybe) rows in a range with a non-zero count"""
+    by_week = {}
+    for _, week_start, states in template_weeks(start_slot, end_slot, user_ids):
+        by_week.setdefault(week_start, []).append(states)
+    rows = []
+    for week_start in sorted(by_week):
+        columns = list(zip(*by_week[week_start]))
+        first = max(0, start_slot - week_start)
+        last = min(WEEK_SLOTS - 1, end_slot - week_start)
+        for offset in range(first, last + 1):
+            available = columns[offset].count(2)
+            maybe = columns[offset].count(1)
+            if available or maybe:
+                rows.append((week_start + offset, available, maybe))
+    return rows
+
+
+def add_counts(*sources):
+    """Sum (slot_index, available, maybe) rows from several sources, in slot order"""
+    totals = {}
+    for rows in sources:
+        for slot_index, available, maybe in rows:
+            old_available, old_maybe = totals.get(slot_index, (0, 0))
+            totals[slot_index] = (old_available + (available or 0), old_maybe + (maybe or 0))
+    return [(slot_index, available, maybe) for slot_index, (available, maybe) in sorted(totals.items())]
+
+
+# ============= WRITING =============
+
+def _mark_weeks(pairs):
+    week_table = AvailabilityWeek.__table__
+    pairs = sorted(set(pairs))
+    if pairs:
+        db.session.execute(week_table.insert(), [
+            {'user_id': user_id, 'week_start': week_start} for user_id, week_start in pairs
+        ])
+
+
+def materialize_weeks(user_ids, week_starts):
+    """
+    Write the template slots of template weeks as rows and mark the weeks as overrides,
+    before explicit slots are saved into them. Runs inside a write (the caller commits
+    and refreshes the aggregates of the returned slots).
+
+    Returns:
+        list: Slot indices written
+    """
+    week_starts = set(week_starts)
+    if not week_starts:
+        return []
+    weeks = [
+        (user_id, week_start, states)
+        for user_id, week_start, states in template_weeks(
+            min(week_starts), max(week_starts) + WEEK_SLOTS - 1, set(user_ids)
+        )
+        if week_start in week_starts
+    ]
+    if not weeks:
+        return []
+
+    now = datetime.utcnow()
+    rows = [
+        {'user_id': user_id, 'slot_index': week_start + offset, 'state': states[offset], 'updated_at': now}
+        for user_id, week_start, states in weeks
+        for offset in range(WEEK_SLOTS) if states[offset]
+    ]
+    if rows:
+        db.session.execute(AvailabilitySlot.__table__.insert(), rows)
+    _mark_weeks((user_id, week_start) for user_id, week_start, _ in weeks)
+    return sorted({row['slot_index'] for row in rows})
+
+
+def get_template(user_id, week_start):
+    """(start_week, states) of the user's template in effect for a week, or None"""
+    versions = _templates(week_start, {user_id}).get(user_id)
+    if versions and versions[-1][1] is not None:
+        return versions[-1]
+    return None
+
+
+def set_template(user_id, states, start_week):
+    """
+    Make states (WEEK_SLOTS values, offset 0 = Monday 00:00 UTC) the user's template
+    from start_week on; None ends the template. Runs inside a write (the caller commits).
+    """
+    template_table = AvailabilityTemplate.__table__
+    slots_table = AvailabilitySlot.__table__
+    week_table = AvailabilityWeek.__table__
+
+    if states is not None:
+        # Weeks from start_week on that already have rows keep them
+        week_expr = slots_table.c.slot_index - (slots_table.c.slot_index - FIRST_MONDAY_SLOT) % WEEK_SLOTS
+        weeks_with_rows = set(db.session.execute(
+            select(week_expr).distinct().where(
+                slots_table.c.user_id == user_id,
+                slots_table.c.slot_index >= start_week
+            )
+        ).scalars())
+        marked = set(db.session.execute(
+            select(week_table.c.week_start).where(
+                week_table.c.user_id == user_id,
+                week_table.c.week_start >= start_week
+            )
+        ).scalars())
+        _mark_weeks((user_id, week_start) for week_start in weeks_with_rows - marked)
+
+    db.session.execute(template_table.delete().where(
+        template_table.c.user_id == user_id,
+        template_table.c.start_week >= start_week
+    ))
+    earlier = db.session.execute(
+        select(func.count()).select_from(template_table).where(template_table.c.user_id == user_id)
+    ).scalar()
+    if states is not None or earlier:
+        db.session.execute(template_table.insert().values(
+            user_id=user_id,
+            start_week=start_week,
+            data=pack_states(states) if states is not None else None,
+            updated_at=datetime.utcnow()
+        ))
+    log_availability_change(db.session, [user_id])
+
+
+def purge_templates(start_slot, end_slot):
+    """
+    Keep templates from refilling a purged range. Runs inside a write (the caller commits).
+    Weeks the range covers only partly are materialized so their slots outside the
+    range survive; fully covered weeks stop using the templates.
+
+    Returns:
+        int: Users whose templates were affected
+    """
+    template_table = AvailabilityTemplate.__table__
+    week_table = AvailabilityWeek.__table__
+    templates = _templates()
+    if not templates:
+        return 0
+    if start_slot is None and end_slot is None:
+        db.session.execute(template_table.delete())
+        db.session.execute(week_table.delete())
+        log_availability_change(db.session)
+        return len(templates)
+
+    # Partly covered weeks keep their slots outside the range as rows
+    partial = set()
+    if start_slot is not None and week_start_of(start_slot) != start_slot:
+        partial.add(week_start_of(start_slot))
+    if end_slot is not None and week_start_of(end_slot + 1) != end_slot + 1:
+        partial.add(week_start_of(end_slot))
+    materialized = materialize_weeks(templates, partial)
+    refresh_aggregate_slots([
+        slot_index for slot_index in materialized
+        if (start_slot is not None and slot_index < start_slot) or (end_slot is not None and slot_index > end_slot)
+    ])
+
+    first_full = None if start_slot is None else week_start_of(start_slot + WEEK_SLOTS - 1)
+    next_kept = None if end_slot is None else week_start_of(end_slot + 1)
+    if first_full is None:
+        # Everything before next_kept goes: templates restart there, older overrides are moot
+        for user_id, versions in templates.items():
+            states = _in_effect(versions, next_kept)
+            db.session.execute(template_table.delete().where(
+                template_table.c.user_id == user_id,
+                template_table.c.start_week <= next_kept
+            ))
+            if states is not None:
+                db.session.execute(template_table.insert().values(
+                    user_id=user_id, start_week=next_kept, data=pack_states(states), updated_at=datetime.utcnow()
+                ))
+        db.session.execute(week_table.delete().where(week_table.c.week_start < next_kept))
+    elif next_kept is None:
+        # Everything from first_full on goes: the templates end there
+        for user_id in templates:
+            set_template(user_id, None, first_full)
+    elif first_full < next_kept:
+        # A bounded range: its full weeks become empty overrides
+        _mark_weeks(
+            (user_id, week_start)
+            for user_id, week_start, _ in template_weeks(first_full, next_kept - 1)
+        )
+    log_availability_change(db.session)
+    return len(templates)
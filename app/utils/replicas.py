@@ -0,0 +1,169 @@
+"""
+Read/write routing for read replicas.
+GET requests run their queries on a replica engine so the heavy read endpoints
+(timeline, heatmap, find-matches, group schedule) don't contend with writes on
+the primary. Everything else goes to the primary:
+
+- writes, and any query in a session after it has flushed
+- work outside a request (CLI scripts, migrations, the SQLite writer thread)
+- GET requests from a client that wrote within REPLICA_READ_YOUR_WRITES_SECONDS,
+  so users always see their own changes
+
+Replicas lagging more than REPLICA_MAX_LAG_SECONDS (PostgreSQL streaming
+replicas) are skipped until they catch up. On SQLite, SQLITE_READ_ONLY_REPLICA
+routes GET requests to read-only connections on the same file instead.
+"""
+import itertools
+import logging
+import threading
+import time
+from flask import g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from app.utils.sqlite import configure_sqlite_engine, sqlite_database_path
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD')
+LAST_WRITE_KEY = '_last_write'
+
+# Seconds a PostgreSQL standby is behind; 0 when it has replayed everything it
+# received (an idle standby) or when the server is not a standby at all
+PG_REPLICATION_LAG_SQL = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class RoutingSession(Session):
+    """Session that sends reads in GET requests to the replica chosen for the request"""
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._has_written = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if getattr(clause, 'is_dml', False):
+            # Core INSERT/UPDATE/DELETE through the session count as writes too
+            self._has_written = True
+        if (bind is None and not self._flushing and not self._has_written
+                and has_app_context()):
+            replica = g.get('_read_replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_written(session, flush_context):
+    # Read-your-writes within the request: later queries see the flushed rows
+    session._has_written = True
+
+
+class _Replica:
+    def __init__(self, name, engine, check_lag):
+        self.name = name
+        self.engine = engine
+        self.check_lag = check_lag
+        self.lag = 0.0
+        self.healthy = True
+        self.checked_at = 0.0
+
+
+class ReadReplicas:
+    """Flask extension that picks a replica engine for each read-only request"""
+
+    def __init__(self, app=None):
+        self.replicas = []
+        self.max_lag = 5.0
+        self.read_your_writes = 5.0
+        self.check_interval = 10.0
+        self._cycle = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, primary_engine=None):
+        """
+        Create replica engines from REPLICA_DATABASE_URLS, or a read-only SQLite
+        engine when SQLITE_READ_ONLY_REPLICA is set. primary_engine is needed for
+        the SQLite case.
+        """
+        self.dispose()
+        self.max_lag = float(app.config.get('REPLICA_MAX_LAG_SECONDS', self.max_lag))
+        self.read_your_writes = float(app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', self.read_your_writes))
+        self.check_interval = float(app.config.get('REPLICA_LAG_CHECK_SECONDS', self.check_interval))
+
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for i, url in enumerate(app.config.get('REPLICA_DATABASE_URLS') or []):
+            engine = create_engine(url, **options)
+            configure_sqlite_engine(engine, app.config, read_only=True)
+            self.replicas.append(_Replica(f'replica{i}', engine, engine.dialect.name == 'postgresql'))
+
+        database_path = sqlite_database_path(primary_engine) if primary_engine is not None else None
+        if not self.replicas and database_path and app.config.get('SQLITE_READ_ONLY_REPLICA'):
+            # Same file, so there is no lag to check
+            engine = create_engine(f'sqlite:///file:{database_path}?mode=ro&uri=true', **options)
+            configure_sqlite_engine(engine, app.config, read_only=True)
+            self.replicas.append(_Replica('sqlite-ro', engine, False))
+
+        self._cycle = itertools.cycle(self.replicas) if self.replicas else None
+        app.extensions['read_replicas'] = self
+        if self.replicas:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.engine.dispose()
+        self.replicas = []
+        self._cycle = None
+
+    def choose(self):
+        """Next healthy replica engine (round robin), or None to use the primary"""
+        with self._lock:
+            for _ in range(len(self.replicas)):
+                replica = next(self._cycle)
+                if self._is_usable(replica):
+                    return replica.engine
+        return None
+
+    def _is_usable(self, replica):
+        if not replica.check_lag:
+            return True
+        now = time.monotonic()
+        if now - replica.checked_at >= self.check_interval:
+            replica.checked_at = now
+            try:
+                with replica.engine.connect() as connection:
+                    replica.lag = float(connection.execute(PG_REPLICATION_LAG_SQL).scalar() or 0)
+                replica.healthy = replica.lag <= self.max_lag
+                if not replica.healthy:
+                    logger.warning('Read replica %s skipped (lag %.1fs)', replica.name, replica.lag)
+            except DBAPIError as e:
+                replica.healthy = False
+                logger.warning('Read replica %s unavailable: %s', replica.name, e)
+        return replica.healthy
+
+    def status(self):
+        """Replica health for the admin panel and metrics"""
+        return [
+            {'name': r.name, 'healthy': r.healthy, 'lag_seconds': round(r.lag, 3)}
+            for r in self.replicas
+        ]
+
+    def _before_request(self):
+        if request.method not in READ_METHODS:
+            return
+        last_write = session.get(LAST_WRITE_KEY)
+        if last_write and time.time() - last_write < self.read_your_writes:
+            return
+        g._read_replica = self.choose()
+
+    def _after_request(self, response):
+        # Anything but a GET may have written; pin this client to the primary for a while
+        if request.method not in READ_METHODS:
+            session[LAST_WRITE_KEY] = time.time()
+        return response
@@ -0,0 +1,287 @@
+"""
+Data retention for availability.
+Purges delete availability and aggregate rows for a slot range in bounded
+chunks, one short transaction each, so saves keep going while a season's worth
+of old data is removed. Afterwards the database is analyzed and, on SQLite,
+vacuumed when enough pages were freed.
+
+With RETENTION_WEEKS or ARCHIVE_AFTER_WEEKS set, every worker runs a background
+check every RETENTION_CHECK_HOURS. A lock file in the instance folder makes sure
+only one worker on the host runs it, and the time of the last run is recorded
+there. Weeks before the current week minus ARCHIVE_AFTER_WEEKS are moved to the
+archive (app/utils/archive.py), and whatever lies before the current week minus
+RETENTION_WEEKS weeks is purged.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from sqlalchemy import select, func, true
+from app.utils.slots import WEEK_SLOTS, current_week_start_slot
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; every worker may run the check
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per transaction
+PURGE_CHUNK_SIZE = 5000
+
+# VACUUM an SQLite database once this share of its pages is free
+VACUUM_FREE_RATIO = 0.25
+
+# Delay before a worker's first retention check
+FIRST_CHECK_DELAY = 60
+
+
+def _slot_range(column, start_slot, end_slot):
+    condition = true()
+    if start_slot is not None:
+        condition = condition & (column >= start_slot)
+    if end_slot is not None:
+        condition = condition & (column <= end_slot)
+    return condition
+
+
+def _delete_chunk(table, key, condition, chunk_size, log_change=False):
+    from app import db
+    from app.models.availability import log_availability_change
+    result = db.session.execute(
+        table.delete().where(key.in_(select(key).where(condition).limit(chunk_size)))
+    )
+    if log_change and result.rowcount:
+        log_availability_change(db.session)
+    return result.rowcount
+
+
+def purge_slots(start_slot=None, end_slot=None, chunk_size=PURGE_CHUNK_SIZE, progress=None):
+    """
+    Delete availability and aggregates from start_slot to end_slot (None = unbounded),
+    and archived weeks lying entirely inside that range.
+
+    Args:
+        start_slot: First slot to delete, or None for everything before end_slot
+        end_slot: Last slot to delete, or None for everything from start_slot
+        chunk_size: Rows deleted per transaction
+        progress: Optional callable receiving {'deleted', 'total'} after each chunk
+
+    Returns:
+        dict: availability_deleted, aggregates_deleted and archived_weeks_deleted counts
+    """
+    from app import db, write_queue
+    from app.models.availability import (
+        AvailabilitySlot, AggregateSlotCount, ArchivedWeek, AvailabilityVersion, write_pending_slots
+    )
+    from app.models.group import GroupSlotCount
+    from app.utils.recurring import purge_templates
+    slots_table = AvailabilitySlot.__table__
+    aggregate_table = AggregateSlotCount.__table__
+    progress = progress or (lambda info: None)
+
+    # Templates must not refill the purged range, nor staged saves once it is gone
+    write_queue.run(purge_templates, start_slot, end_slot)
+    write_queue.run(write_pending_slots)
+
+    slot_condition = _slot_range(slots_table.c.slot_index, start_slot, end_slot)
+    total = db.session.execute(select(func.count()).select_from(slots_table).where(slot_condition)).scalar()
+    db.session.rollback()  # don't hold a read transaction open while the writes run
+
+    # Every chunk logs a bulk change, so caches never serve rows that are gone
+    availability_deleted = 0
+    while True:
+        deleted = write_queue.run(_delete_chunk, slots_table, slots_table.c.id, slot_condition, chunk_size, True)
+        availability_deleted += deleted
+        progress({'deleted': availability_deleted, 'total': total})
+        if deleted < chunk_size:
+            break
+
+    aggregate_condition = _slot_range(aggregate_table.c.slot_index, start_slot, end_slot)
+    aggregates_deleted = 0
+    while True:
+        deleted = write_queue.run(_delete_chunk, aggregate_table, aggregate_table.c.slot_index,
+                                  aggregate_condition, chunk_size)
+        aggregates_deleted += deleted
+        if deleted < chunk_size:
+            break
+
+    group_table = GroupSlotCount.__table__
+    group_condition = _slot_range(group_table.c.slot_index, start_slot, end_slot)
+    while write_queue.run(_delete_chunk, group_table, group_table.c.slot_index,
+                          group_condition, chunk_size) >= chunk_size:
+        pass
+
+    # Archived weeks lying entirely inside the range
+    archive_table = ArchivedWeek.__table__
+    archive_condition = _slot_range(archive_table.c.week_start, start_slot, None)
+    if end_slot is not None:
+        archive_condition = archive_condition & (archive_table.c.week_start + WEEK_SLOTS - 1 <= end_slot)
+    archived_weeks_deleted = write_queue.run(_delete_chunk, archive_table, archive_table.c.week_start,
+                                             archive_condition, chunk_size, True)
+
+    # And the versions of purged weeks
+    version_table = AvailabilityVersion.__table__
+    version_condition = _slot_range(version_table.c.week_start, start_slot, None)
+    if end_slot is not None:
+        version_condition = version_condition & (version_table.c.week_start + WEEK_SLOTS - 1 <= end_slot)
+    while write_queue.run(_delete_chunk, version_table, version_table.c.week_start,
+                          version_condition, chunk_size) >= chunk_size:
+        pass
+
+    logger.info('Purged %d availability slots, %d aggregates and %d archived weeks (slots %s to %s)',
+                availability_deleted, aggregates_deleted, archived_weeks_deleted, start_slot, end_slot)
+    return {
+        'availability_deleted': availability_deleted,
+        'aggregates_deleted': aggregates_deleted,
+        'archived_weeks_deleted': archived_weeks_deleted,
+    }
+
+
+def optimize_database(vacuum=True):
+    """
+    Refresh planner statistics after a large purge and give space back.
+    SQLite: ANALYZE, then VACUUM if more than VACUUM_FREE_RATIO of the pages are free
+    (queued writers wait meanwhile). PostgreSQL: VACUUM ANALYZE, which doesn't block.
+
+    Returns:
+        dict: What was run, and the free page ratio on SQLite
+    """
+    from app import db, write_queue
+    from app.models.availability import AvailabilitySlot, AggregateSlotCount
+    engine = db.engine
+    result = {'analyzed': True, 'vacuumed': False}
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if engine.dialect.name == 'postgresql':
+            for table in (AvailabilitySlot.__tablename__, AggregateSlotCount.__tablename__):
+                connection.exec_driver_sql(f'VACUUM ANALYZE {table}')
+            result['vacuumed'] = True
+            return result
+
+        connection.exec_driver_sql('ANALYZE')
+        if engine.dialect.name != 'sqlite':
+            return result
+        page_count = connection.exec_driver_sql('PRAGMA page_count').scalar() or 1
+        free_pages = connection.exec_driver_sql('PRAGMA freelist_count').scalar() or 0
+        result['free_ratio'] = round(free_pages / page_count, 3)
+        if vacuum and free_pages / page_count > VACUUM_FREE_RATIO:
+            started = time.perf_counter()
+            with write_queue.exclusive():
+                connection.exec_driver_sql('VACUUM')
+            result['vacuumed'] = True
+            logger.info('Vacuumed database (%d of %d pages were free) in %.1fs',
+                        free_pages, page_count, time.perf_counter() - started)
+    return result
+
+
+class RetentionPolicy:
+    """Flask extension archiving and purging old availability in the background"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.weeks = 0
+        self.archive_weeks = 0
+        self.interval = 6 * 3600
+        self.vacuum = True
+        self.state_path = None
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.weeks = app.config.get('RETENTION_WEEKS', 0)
+        self.archive_weeks = app.config.get('ARCHIVE_AFTER_WEEKS', 0)
+        self.interval = app.config.get('RETENTION_CHECK_HOURS', 6) * 3600
+        self.vacuum = app.config.get('RETENTION_VACUUM', True)
+        self.state_path = os.path.join(app.instance_path, 'retention.state')
+        if self.weeks or self.archive_weeks:
+            app.before_request(self._ensure_thread)
+        app.extensions['retention'] = self
+
+    def cutoff_slot(self):
+        """First slot kept by the policy, or None when it is off"""
+        if not self.weeks:
+            return None
+        return current_week_start_slot() - self.weeks * WEEK_SLOTS
+
+    def archive_cutoff_slot(self):
+        """First slot kept live (not archived), or None when archiving is off"""
+        if not self.archive_weeks:
+            return None
+        return current_week_start_slot() - self.archive_weeks * WEEK_SLOTS
+
+    def apply(self, progress=None):
+        """Archive and purge per the policy, then optimize the database if any live rows went"""
+        from app.utils.archive import archive_before
+        result = {}
+        archive_cutoff = self.archive_cutoff_slot()
+        if archive_cutoff is not None:
+            result.update(archive_before(archive_cutoff))
+        cutoff = self.cutoff_slot()
+        if cutoff is not None:
+            result.update(purge_slots(None, cutoff - 1, progress=progress))
+        if result.get('slots_archived') or result.get('availability_deleted') or result.get('aggregates_deleted'):
+            result.update(optimize_database(self.vacuum))
+        return result
+
+    def last_run(self):
+        """Unix time of the last policy run on this host, or None"""
+        try:
+            with open(self.state_path) as f:
+                return float(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def status(self):
+        return {
+            'retention_weeks': self.weeks,
+            'cutoff_slot': self.cutoff_slot(),
+            'archive_after_weeks': self.archive_weeks,
+            'archive_cutoff_slot': self.archive_cutoff_slot(),
+            'last_run': self.last_run(),
+        }
+
+    # ============= BACKGROUND CHECK =============
+
+    def _ensure_thread(self):
+        """Start the checker lazily so it is never inherited across a fork"""
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name='retention', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _loop(self):
+        time.sleep(FIRST_CHECK_DELAY * random.uniform(0.5, 1.5))
+        while True:
+            try:
+                with self.app.app_context():
+                    self._run_if_due()
+            except Exception:
+                logger.exception('Retention check failed')
+            # Jitter so workers started together don't check in lockstep
+            time.sleep(min(self.interval, 3600) * random.uniform(0.8, 1.2))
+
+    def _run_if_due(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        with open(self.state_path, 'a+') as state_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(state_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return  # another worker is running it
+            last_run = self.last_run()
+            if last_run and time.time() - last_run < self.interval:
+                return
+            result = self.apply()
+            state_file.seek(0)
+            state_file.truncate()
+            state_file.write(str(time.time()))
+            logger.info('Retention policy (archive after %d weeks, keep %d weeks): %s',
+                        self.archive_weeks, self.weeks, result)
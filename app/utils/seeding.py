@@ -0,0 +1,225 @@
+"""
+Synthetic guild data generator.
+Creates realistic rosters (class and role mix, timezone clusters, weeks of
+painted availability, groups and invitations) with bulk inserts so that
+production-sized data sets can be reproduced locally and in benchmarks.
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db, password_hasher
+from app.models.user import User
+from app.models.availability import AvailabilitySlot, rebuild_aggregate_range, recount_group_counts, log_availability_change
+from app.models.group import Group, GroupMembership, GroupInvite
+from app.utils.group_names import get_random_group_name
+from app.utils.slots import SLOTS_PER_DAY, WEEK_SLOTS, current_week_start_slot
+
+INSERT_CHUNK_SIZE = 5000
+
+# (class, relative frequency, roles the class can fill)
+CLASS_MIX = [
+    ('Warrior', 14, ['tank', 'dps']),
+    ('Paladin', 11, ['tank', 'healer', 'dps']),
+    ('Hunter', 13, ['dps']),
+    ('Rogue', 12, ['dps']),
+    ('Priest', 12, ['healer', 'dps']),
+    ('Shaman', 10, ['healer', 'dps']),
+    ('Mage', 12, ['dps']),
+    ('Warlock', 9, ['dps']),
+    ('Druid', 7, ['tank', 'healer', 'dps']),
+]
+
+# (timezone name, UTC offset in hours, relative frequency)
+TIMEZONE_CLUSTERS = [
+    ('America/New_York', -5, 35),
+    ('America/Chicago', -6, 15),
+    ('America/Los_Angeles', -8, 20),
+    ('Europe/London', 0, 15),
+    ('Europe/Berlin', 1, 8),
+    ('Australia/Sydney', 10, 7),
+]
+
+NAME_PREFIXES = ['Ar', 'Bel', 'Cor', 'Dra', 'El', 'Fen', 'Gor', 'Hal', 'Ith', 'Jor',
+                 'Kal', 'Lor', 'Mor', 'Nel', 'Or', 'Pyr', 'Quel', 'Ral', 'Syl', 'Thal',
+                 'Ul', 'Vor', 'Wyn', 'Xal', 'Yor', 'Zul']
+NAME_SUFFIXES = ['adin', 'ak', 'andra', 'dor', 'eth', 'gar', 'ia', 'ion', 'is', 'mir',
+                 'nar', 'os', 'ra', 'rion', 'thas', 'ul', 'wen', 'yx']
+
+
+def _weighted_choice(rng, options, weight_index):
+    return rng.choices(options, weights=[o[weight_index] for o in options], k=1)[0]
+
+
+def _insert_chunked(table, rows):
+    """executemany-style bulk insert in bounded chunks"""
+    for i in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(insert(table), rows[i:i + INSERT_CHUNK_SIZE])
+
+
+def _generate_names(rng, count, taken):
+    """Unique fantasy character names, avoiding names already in `taken` (lowercase)"""
+    names = []
+    while len(names) < count:
+        name = rng.choice(NAME_PREFIXES) + rng.choice(NAME_SUFFIXES)
+        if name.lower() in taken:
+            name = f'{name}{len(taken)}'
+        if name.lower() in taken:
+            continue
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+
+def _paint_week_pattern(rng):
+    """
+    A user's habitual week in local time as {local slot offset: state}.
+    Evening blocks on most days, longer blocks on weekends, with 'maybe'
+    slots at the edges of some blocks.
+    """
+    pattern = {}
+    for day in range(7):
+        weekend = day >= 5
+        if rng.random() > (0.8 if weekend else 0.6):
+            continue
+        start_hour = rng.choice([13, 14, 15, 16]) if weekend and rng.random() < 0.5 else rng.choice([17, 18, 19, 20, 21])
+        length = rng.randint(4, 12)  # 2-6 hours in half-hour slots
+        start = day * SLOTS_PER_DAY + start_hour * 2
+        for offset in range(length):
+            pattern[start + offset] = 2
+        if rng.random() < 0.5:
+            for offset in range(1, rng.randint(1, 3)):
+                pattern.setdefault(start - offset, 1)
+                pattern.setdefault(start + length - 1 + offset, 1)
+    return pattern
+
+
+def seed_guild(users=200, weeks=4, groups=None, invites_per_group=1, start_slot=None,
+               password='password', seed=None, log=None):
+    """
+    Generate a synthetic guild with bulk inserts.
+
+    Args:
+        users: Number of users to create
+        weeks: Weeks of painted availability per user, starting at start_slot
+        groups: Number of groups (defaults to one per ten users)
+        invites_per_group: Invitations sent from each group to non-members
+        start_slot: First slot of the painted range (defaults to this week's Monday UTC)
+        password: Password shared by every generated user
+        seed: Random seed for reproducible data sets
+        log: Optional callable for progress messages
+
+    Returns:
+        dict: Counts of created rows and the painted slot range
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    start_slot = current_week_start_slot() if start_slot is None else start_slot
+    end_slot = start_slot + weeks * WEEK_SLOTS - 1
+    groups = max(1, users // 10) if groups is None else groups
+    now = datetime.utcnow()
+
+    # Users: hash the shared password once instead of once per user
+    password_hash = password_hasher.hash(password)
+    taken = {name for (name,) in db.session.query(User.character_name_lower).all()}
+    names = _generate_names(rng, users, taken)
+    user_rows = []
+    user_timezones = []
+    for name in names:
+        wow_class, _, class_roles = _weighted_choice(rng, CLASS_MIX, 1)
+        tz_name, tz_offset, _ = _weighted_choice(rng, TIMEZONE_CLUSTERS, 2)
+        roles = sorted(rng.sample(class_roles, rng.randint(1, len(class_roles))))
+        user_rows.append({
+            'character_name': name,
+            'character_name_lower': User.normalize_name(name),
+            'wow_class': wow_class,
+            'roles': json.dumps(roles),
+            'password_hash': password_hash,
+            'timezone': tz_name,
+            'is_superuser': False,
+            'is_admin': False,
+            'created_at': now,
+        })
+        user_timezones.append(tz_offset)
+    _insert_chunked(User.__table__, user_rows)
+    name_to_id = {}
+    for i in range(0, len(names), 500):
+        name_to_id.update(
+            db.session.query(User.character_name, User.id).filter(User.character_name.in_(names[i:i + 500])).all()
+        )
+    user_ids = [name_to_id[name] for name in names]
+    log(f'Created {len(user_ids)} users')
+
+    # Availability: a habitual weekly pattern per user with some week-to-week noise
+    slot_rows = []
+    for user_id, tz_offset in zip(user_ids, user_timezones):
+        pattern = _paint_week_pattern(rng)
+        for week in range(weeks):
+            week_start = start_slot + week * WEEK_SLOTS
+            for local_offset, state in pattern.items():
+                if rng.random() < 0.1:
+                    continue  # skipped this week
+                slot_index = week_start + local_offset - tz_offset * 2
+                if start_slot <= slot_index <= end_slot:
+                    slot_rows.append({
+                        'user_id': user_id,
+                        'slot_index': slot_index,
+                        'state': state,
+                        'updated_at': now,
+                    })
+    _insert_chunked(AvailabilitySlot.__table__, slot_rows)
+    aggregate_count = rebuild_aggregate_range(start_slot, end_slot)
+    log_availability_change(db.session)
+    log(f'Created {len(slot_rows)} availability slots and {aggregate_count} aggregates')
+
+    # Groups of 2-5 members, led by their first member
+    existing_names = {name for (name,) in db.session.query(Group.name).all()}
+    group_rows = []
+    group_members = []
+    for i in range(groups):
+        name = get_random_group_name()
+        if name in existing_names:
+            name = f'{name} {i + 1}'
+        existing_names.add(name)
+        members = rng.sample(user_ids, min(len(user_ids), rng.randint(2, 5)))
+        group_rows.append({'name': name, 'leader_id': members[0], 'created_at': now, 'max_size': 5})
+        group_members.append(members)
+    _insert_chunked(Group.__table__, group_rows)
+    group_ids = dict(db.session.query(Group.name, Group.id).all())
+
+    membership_rows = []
+    invite_rows = []
+    statuses = ['pending', 'pending', 'accepted', 'declined', 'expired']
+    for group_row, members in zip(group_rows, group_members):
+        group_id = group_ids[group_row['name']]
+        for user_id in members:
+            membership_rows.append({'group_id': group_id, 'user_id': user_id, 'joined_at': now})
+        candidates = [u for u in rng.sample(user_ids, min(len(user_ids), 10)) if u not in members]
+        for invitee_id in candidates[:invites_per_group]:
+            status = rng.choice(statuses)
+            invite_rows.append({
+                'group_id': group_id,
+                'inviter_id': members[0],
+                'invitee_id': invitee_id,
+                'status': status,
+                'created_at': now - timedelta(hours=rng.randint(1, 60)),
+                'responded_at': None if status == 'pending' else now,
+            })
+    _insert_chunked(GroupMembership.__table__, membership_rows)
+    _insert_chunked(GroupInvite.__table__, invite_rows)
+    recount_group_counts(db.session, group_ids=list(group_ids.values()))
+    log(f'Created {len(group_rows)} groups, {len(membership_rows)} memberships and {len(invite_rows)} invites')
+
+    db.session.commit()
+
+    return {
+        'users': len(user_ids),
+        'user_ids': user_ids,
+        'slots': len(slot_rows),
+        'aggregates': aggregate_count,
+        'groups': len(group_rows),
+        'memberships': len(membership_rows),
+        'invites': len(invite_rows),
+        'start_slot': start_slot,
+        'end_slot': end_slot,
+    }
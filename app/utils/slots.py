@@ -0,0 +1,33 @@
+"""
+Slot arithmetic shared by the app, the command line tools and the data generator.
+A slot is a half hour, numbered as Unix time // 1800. Weeks start on Monday
+00:00 UTC and hold WEEK_SLOTS slots.
+"""
+import time
+
+SLOT_SECONDS = 1800
+SLOTS_PER_DAY = 48
+WEEK_SLOTS = SLOTS_PER_DAY * 7
+
+# Slot index of Monday 1970-01-05 00:00 UTC; weeks are aligned to it
+FIRST_MONDAY_SLOT = 4 * SLOTS_PER_DAY
+
+
+def slot_of(timestamp):
+    """Slot index containing a Unix timestamp"""
+    return int(timestamp) // SLOT_SECONDS
+
+
+def current_slot():
+    """Slot index of the current half hour"""
+    return slot_of(time.time())
+
+
+def week_start_of(slot_index):
+    """Slot index of the Monday 00:00 UTC starting the week of slot_index"""
+    return slot_index - (slot_index - FIRST_MONDAY_SLOT) % WEEK_SLOTS
+
+
+def current_week_start_slot():
+    """Slot index of the most recent Monday 00:00 UTC"""
+    return week_start_of(current_slot())
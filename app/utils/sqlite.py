@@ -0,0 +1,49 @@
+"""
+SQLite production profile.
+Applies WAL journaling, a busy timeout and cache/mmap pragmas to every new SQLite
+connection so several gunicorn workers can share one database file.
+"""
+from sqlalchemy import event
+
+
+def is_sqlite_memory(engine):
+    """True for in-memory SQLite databases, which have no file to journal"""
+    return engine.url.database in (None, '', ':memory:')
+
+
+def sqlite_database_path(engine):
+    """Filesystem path of a file-backed SQLite database, or None"""
+    if engine.dialect.name != 'sqlite' or is_sqlite_memory(engine):
+        return None
+    database = engine.url.database
+    if database.startswith('file:'):
+        database = database[5:]
+    return database
+
+
+def configure_sqlite_engine(engine, config, read_only=False):
+    """Register a connect listener applying the SQLite pragmas from config"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    in_memory = is_sqlite_memory(engine)
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}",
+        f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_SIZE_KB', 20000))}",
+        "PRAGMA temp_store = MEMORY",
+    ]
+    if not in_memory:
+        pragmas.append(f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', 0))}")
+        if not read_only:
+            # journal_mode is persistent in the file; read-only connections can't change it
+            pragmas.append(f"PRAGMA journal_mode = {config.get('SQLITE_JOURNAL_MODE', 'WAL')}")
+    pragmas.append(f"PRAGMA synchronous = {config.get('SQLITE_SYNCHRONOUS', 'NORMAL')}")
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
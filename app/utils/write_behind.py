@@ -0,0 +1,237 @@
+"""
+Write-behind buffer for availability saves.
+Drag-painting in the editor sends bursts of saves for overlapping slots, each
+one a transaction plus aggregate, group count and version updates. Instead, a
+save only stages its slots in availability_pending (last state wins) and bumps
+the week versions; the staged slots are applied WRITE_BEHIND_MS after the
+user's last save, or WRITE_BEHIND_MAX_MS after the first one while the user
+keeps painting, all due users in one transaction through the write queue. A
+user with WRITE_BEHIND_MAX_SLOTS staged slots is written at the next poll.
+
+Staged slots and versions live in the database, so every worker sees them:
+versioned diff saves are checked against the same versions whichever worker
+takes them. A save marks the user's session, and the session's other requests
+(reads, copies, templates...) apply the staged slots first, so users see their
+own changes without every request looking for staged rows; other sessions and
+users see them after the delay. Archiving, purging and imports apply staged
+slots before touching the rows under them.
+
+A staged slot is only removed by the transaction that applies it. When a write
+fails the slots stay staged and are retried; the user's next request retries
+too and fails with them rather than serving data without them.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import g, request, session, has_request_context
+from flask_login import current_user
+from sqlalchemy import select, func
+
+logger = logging.getLogger(__name__)
+
+# Seconds between looks for staged slots left by other workers while this one isn't saving
+IDLE_SWEEP_SECONDS = 30
+
+# Session key marking a session whose user may have staged slots
+PENDING_KEY = '_write_behind_pending'
+
+
+class WriteBehindBuffer:
+    """Flask extension staging each user's availability saves before writing them"""
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.enabled = False
+        self.delay = 0.5
+        self.max_delay = 3.0
+        self.max_slots = 2000
+        self._buffered_views = set()
+        self._last_save = 0.0
+        self._thread = None
+        self._thread_pid = None
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        atexit.register(self.shutdown)
+        if app is not None and db is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        # Staged slots belong to the previous app's database
+        self.shutdown()
+        self.app = app
+        self.db = db
+        self.delay = app.config.get('WRITE_BEHIND_MS', 500) / 1000.0
+        self.max_delay = max(self.delay, app.config.get('WRITE_BEHIND_MAX_MS', 3000) / 1000.0)
+        self.max_slots = app.config.get('WRITE_BEHIND_MAX_SLOTS', self.max_slots)
+        self.enabled = self.delay > 0
+        if self.enabled:
+            app.before_request(self._before_request)
+        app.extensions['write_behind'] = self
+
+    def buffered(self, view):
+        """Mark a view that stages saves, so its requests don't write the user's staged slots first"""
+        self._buffered_views.add(view)
+        return view
+
+    # ============= SAVING =============
+
+    def save(self, user_id, slots, base_versions=None):
+        """
+        Stage one user's slot changes.
+
+        Args:
+            user_id: Owner of the slots
+            slots: dict of slot_index -> state
+            base_versions: Optional dict of week_start -> version the client loaded (missing = 0),
+                           checked like save_user_diff()
+
+        Returns:
+            tuple: (versions of the touched weeks, {week_start: version} of conflicting weeks);
+                   nothing is staged on a conflict
+        """
+        from app import write_queue
+        from app.models.availability import stage_user_slots
+        versions, conflicts = write_queue.run(stage_user_slots, user_id, slots, base_versions)
+        if conflicts:
+            return {}, conflicts
+        if has_request_context():
+            session[PENDING_KEY] = True
+        self._last_save = time.monotonic()
+        self._ensure_thread()
+        return versions, {}
+
+    # ============= WRITING =============
+
+    def flush(self, user_ids=None):
+        """
+        Apply staged slots (all users, or just user_ids) in one transaction.
+        Errors propagate and leave the slots staged.
+
+        Returns:
+            int: Users written
+        """
+        from app import write_queue
+        from app.models.availability import write_pending_slots
+        if user_ids is not None and not user_ids:
+            return 0
+        return len(write_queue.run(write_pending_slots, user_ids))
+
+    def flush_user(self, user_id):
+        """Apply one user's staged slots, so what follows sees them"""
+        if self.has_pending(user_id):
+            self.flush([user_id])
+
+    def flush_due(self):
+        """
+        Apply the staged slots of users who stopped saving for the delay, have saved for
+        longer than the maximum delay, or have too many slots staged. A user whose write
+        fails is logged and retried next time, without holding back the others.
+
+        Returns:
+            int: Users written
+        """
+        due = self.due_users()
+        if not due:
+            return 0
+        try:
+            return self.flush(due)
+        except Exception:
+            logger.warning('Writing staged slots of %d users failed; retrying one by one', len(due))
+        written = 0
+        for user_id in due:
+            try:
+                written += self.flush([user_id])
+            except Exception:
+                logger.exception('Writing staged slots of user %s failed; they stay staged', user_id)
+        return written
+
+    def has_pending(self, user_id):
+        """True if the user has staged slots (read from the primary)"""
+        from app.models.availability import PendingSlot
+        pending_table = PendingSlot.__table__
+        with self.db.engine.connect() as connection:
+            return connection.execute(
+                select(pending_table.c.user_id).where(pending_table.c.user_id == user_id).limit(1)
+            ).first() is not None
+
+    def due_users(self):
+        from app.models.availability import PendingSlot
+        pending_table = PendingSlot.__table__
+        now = datetime.utcnow()
+        quiet_since = now - timedelta(seconds=self.delay)
+        started_before = now - timedelta(seconds=self.max_delay)
+        with self.db.engine.connect() as connection:
+            rows = connection.execute(
+                select(
+                    pending_table.c.user_id,
+                    func.min(pending_table.c.saved_at),
+                    func.max(pending_table.c.saved_at),
+                    func.count()
+                ).group_by(pending_table.c.user_id)
+            ).all()
+        return [
+            user_id for user_id, first_at, last_at, count in rows
+            if last_at <= quiet_since or first_at <= started_before or count >= self.max_slots
+        ]
+
+    def _before_request(self):
+        if request.endpoint in (None, 'static'):
+            return
+        self._ensure_thread()
+        if self.app.view_functions.get(request.endpoint) in self._buffered_views:
+            return
+        if not session.get(PENDING_KEY) or not current_user.is_authenticated:
+            return
+        if self.has_pending(current_user.id):
+            self.flush([current_user.id])
+            # A replica may not have the write yet
+            g.pop('_read_replica', None)
+        # Only once written, so a failed write is retried by the next request
+        session.pop(PENDING_KEY, None)
+
+    # ============= BACKGROUND WRITER =============
+
+    def _ensure_thread(self):
+        """Start the writer lazily so it is never inherited across a fork"""
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._loop, name='write-behind', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _loop(self):
+        last_sweep = 0.0
+        while not self._stop.wait(self.delay / 2):
+            now = time.monotonic()
+            # Poll closely after this worker's own saves, otherwise pick up what others left now and then
+            if now - self._last_save > self.max_delay + self.delay and now - last_sweep < IDLE_SWEEP_SECONDS:
+                continue
+            last_sweep = now
+            try:
+                with self.app.app_context():
+                    self.flush_due()
+            except Exception:
+                logger.exception('Writing staged availability failed')
+
+    def shutdown(self):
+        """Stop the background writer and apply what is staged"""
+        self._stop.set()
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            self._thread.join(5.0)
+        self._thread = None
+        if self.enabled and self.app is not None and self._last_save:
+            try:
+                with self.app.app_context():
+                    users = self.flush()
+                if users:
+                    logger.info('Wrote staged availability of %d users on shutdown', users)
+            except Exception:
+                # Still staged; another worker or the next start writes it
+                logger.exception('Writing staged availability on shutdown failed')
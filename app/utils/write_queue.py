@@ -0,0 +1,193 @@
+"""
+Serialized write queue for SQLite deployments.
+SQLite allows a single writer at a time, so concurrent bulk saves from several
+gunicorn workers end up waiting on (or failing with) "database is locked".
+Each worker funnels its queued writes through one writer thread that commits
+them in small batches while holding a file lock shared by all workers. Reads
+are unaffected and proceed concurrently under WAL.
+
+For other databases, or when disabled, writes run inline in the request.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from app.utils.sqlite import sqlite_database_path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; rely on busy_timeout
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'kwargs', 'future')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+
+class WriteQueue:
+    """Flask extension that serializes and batches database writes on SQLite"""
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.enabled = False
+        self.batch_size = 20
+        self.batch_wait = 0.01
+        self.timeout = 30.0
+        self.lock_path = None
+        self._queue = None
+        self._thread = None
+        self._thread_pid = None
+        self._lock_file = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.shutdown)
+        if app is not None and db is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        """Enable the queue for file-backed SQLite databases"""
+        # A new app (e.g. another create_app call) needs a writer bound to its context
+        self.shutdown()
+        self.app = app
+        self.db = db
+        self.batch_size = max(1, app.config.get('SQLITE_WRITE_BATCH_SIZE', self.batch_size))
+        self.batch_wait = app.config.get('SQLITE_WRITE_BATCH_WAIT_MS', 10) / 1000.0
+        self.timeout = app.config.get('SQLITE_WRITE_TIMEOUT', self.timeout)
+        with app.app_context():
+            database_path = sqlite_database_path(db.engine)
+        self.enabled = bool(app.config.get('SQLITE_WRITE_QUEUE') and database_path)
+        self.lock_path = database_path + '.write-lock' if database_path else None
+        app.extensions['write_queue'] = self
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) as a write and commit it.
+        fn must do its work through db.session; it runs in the writer thread when
+        the queue is enabled, so it must not rely on request globals.
+
+        Returns:
+            Whatever fn returns, once the write is committed
+        """
+        if not self.enabled or threading.current_thread() is self._thread:
+            try:
+                result = fn(*args, **kwargs)
+                self.db.session.commit()
+            except Exception:
+                self.db.session.rollback()
+                raise
+            return result
+
+        job = _Job(fn, args, kwargs)
+        self._ensure_thread().put(job)
+        return job.future.result(timeout=self.timeout)
+
+    def _ensure_thread(self):
+        """Start the writer thread lazily so it is never inherited across a fork"""
+        with self._start_lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._queue = queue.Queue()
+                self._lock_file = None
+                self._thread = threading.Thread(
+                    target=self._worker, args=(self._queue,), name='sqlite-writer', daemon=True
+                )
+                self._thread_pid = os.getpid()
+                self._thread.start()
+            return self._queue
+
+    def _worker(self, jobs):
+        with self.app.app_context():
+            while True:
+                job = jobs.get()
+                if job is _STOP:
+                    return
+                batch = [job]
+                # Collect whatever else arrives within the batch window
+                while len(batch) < self.batch_size:
+                    try:
+                        job = jobs.get(timeout=self.batch_wait)
+                    except queue.Empty:
+                        break
+                    if job is _STOP:
+                        self._commit_batch(batch)
+                        return
+                    batch.append(job)
+                self._commit_batch(batch)
+
+    def _commit_batch(self, batch):
+        """Commit a batch in one transaction; on failure retry jobs one by one"""
+        try:
+            with self._process_lock():
+                results = [job.fn(*job.args, **job.kwargs) for job in batch]
+                self.db.session.commit()
+        except Exception as e:
+            self.db.session.rollback()
+            self.db.session.remove()
+            if len(batch) == 1:
+                batch[0].future.set_exception(e)
+                return
+            logger.warning('Batched write of %d jobs failed (%s); retrying individually', len(batch), e)
+            for job in batch:
+                self._commit_batch([job])
+            return
+
+        self.db.session.remove()
+        for job, result in zip(batch, results):
+            job.future.set_result(result)
+
+    def _process_lock(self):
+        """Exclusive lock shared by every worker process writing to the same file"""
+        return _FileLock(self._get_lock_file())
+
+    @contextmanager
+    def exclusive(self):
+        """Hold off every queued writer on this database (e.g. around VACUUM)"""
+        if not self.enabled or fcntl is None:
+            yield
+            return
+        # A separate open file, so this also excludes the writer thread of this process
+        with open(self.lock_path, 'a+') as lock_file, _FileLock(lock_file):
+            yield
+
+    def _get_lock_file(self):
+        if fcntl is None:
+            return None
+        if self._lock_file is None:
+            self._lock_file = open(self.lock_path, 'a+')
+        return self._lock_file
+
+    def shutdown(self, timeout=5.0):
+        """Flush queued writes and stop the writer thread"""
+        thread = self._thread
+        if thread is None or self._thread_pid != os.getpid() or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+
+class _FileLock:
+    def __init__(self, lock_file):
+        self.lock_file = lock_file
+
+    def __enter__(self):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+        return False
+
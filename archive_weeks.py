@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Move completed weeks into compressed archive snapshots and delete their live
+rows (see app/utils/archive.py). Archived weeks stay readable but read-only.
+
+Usage:
+    python archive_weeks.py --weeks 4               # keep 4 weeks before the current one live
+    python archive_weeks.py --before 2025-01-06     # archive weeks ending before a date (UTC)
+    python archive_weeks.py                         # apply ARCHIVE_AFTER_WEEKS from the config
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+from app import create_app
+from app.utils.archive import archive_before
+from app.utils.retention import optimize_database
+from app.utils.slots import WEEK_SLOTS, current_week_start_slot, slot_of
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Archive completed weeks of availability')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--before', help='Archive weeks ending before the week of this date (YYYY-MM-DD, UTC)')
+    group.add_argument('--weeks', type=int, help='Keep this many weeks before the current week live')
+    parser.add_argument('--no-vacuum', action='store_true', help='Only ANALYZE afterwards')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app()
+    with app.app_context():
+        if args.before:
+            try:
+                before = datetime.strptime(args.before, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except ValueError:
+                print('✗ --before must be a date like 2025-01-06')
+                return 1
+            cutoff = slot_of(before.timestamp())
+        else:
+            weeks = args.weeks if args.weeks is not None else app.config.get('ARCHIVE_AFTER_WEEKS', 0)
+            if not weeks:
+                print('✗ Pass --before or --weeks, or set ARCHIVE_AFTER_WEEKS')
+                return 1
+            cutoff = current_week_start_slot() - weeks * WEEK_SLOTS
+
+        started = time.perf_counter()
+
+        def progress(info):
+            print(f"  {info['weeks']}/{info['total']} weeks archived", end='\r', flush=True)
+
+        result = archive_before(cutoff, progress=progress)
+        print()
+        print(f"✓ Archived {result['weeks_archived']} weeks ({result['slots_archived']} slots) "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        if result['slots_archived']:
+            optimized = optimize_database(vacuum=not args.no_vacuum)
+            print(f"✓ Analyzed{' and vacuumed' if optimized['vacuumed'] else ''} the database")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
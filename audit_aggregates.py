@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Compare the heatmap aggregates and group counts with the live availability
+slots and recount only the slots that differ (see app/utils/auditor.py).
+Safe to run while the app is serving requests.
+
+Usage:
+    python audit_aggregates.py                      # every live slot
+    python audit_aggregates.py --weeks 4            # from 4 weeks before the current one
+    python audit_aggregates.py --budget 30          # stop after about 30 seconds
+    python audit_aggregates.py --dry-run            # report drift without repairing it
+"""
+import argparse
+import sys
+from app import create_app
+from app.utils.auditor import audit_range, live_slot_range
+from app.utils.slots import WEEK_SLOTS, current_week_start_slot
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Audit and repair aggregate counts')
+    parser.add_argument('--weeks', type=int, help='Start this many weeks before the current week')
+    parser.add_argument('--budget', type=float, help='Stop starting new windows after this many seconds')
+    parser.add_argument('--dry-run', action='store_true', help='Report mismatches without repairing them')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app()
+    with app.app_context():
+        first_slot, last_slot = live_slot_range()
+        if first_slot is None:
+            print('✓ Nothing to audit')
+            return 0
+        if args.weeks is not None:
+            first_slot = max(first_slot, current_week_start_slot() - args.weeks * WEEK_SLOTS)
+
+        def progress(info):
+            done = info['slot'] - first_slot
+            print(f"  {done}/{last_slot - first_slot + 1} slots checked", end='\r', flush=True)
+
+        result = audit_range(first_slot, last_slot, repair=not args.dry_run, budget=args.budget,
+                             progress=progress)
+        print()
+        for example in result['examples']:
+            print(f"  Slot {example['slot_index']}: stored {example['stored']}, actual {example['actual']}")
+        mismatches = result['aggregate_mismatches'] + result['group_mismatches']
+        mark = '✓' if not mismatches or not args.dry_run else '✗'
+        print(f"{mark} Checked {result['slots_checked']} slots in {result['seconds']:.1f}s: "
+              f"{result['aggregate_mismatches']} aggregate and {result['group_mismatches']} group "
+              f"mismatches (largest drift {result['max_drift']})")
+        if mismatches and not args.dry_run:
+            print(f"✓ Repaired {result['repaired_slots']} slots")
+        if result['next_slot'] is not None:
+            print(f"  Stopped at slot {result['next_slot']} (budget reached)")
+        return 1 if mismatches and args.dry_run else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+Endpoint benchmark suite.
+Seeds a synthetic guild at several scales and drives every API in the
+availability and group blueprints through the Flask test client, reporting
+p50/p95 latency, queries per request and peak memory as JSON.
+
+Usage:
+    python benchmark.py --scales 50,200,1000 --iterations 20 --output bench.json
+    python benchmark.py --only find_matches,group_schedule_data
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from app import create_app, db
+from app.models.availability import recount_group_counts
+from app.models.group import Group, GroupMembership, GroupInvite
+from app.utils.migrations import upgrade
+from app.utils.query_budget import count_queries
+from app.utils.seeding import seed_guild
+from app.utils.slots import SLOTS_PER_DAY, WEEK_SLOTS
+
+MEMORY_ITERATIONS = 3
+
+
+class BenchmarkContext:
+    """State shared by the benchmark cases for one scale"""
+
+    def __init__(self, app, client, seeded, rng):
+        self.app = app
+        self.client = client
+        self.seeded = seeded
+        self.rng = rng
+        self.user_id = seeded['user_ids'][0]
+        self.week_start = seeded['start_slot']
+        self.week_end = seeded['start_slot'] + WEEK_SLOTS - 1
+        self.iteration = 0
+        self.group_counter = 0
+
+    def other_user(self):
+        return self.rng.choice(self.seeded['user_ids'][1:])
+
+    def make_group(self, leader_id, member_ids=()):
+        """Create a group directly in the database (not timed)"""
+        self.group_counter += 1
+        group = Group(name=f'Benchmark Group {self.group_counter}', leader_id=leader_id)
+        db.session.add(group)
+        db.session.flush()
+        for user_id in [leader_id, *member_ids]:
+            db.session.add(GroupMembership(group_id=group.id, user_id=user_id))
+        db.session.flush()
+        recount_group_counts(db.session, group_ids=[group.id])
+        db.session.commit()
+        return group
+
+    def make_invite(self, inviter_id, invitee_id):
+        """Create a group led by inviter with a pending invite for invitee (not timed)"""
+        group = self.make_group(inviter_id)
+        invite = GroupInvite(group_id=group.id, inviter_id=inviter_id, invitee_id=invitee_id)
+        db.session.add(invite)
+        db.session.commit()
+        return group, invite
+
+
+# ============= CASES =============
+# Each case prepares any state it needs (untimed) and returns (method, url, json body)
+
+def case_get_availability(ctx):
+    return 'GET', f'/api/availability?start_slot={ctx.week_start}&end_slot={ctx.week_end}', None
+
+
+def case_get_my_availability(ctx):
+    return 'GET', f'/api/availability?user_id=current&start_slot={ctx.week_start}&end_slot={ctx.week_end}', None
+
+
+def case_get_timeline(ctx):
+    return 'GET', f'/api/availability/timeline?start_slot={ctx.week_start}&end_slot={ctx.week_end}', None
+
+
+def case_bulk_update_availability(ctx):
+    # Repaint one evening, alternating states so every iteration changes rows
+    state = 2 if ctx.iteration % 2 == 0 else 1
+    start = ctx.week_start + SLOTS_PER_DAY * (ctx.iteration % 7) + 36
+    slots = [{'slot_index': start + i, 'state': state} for i in range(12)]
+    return 'POST', '/api/availability/bulk', {'slots': slots}
+
+
+def case_get_aggregate(ctx):
+    return 'GET', f'/api/availability/aggregate?start_slot={ctx.week_start}&end_slot={ctx.week_end}', None
+
+
+def case_get_aggregate_dense(ctx):
+    return 'GET', f'/api/availability/aggregate?start_slot={ctx.week_start}&end_slot={ctx.week_end}&format=dense', None
+
+
+def case_find_matches(ctx):
+    return 'GET', f'/api/availability/find-matches?start_slot={ctx.week_start}&end_slot={ctx.week_end}', None
+
+
+def case_copy_availability(ctx):
+    # Copy Monday onto another day of the week, a day further each iteration
+    target = ctx.week_start + SLOTS_PER_DAY * (1 + ctx.iteration % 6)
+    return 'POST', '/api/availability/copy', {
+        'source_start': ctx.week_start,
+        'source_end': ctx.week_start + SLOTS_PER_DAY - 1,
+        'target_start': target,
+    }
+
+
+def case_get_template(ctx):
+    return 'GET', '/api/availability/template', None
+
+
+def case_put_template(ctx):
+    # Repeat the seeded week from this week on
+    return 'PUT', '/api/availability/template', {'start_slot': ctx.week_start}
+
+
+def case_free_now(ctx):
+    return 'GET', '/api/availability/free-now?slots=4', None
+
+
+def case_create_group(ctx):
+    return 'POST', '/api/groups', {}
+
+
+def case_invite_user(ctx):
+    group = ctx.make_group(ctx.user_id)
+    return 'POST', f'/api/groups/{group.id}/invite', {'user_id': ctx.other_user()}
+
+
+def case_accept_invite(ctx):
+    group, invite = ctx.make_invite(ctx.other_user(), ctx.user_id)
+    return 'POST', f'/api/groups/{group.id}/invites/{invite.id}/accept', None
+
+
+def case_decline_invite(ctx):
+    group, invite = ctx.make_invite(ctx.other_user(), ctx.user_id)
+    return 'POST', f'/api/groups/{group.id}/invites/{invite.id}/decline', None
+
+
+def case_leave_group(ctx):
+    group = ctx.make_group(ctx.other_user(), [ctx.user_id])
+    return 'DELETE', f'/api/groups/{group.id}/leave', None
+
+
+def case_disband_group(ctx):
+    group = ctx.make_group(ctx.user_id)
+    return 'DELETE', f'/api/groups/{group.id}', {'name': group.name}
+
+
+def case_group_schedule_data(ctx):
+    if not hasattr(ctx, 'schedule_group_id'):
+        members = ctx.rng.sample(ctx.seeded['user_ids'][1:], min(4, len(ctx.seeded['user_ids']) - 1))
+        ctx.schedule_group_id = ctx.make_group(ctx.user_id, members).id
+    return 'GET', (f'/api/groups/{ctx.schedule_group_id}/schedule-data'
+                   f'?start_slot={ctx.week_start}&end_slot={ctx.week_end}'), None
+
+
+def case_group_windows(ctx):
+    if not hasattr(ctx, 'schedule_group_id'):
+        case_group_schedule_data(ctx)
+    return 'GET', (f'/api/groups/{ctx.schedule_group_id}/windows'
+                   f'?start_slot={ctx.week_start}&end_slot={ctx.week_end}&min_available=2&min_length=2'), None
+
+
+def case_pending_invitations(ctx):
+    if not hasattr(ctx, 'has_pending_invites'):
+        for _ in range(3):
+            ctx.make_invite(ctx.other_user(), ctx.user_id)
+        ctx.has_pending_invites = True
+    return 'GET', '/api/invitations/pending', None
+
+
+CASES = [
+    ('get_availability', case_get_availability),
+    ('get_my_availability', case_get_my_availability),
+    ('get_timeline', case_get_timeline),
+    ('bulk_update_availability', case_bulk_update_availability),
+    ('get_aggregate', case_get_aggregate),
+    ('get_aggregate_dense', case_get_aggregate_dense),
+    ('find_matches', case_find_matches),
+    ('copy_availability', case_copy_availability),
+    ('free_now', case_free_now),
+    # After the reads above, which a template would change
+    ('put_template', case_put_template),
+    ('get_template', case_get_template),
+    ('create_group', case_create_group),
+    ('invite_user', case_invite_user),
+    ('accept_invite', case_accept_invite),
+    ('decline_invite', case_decline_invite),
+    ('leave_group', case_leave_group),
+    ('disband_group', case_disband_group),
+    ('group_schedule_data', case_group_schedule_data),
+    ('group_windows', case_group_windows),
+    ('pending_invitations', case_pending_invitations),
+]
+
+
+# ============= HARNESS =============
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def send(ctx, method, url, body):
+    return ctx.client.open(url, method=method, json=body)
+
+
+def run_case(ctx, name, case, iterations, warmup):
+    """Time one case; memory is measured in a separate pass so tracing does not skew latency"""
+    for _ in range(warmup):
+        send(ctx, *case(ctx))
+        ctx.iteration += 1
+
+    latencies = []
+    queries = []
+    statuses = {}
+    for _ in range(iterations):
+        request_args = case(ctx)
+        with count_queries(all_threads=True) as counter:
+            start = time.perf_counter()
+            response = send(ctx, *request_args)
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries.append(counter.count)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        ctx.iteration += 1
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(MEMORY_ITERATIONS):
+        request_args = case(ctx)
+        tracemalloc.reset_peak()
+        send(ctx, *request_args)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        ctx.iteration += 1
+    tracemalloc.stop()
+
+    return {
+        'endpoint': name,
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'queries_median': statistics.median(queries),
+        'queries_max': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'status_codes': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def run_scale(scale, args, cases, workdir):
+    """Seed a fresh database with `scale` users and run every case against it"""
+    db_path = os.path.join(workdir, f'benchmark_{scale}.db')
+    app = create_app('testing', skip_schema_check=True, config_overrides={
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
+        'METRICS_ENABLED': False,
+        # Time the writes themselves, not just buffering them
+        'WRITE_BEHIND_MS': 0,
+    })
+
+    with app.app_context():
+        upgrade(log=lambda message: None)
+        seed_start = time.perf_counter()
+        seeded = seed_guild(users=scale, weeks=args.weeks, seed=args.seed)
+        seed_seconds = time.perf_counter() - seed_start
+
+        client = app.test_client()
+        ctx = BenchmarkContext(app, client, seeded, random.Random(args.seed))
+        with client.session_transaction() as session:
+            session['_user_id'] = str(ctx.user_id)
+            session['_fresh'] = True
+
+        results = []
+        for name, case in cases:
+            result = run_case(ctx, name, case, args.iterations, args.warmup)
+            result['scale'] = scale
+            results.append(result)
+            print(f"  {name:<26} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                  f"queries {result['queries_max']:>4}  peak {result['peak_memory_kb']:>8.1f} KB",
+                  file=sys.stderr)
+
+        db.session.remove()
+        db.engine.dispose()
+
+    return {
+        'scale': scale,
+        'slots': seeded['slots'],
+        'seed_seconds': round(seed_seconds, 3),
+        'results': results,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark availability and group APIs at several scales')
+    parser.add_argument('--scales', default='50,200,1000', help='Comma-separated user counts (default: 50,200,1000)')
+    parser.add_argument('--weeks', type=int, default=4, help='Weeks of seeded availability (default: 4)')
+    parser.add_argument('--iterations', type=int, default=20, help='Timed requests per endpoint (default: 20)')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed requests per endpoint (default: 2)')
+    parser.add_argument('--only', help='Comma-separated case names to run')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed (default: 42)')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated SQLite databases')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scales = [int(s) for s in args.scales.split(',') if s.strip()]
+    cases = CASES
+    if args.only:
+        wanted = {name.strip() for name in args.only.split(',')}
+        unknown = wanted - {name for name, _ in CASES}
+        if unknown:
+            print(f"Unknown case(s): {', '.join(sorted(unknown))}", file=sys.stderr)
+            return 1
+        cases = [(name, case) for name, case in CASES if name in wanted]
+
+    workdir = tempfile.mkdtemp(prefix='scheduler-bench-')
+    report = {
+        'generated_at': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'iterations': args.iterations,
+        'weeks': args.weeks,
+        'scales': [],
+    }
+    try:
+        for scale in scales:
+            print(f"Scale: {scale} users", file=sys.stderr)
+            report['scales'].append(run_scale(scale, args, cases, workdir))
+    finally:
+        if args.keep:
+            print(f"Databases kept in {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,29 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+
+def engine_options(database_uri):
+    """SQLAlchemy engine options for the given database URI"""
+    if database_uri.startswith('sqlite'):
+        # Pool sizing and pre-ping don't apply to SQLite; wait on locks instead of failing
+        return {
+            'connect_args': {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000.0}
+        }
+    
+    # PostgreSQL connection pool settings
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '3600')),
+        'pool_pre_ping': True,  # Verify connections before using them
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
+        'connect_args': {
+            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '10'))
+        } if database_uri.startswith('postgresql') else {}
+    }
+
+
 class Config:
     """Base configuration"""
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
@@ -15,17 +38,100 @@ class Config:
         'sqlite:///' + os.path.join(os.path.abspath(os.path.dirname(__file__)), 'instance', 'tbc_scheduler.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
-    # PostgreSQL-specific connection pool settings
-    # These are ignored by SQLite but important for PostgreSQL
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        'pool_size': int(os.environ.get('DB_POOL_SIZE', '10')),
-        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', '3600')),
-        'pool_pre_ping': True,  # Verify connections before using them
-        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '20')),
-        'connect_args': {
-            'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', '10'))
-        } if os.environ.get('DATABASE_URL', '').startswith('postgresql') else {}
+    # Engine options depend on the database: connection pool settings for
+    # PostgreSQL, busy timeout only for SQLite (see engine_options above)
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    
+    # SQLite production profile, applied to every new connection (app/utils/sqlite.py)
+    # WAL lets readers proceed while a write is in progress
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = SQLITE_BUSY_TIMEOUT_MS
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', '20000'))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    
+    # Serialized SQLite writer: availability writes are queued per worker and committed
+    # in small batches under a lock shared by all workers (app/utils/write_queue.py)
+    SQLITE_WRITE_QUEUE = os.environ.get('SQLITE_WRITE_QUEUE', 'True') == 'True'
+    SQLITE_WRITE_BATCH_SIZE = int(os.environ.get('SQLITE_WRITE_BATCH_SIZE', '20'))
+    SQLITE_WRITE_BATCH_WAIT_MS = int(os.environ.get('SQLITE_WRITE_BATCH_WAIT_MS', '10'))
+    SQLITE_WRITE_TIMEOUT = float(os.environ.get('SQLITE_WRITE_TIMEOUT', '30'))
+    
+    # Write-behind: each user's availability saves are staged in the database and applied
+    # this long after their last save (at most WRITE_BEHIND_MAX_MS after the first; 0 = write
+    # every save at once), or at the next poll once WRITE_BEHIND_MAX_SLOTS are staged (app/utils/write_behind.py)
+    WRITE_BEHIND_MS = int(os.environ.get('WRITE_BEHIND_MS', '500'))
+    WRITE_BEHIND_MAX_MS = int(os.environ.get('WRITE_BEHIND_MAX_MS', '3000'))
+    WRITE_BEHIND_MAX_SLOTS = int(os.environ.get('WRITE_BEHIND_MAX_SLOTS', '2000'))
+    
+    # Read replicas: GET requests read from these (comma-separated URLs) and
+    # writes go to SQLALCHEMY_DATABASE_URI (app/utils/replicas.py)
+    REPLICA_DATABASE_URLS = [url.strip() for url in os.environ.get('REPLICA_DATABASE_URLS', '').split(',') if url.strip()]
+    # Skip replicas further behind than this, re-checked every REPLICA_LAG_CHECK_SECONDS
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+    REPLICA_LAG_CHECK_SECONDS = float(os.environ.get('REPLICA_LAG_CHECK_SECONDS', '10'))
+    # Clients read from the primary for this long after a write, so they see their own changes
+    REPLICA_READ_YOUR_WRITES_SECONDS = float(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', '5'))
+    # SQLite: serve GET requests from read-only connections to the same file
+    SQLITE_READ_ONLY_REPLICA = os.environ.get('SQLITE_READ_ONLY_REPLICA', 'False') == 'True'
+    
+    # In-memory NumPy availability matrix for find-matches, filtered heatmaps and
+    # group window searches (app/utils/analytics.py). Requires `pip install numpy`.
+    ANALYTICS_ENGINE = os.environ.get('ANALYTICS_ENGINE', 'False') == 'True'
+    # Weeks held in memory, starting with the current week
+    ANALYTICS_WEEKS = int(os.environ.get('ANALYTICS_WEEKS', '5'))
+    
+    # "Who's free now": per-worker sets of available users for the next few hours
+    # (app/utils/free_now.py), checked against other workers' writes at most this often
+    FREE_NOW_HOURS = int(os.environ.get('FREE_NOW_HOURS', '6'))
+    FREE_NOW_POLL_SECONDS = float(os.environ.get('FREE_NOW_POLL_SECONDS', '1'))
+    
+    # Retention: purge availability older than this many weeks before the current one (0 = keep all)
+    RETENTION_WEEKS = int(os.environ.get('RETENTION_WEEKS', '0'))
+    # Archive: move weeks before the current one minus this many weeks into compressed snapshots (0 = off)
+    ARCHIVE_AFTER_WEEKS = int(os.environ.get('ARCHIVE_AFTER_WEEKS', '0'))
+    RETENTION_CHECK_HOURS = float(os.environ.get('RETENTION_CHECK_HOURS', '6'))
+    # VACUUM SQLite after a purge that freed a quarter of the file (writers wait meanwhile)
+    RETENTION_VACUUM = os.environ.get('RETENTION_VACUUM', 'True') == 'True'
+    
+    # Aggregate audit: every AUDIT_INTERVAL_MINUTES one worker per host compares stored heatmap
+    # and group counts with the live slots for up to AUDIT_TIME_BUDGET_SECONDS and repairs
+    # mismatches, continuing where it stopped (app/utils/auditor.py; 0 = off)
+    AUDIT_INTERVAL_MINUTES = float(os.environ.get('AUDIT_INTERVAL_MINUTES', '60'))
+    AUDIT_TIME_BUDGET_SECONDS = float(os.environ.get('AUDIT_TIME_BUDGET_SECONDS', '10'))
+    
+    # Concurrency classes: requests in flight per host (all workers), how long a request may
+    # wait for a slot before it is shed with 503, and the Retry-After sent when it is. Sized for the
+    # Dockerfile's 4 gunicorn workers: heavy requests never take them all, and a cheap request
+    # waits only briefly since it holds a worker while waiting
+    CONCURRENCY_LIMITS_ENABLED = os.environ.get('CONCURRENCY_LIMITS_ENABLED', 'True') == 'True'
+    CONCURRENCY_CLASSES = {
+        'cheap': {
+            'limit': int(os.environ.get('CONCURRENCY_CHEAP_LIMIT', '4')),
+            'wait': float(os.environ.get('CONCURRENCY_CHEAP_WAIT', '1')),
+            'retry_after': 2,
+        },
+        'heavy': {
+            'limit': int(os.environ.get('CONCURRENCY_HEAVY_LIMIT', '2')),
+            'wait': float(os.environ.get('CONCURRENCY_HEAVY_WAIT', '0.5')),
+            'retry_after': 5,
+        },
     }
+    # Blueprint or endpoint -> class; heavy endpoints are also marked with @concurrency.limit('heavy')
+    CONCURRENCY_ROUTE_CLASSES = {}
+    CONCURRENCY_LOCK_DIR = os.environ.get('CONCURRENCY_LOCK_DIR')  # default: instance/concurrency
+    
+    # Heavy computations run in worker processes (app/utils/compute.py); 0 runs them inline
+    COMPUTE_WORKERS = int(os.environ.get('COMPUTE_WORKERS', '1'))
+    COMPUTE_TIME_BUDGET = float(os.environ.get('COMPUTE_TIME_BUDGET', '30'))  # seconds per job
+    COMPUTE_INLINE_WAIT = float(os.environ.get('COMPUTE_INLINE_WAIT', '2'))  # then answer 202 and poll
+    COMPUTE_QUEUE_LIMIT = int(os.environ.get('COMPUTE_QUEUE_LIMIT', '16'))
+    COMPUTE_RESULT_TTL = float(os.environ.get('COMPUTE_RESULT_TTL', '300'))
+    COMPUTE_JOB_DIR = os.environ.get('COMPUTE_JOB_DIR')  # default: instance/jobs
+    
+    # Apply pending schema migrations at startup instead of refusing to start.
+    # Production runs `python migrate.py` once per deploy instead.
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'False') == 'True'
     
     # Session configuration
     SESSION_COOKIE_HTTPONLY = os.environ.get('SESSION_COOKIE_HTTPONLY', 'True') == 'True'
@@ -37,9 +143,32 @@ class Config:
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
     
-    # Rate limiting
-    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+    # Password hashing
+    # Method string is passed to werkzeug, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'.
+    # Stored hashes made with different parameters are upgraded on the next successful login.
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_SALT_LENGTH = 16
+    # Hashes running at once on the host plus how many callers may wait for a turn before failing fast.
+    # Requests hold a worker while they wait, so they wait far less than command line tools.
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT', '8'))
+    PASSWORD_HASH_REQUEST_TIMEOUT = float(os.environ.get('PASSWORD_HASH_REQUEST_TIMEOUT', '0.25'))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', '5'))
+    
+    # Performance instrumentation (exposed at /admin/metrics and /admin/api/metrics)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '1000'))
+    SLOW_QUERY_MS = int(os.environ.get('SLOW_QUERY_MS', '250'))
+    # Optional bearer token so a Prometheus scraper can read /admin/metrics without a login
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Rate limiting, keyed by user (IP when logged out)
+    # Default storage: a SQLite file in the instance folder shared by all workers
+    RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', os.environ.get('RATELIMIT_STORAGE_URL'))
     RATELIMIT_HEADERS_ENABLED = True
+    # Cost-weighted limits: saves cost one per day of slots, range reads one per week requested
+    RATELIMIT_SLOT_WRITES = os.environ.get('RATELIMIT_SLOT_WRITES', '300 per hour')
+    RATELIMIT_RANGE_READS = os.environ.get('RATELIMIT_RANGE_READS', '2000 per hour')
     
     # WoW TBC Classes
     WOW_CLASSES = [
@@ -61,14 +190,30 @@ class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     SESSION_COOKIE_SECURE = False
+    AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'True') == 'True'
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     SESSION_COOKIE_SECURE = True
 
+class TestingConfig(Config):
+    """Testing and benchmarking configuration"""
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    AUTO_MIGRATE = True
+    WTF_CSRF_ENABLED = False
+    RATELIMIT_ENABLED = False
+    RATELIMIT_STORAGE_URI = 'memory://'
+    CONCURRENCY_LIMITS_ENABLED = False
+    COMPUTE_WORKERS = 0
+    # Cheap hashes so seeded users and login tests stay fast
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
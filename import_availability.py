@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Import users and availability spans from a CSV or JSON-lines file.
+See app/utils/importer.py for the file format.
+
+Usage:
+    python import_availability.py guild.csv --password changeme
+    python import_availability.py guild.jsonl --dry-run
+"""
+import argparse
+import sys
+import time
+from app import create_app, db, password_hasher
+from app.utils.importer import parse_import, load_import
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Bulk import users and availability spans')
+    parser.add_argument('path', help='CSV or JSON-lines file')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='File format (default: from the file extension)')
+    parser.add_argument('--password', help='Password for newly created users (default: none, they cannot log in)')
+    parser.add_argument('--dry-run', action='store_true', help='Validate the file without importing it')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    file_format = args.format or ('jsonl' if args.path.lower().endswith(('.jsonl', '.json', '.ndjson')) else 'csv')
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        with open(args.path, encoding='utf-8-sig', newline='') as f:
+            plan = parse_import(f, file_format, app.config['WOW_CLASSES'], app.config['ROLES'])
+        if plan.errors:
+            print('✗ The file has errors; nothing was imported:')
+            for error in plan.errors:
+                print(f'  {error}')
+            return 1
+        summary = plan.summary()
+        print(f"✓ Validated {summary['records']} records: {summary['users']} users, {summary['spans']} spans")
+        if args.dry_run:
+            return 0
+
+        password_hash = password_hasher.hash(args.password) if args.password else None
+        try:
+            result = load_import(plan, password_hash)
+            db.session.commit()
+        except ValueError as e:
+            db.session.rollback()
+            print(f'✗ {e}')
+            return 1
+        print(f"✓ Imported {result['slots']} slots for {result['users_updated']} users "
+              f"({result['users_created']} new) in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
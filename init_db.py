@@ -13,15 +13,16 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from app import create_app, db
 from app.models.user import User
 from app.models.availability import AvailabilitySlot, AggregateSlotCount
+from app.utils.migrations import upgrade
 
 def init_db():
     """Initialize the database"""
-    app = create_app('development')
+    app = create_app('development', skip_schema_check=True)
     
     with app.app_context():
-        # Create all tables
+        # Create or migrate tables
         print("Creating database tables...")
-        db.create_all()
+        upgrade()
         print("✓ Tables created successfully!")
         
         # Check if any users exist
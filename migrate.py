@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Apply pending database schema migrations.
+Run once per deploy, before starting or restarting the application workers.
+
+Usage:
+    python migrate.py            # apply pending migrations
+    python migrate.py --status   # show current and expected schema version
+"""
+import sys
+from app import create_app, db
+from app.utils.migrations import get_schema_version, head_version, pending_migrations, upgrade
+
+
+def show_status():
+    """Print the recorded schema version and any pending migrations"""
+    with db.engine.connect() as connection:
+        current = get_schema_version(connection)
+    print(f"Schema version: {current} (code expects {head_version()})")
+    for m in pending_migrations(current):
+        print(f"  pending {m.version}: {m.description}")
+    return 0
+
+
+def run_migrations():
+    """Apply pending migrations"""
+    print("=== Database Migration ===\n")
+    try:
+        before, after = upgrade()
+    except Exception as e:
+        print(f"\n✗ Migration failed: {str(e)}")
+        return 1
+
+    if before == after:
+        print(f"✓ Schema is up to date (version {after}). No migration needed.")
+    else:
+        print(f"\n✓ Migrated schema from version {before} to {after}")
+    return 0
+
+
+if __name__ == '__main__':
+    app = create_app(skip_schema_check=True)
+    with app.app_context():
+        if '--status' in sys.argv[1:]:
+            sys.exit(show_status())
+        sys.exit(run_migrations())
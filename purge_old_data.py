@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Purge old availability in small batches, then analyze (and on SQLite vacuum)
+the database. Safe to run while the app is serving requests.
+
+Usage:
+    python purge_old_data.py --weeks 8              # keep 8 weeks before the current one
+    python purge_old_data.py --before 2025-01-06    # everything before a date (UTC)
+    python purge_old_data.py                        # apply RETENTION_WEEKS from the config
+"""
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+from app import create_app
+from app.models.availability import AvailabilitySlot
+from app.utils.retention import PURGE_CHUNK_SIZE, purge_slots, optimize_database
+from app.utils.slots import SLOT_SECONDS, WEEK_SLOTS, current_week_start_slot, slot_of
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Purge old availability and aggregates')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--before', help='Delete everything before this date (YYYY-MM-DD, UTC)')
+    group.add_argument('--weeks', type=int, help='Keep this many weeks before the current week')
+    parser.add_argument('--chunk-size', type=int, default=PURGE_CHUNK_SIZE, help='Rows deleted per transaction')
+    parser.add_argument('--no-vacuum', action='store_true', help='Only ANALYZE afterwards')
+    parser.add_argument('--dry-run', action='store_true', help='Count the rows that would be deleted')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app()
+    with app.app_context():
+        if args.before:
+            try:
+                before = datetime.strptime(args.before, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except ValueError:
+                print('✗ --before must be a date like 2025-01-06')
+                return 1
+            cutoff = slot_of(before.timestamp())
+        else:
+            weeks = args.weeks if args.weeks is not None else app.config.get('RETENTION_WEEKS', 0)
+            if not weeks:
+                print('✗ Pass --before or --weeks, or set RETENTION_WEEKS')
+                return 1
+            cutoff = current_week_start_slot() - weeks * WEEK_SLOTS
+
+        cutoff_date = datetime.fromtimestamp(cutoff * SLOT_SECONDS, timezone.utc).strftime('%Y-%m-%d %H:%M')
+        if args.dry_run:
+            count = AvailabilitySlot.query.filter(AvailabilitySlot.slot_index < cutoff).count()
+            print(f'✓ {count} availability slots before {cutoff_date} UTC would be deleted')
+            return 0
+
+        started = time.perf_counter()
+
+        def progress(info):
+            print(f"  {info['deleted']}/{info['total']} slots deleted", end='\r', flush=True)
+
+        result = purge_slots(None, cutoff - 1, chunk_size=args.chunk_size, progress=progress)
+        print()
+        print(f"✓ Purged {result['availability_deleted']} availability slots and "
+              f"{result['aggregates_deleted']} aggregate counts before {cutoff_date} UTC "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        optimized = optimize_database(vacuum=not args.no_vacuum)
+        print(f"✓ Analyzed{' and vacuumed' if optimized['vacuumed'] else ''} the database"
+              + (f" (free page ratio was {optimized['free_ratio']})" if 'free_ratio' in optimized else ''))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Seed the database with a synthetic guild for local load testing.
+
+Usage:
+    python seed_data.py --users 500 --weeks 4 --seed 42
+"""
+import argparse
+import sys
+from datetime import datetime, timezone
+from app import create_app
+from app.utils.seeding import seed_guild
+from app.utils.slots import slot_of
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate a synthetic guild roster and availability')
+    parser.add_argument('--users', type=int, default=200, help='Number of users to create (default: 200)')
+    parser.add_argument('--weeks', type=int, default=4, help='Weeks of painted availability (default: 4)')
+    parser.add_argument('--groups', type=int, default=None, help='Number of groups (default: users / 10)')
+    parser.add_argument('--invites-per-group', type=int, default=1, help='Invites sent by each group (default: 1)')
+    parser.add_argument('--start-date', help='First painted day as YYYY-MM-DD in UTC (default: this Monday)')
+    parser.add_argument('--password', default='password', help='Password for every generated user')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start_slot = None
+    if args.start_date:
+        start = datetime.strptime(args.start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+        start_slot = slot_of(start.timestamp())
+
+    app = create_app()
+    with app.app_context():
+        print(f"Seeding {args.users} users with {args.weeks} week(s) of availability...")
+        result = seed_guild(
+            users=args.users,
+            weeks=args.weeks,
+            groups=args.groups,
+            invites_per_group=args.invites_per_group,
+            start_slot=start_slot,
+            password=args.password,
+            seed=args.seed,
+            log=lambda message: print(f"✓ {message}")
+        )
+        print(f"\n✓ Seeded slots {result['start_slot']}-{result['end_slot']}")
+        print(f"  Log in as any generated user with password '{args.password}'")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Query budgets: endpoints that used to issue a query per row must issue the same
+number of queries whether the guild has 5, 50 or 500 users.
+"""
+import pytest
+from app import create_app, db
+from app.models.availability import AvailabilitySlot
+from app.models.group import Group, GroupMembership, GroupInvite
+from app.models.user import User
+from app.utils.query_budget import assert_constant_queries
+from app.utils.slots import current_week_start_slot
+
+SCALES = (5, 50, 500)
+WOW_CLASSES = ['Warrior', 'Paladin', 'Hunter', 'Rogue', 'Priest', 'Shaman', 'Mage', 'Warlock', 'Druid']
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing', config_overrides={
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'query_budget.db'),
+        'METRICS_ENABLED': False,
+        'ANALYTICS_ENGINE': False,
+        'WRITE_BEHIND_MS': 0,
+        'AUDIT_INTERVAL_MINUTES': 0,
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+class Guild:
+    """
+    A roster grown to a given size. The first user ("me") leads a full group and,
+    like every later user, is available in the first day of the week. Each user
+    after the first four leads a group that invites me, and is invited to my group.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.week_start = current_week_start_slot()
+        self.user_ids = []
+        self.group_id = None
+        with app.app_context():
+            self.engine = db.engine
+
+    def grow(self, users):
+        with self.app.app_context():
+            new_users = [
+                User(character_name=f'Player{i}', wow_class=WOW_CLASSES[i % len(WOW_CLASSES)],
+                     password_hash='!', roles='["dps"]')
+                for i in range(len(self.user_ids), users)
+            ]
+            db.session.add_all(new_users)
+            db.session.flush()
+            db.session.execute(AvailabilitySlot.__table__.insert(), [
+                {'user_id': user.id, 'slot_index': self.week_start + offset, 'state': 2}
+                for user in new_users for offset in range(48)
+            ])
+            for user in new_users:
+                self.user_ids.append(user.id)
+                me = self.user_ids[0]
+                if self.group_id is None:
+                    group = Group(name='Budget Keepers', leader_id=me)
+                    db.session.add(group)
+                    db.session.flush()
+                    self.group_id = group.id
+                if len(self.user_ids) <= 5:
+                    db.session.add(GroupMembership(group_id=self.group_id, user_id=user.id))
+                    continue
+                group = Group(name=f'Party {user.id}', leader_id=user.id)
+                db.session.add(group)
+                db.session.flush()
+                db.session.add(GroupMembership(group_id=group.id, user_id=user.id))
+                db.session.add(GroupInvite(group_id=group.id, inviter_id=user.id, invitee_id=me))
+                db.session.add(GroupInvite(group_id=self.group_id, inviter_id=me, invitee_id=user.id))
+            db.session.commit()
+
+    def client(self):
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(self.user_ids[0])
+            session['_fresh'] = True
+        return client
+
+
+@pytest.fixture
+def guild(app):
+    guild = Guild(app)
+    guild.grow(1)
+    return guild
+
+
+def test_find_matches_queries_are_constant(guild):
+    client = guild.client()
+
+    def run():
+        response = client.get(
+            f'/api/availability/find-matches?start_slot={guild.week_start}&end_slot={guild.week_start + 335}'
+        )
+        assert response.status_code == 200
+        assert len(response.get_json()['matches']) == len(guild.user_ids) - 1
+
+    assert_constant_queries(guild.grow, run, scales=SCALES, engine=guild.engine)
+
+
+def test_group_to_dict_queries_are_constant(guild):
+    def run():
+        with guild.app.app_context():
+            data = db.session.get(Group, guild.group_id).to_dict()
+        assert data['member_count'] == 5
+
+    assert_constant_queries(guild.grow, run, scales=SCALES, engine=guild.engine)
+
+
+def test_group_detail_queries_are_constant(guild):
+    client = guild.client()
+
+    def run():
+        assert client.get(f'/groups/{guild.group_id}').status_code == 200
+
+    assert_constant_queries(guild.grow, run, scales=SCALES, engine=guild.engine)
+
+
+def test_pending_invitations_queries_are_constant(guild):
+    client = guild.client()
+
+    def run():
+        response = client.get('/api/invitations/pending')
+        assert response.status_code == 200
+        assert response.get_json()['count'] == len(guild.user_ids) - 5
+
+    assert_constant_queries(guild.grow, run, scales=SCALES, engine=guild.engine)